@@ -1,4 +1,6 @@
+import asyncio
 import logging
+from typing import Dict, Optional
 
 from a2a.server.events import EventQueue
 from a2a.server.tasks import TaskUpdater
@@ -9,20 +11,23 @@ from a2a.types import (
     Part,
     TaskState,
     TextPart,
-    UnsupportedOperationError,
 )
 
 from agent import CleverCatAgent
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from a2a.server.agent_execution import AgentExecutor, RequestContext
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+CANCEL_TIMEOUT = 10.0 # 取消时等待任务退出的最长时间(秒)
+
 class CleverCatAgentExecutor(AgentExecutor):
 
     # 1.创建CleverCatAgent
-    def __init__(self):
-        self.agent = CleverCatAgent()
+    def __init__(self, checkpointer: Optional[BaseCheckpointSaver] = None):
+        self.agent = CleverCatAgent(checkpointer=checkpointer)
+        self._running: Dict[str, asyncio.Task] = {} # 正在执行的任务 task_id -> asyncio.Task
 
     async def execute(
         self, context: RequestContext, event_queue: EventQueue
@@ -34,6 +39,8 @@ class CleverCatAgentExecutor(AgentExecutor):
             await event_queue.enqueue_event(task)  # 如果当前没有任务，创建新的任务
 
         updater = TaskUpdater(event_queue, task.id, task.context_id)
+        current = asyncio.current_task()
+        self._running[task.id] = current # 登记正在执行的任务，cancel 时取消它
         # 流式调用
         try:
             async for item in self.agent.stream(query, task.context_id):
@@ -70,12 +77,23 @@ class CleverCatAgentExecutor(AgentExecutor):
                     await updater.complete()
                     break
 
+        except asyncio.CancelledError: # 被 cancel 取消，LangGraph 的 astream 随之停止
+            logger.info(f'任务 {task.id} 已取消')
+            raise
         except Exception as e:
             logger.error(f"在流式调用时出现了错误：{e}")
             raise ServerError(error=InternalError()) from e
+        finally:
+            if self._running.get(task.id) is current:
+                del self._running[task.id]
 
     async def cancel(
         self, context: RequestContext, event_queue: EventQueue
     ) -> None:
-        raise ServerError(error=UnsupportedOperationError())
+        running = self._running.pop(context.task_id, None)
+        if running is not None and not running.done():
+            running.cancel() # 在下一个 await 处抛出 CancelledError，停止智能体
+            await asyncio.wait([running], timeout=CANCEL_TIMEOUT) # 等待任务退出，释放占用的资源
+        updater = TaskUpdater(event_queue, context.task_id, context.context_id)
+        await updater.cancel() # 发布 canceled 状态
 
@@ -0,0 +1,47 @@
+# conftest.py
+import os
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+_own_modules = {} # 本目录已经导入的模块，运行本目录的测试时放回 sys.modules
+
+
+def _is_local_name(name: str) -> bool:
+    return "." not in name and not name.startswith("__") and os.path.isfile(os.path.join(HERE, f"{name}.py"))
+
+
+def _from_here(module) -> bool:
+    path = getattr(module, "__file__", None)
+    return path is not None and os.path.dirname(os.path.abspath(path)) == HERE
+
+
+def use_agent_directory() -> None:
+    """
+    智能体目录作为脚本运行，模块之间按文件名直接导入
+
+    各智能体目录有同名模块(agent.py 等)，导入或运行本目录的测试前把本目录放到 sys.path 最前面，
+    去掉其他目录导入的同名模块，再放回本目录导入过的模块（检查点反序列化时按模块名查找类）
+    """
+    if HERE in sys.path:
+        sys.path.remove(HERE)
+    sys.path.insert(0, HERE)
+    for name, module in list(sys.modules.items()):
+        if _is_local_name(name) and not _from_here(module):
+            del sys.modules[name]
+    sys.modules.update(_own_modules)
+
+
+def pytest_pycollect_makemodule(module_path, parent):
+    use_agent_directory() # 返回 None，仍由 pytest 创建模块
+
+
+def pytest_collectreport(report):
+    _own_modules.update(
+        {name: module for name, module in sys.modules.items() if _is_local_name(name) and _from_here(module)}
+    )
+
+
+def pytest_runtest_setup(item):
+    use_agent_directory()
+
+collect_ignore = ["test_client.py"] # 需要先启动服务器的手动测试脚本
@@ -0,0 +1,61 @@
+# test_admission.py
+import asyncio
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected
+
+
+async def hold(controller: AdmissionController, release: asyncio.Event) -> float:
+    async with controller.admit() as waited:
+        await release.wait()
+    return waited
+
+
+def test_wait_avg_counts_admitted_requests_only():
+    async def scenario() -> dict:
+        controller = AdmissionController(max_in_flight=1, max_queue=1, queue_timeout=0)
+        release = asyncio.Event()
+        first = asyncio.create_task(hold(controller, release))
+        await asyncio.sleep(0)
+        second = asyncio.create_task(hold(controller, release)) # 排队
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected): # 队列已满，不计入排队时间
+            async with controller.admit():
+                pass
+        await asyncio.sleep(0.05)
+        release.set()
+        await asyncio.gather(first, second)
+        return controller.stats()
+
+    stats = asyncio.run(scenario())
+
+    assert stats["admitted"] == 2
+    assert stats["queued_total"] == 1
+    assert stats["rejected_full"] == 1
+    # 两个被接纳的请求中只有一个排了约 50ms
+    assert stats["wait_max_ms"] >= 40
+    assert stats["wait_avg_ms"] == pytest.approx(stats["wait_max_ms"] / 2, abs=0.01)
+
+
+def test_timed_out_wait_is_recorded():
+    async def scenario() -> tuple:
+        controller = AdmissionController(max_in_flight=1, max_queue=4, queue_timeout=0.05)
+        release = asyncio.Event()
+        first = asyncio.create_task(hold(controller, release))
+        await asyncio.sleep(0)
+        with pytest.raises(AdmissionRejected) as rejected:
+            async with controller.admit():
+                pass
+        release.set()
+        await first
+        return rejected.value, controller.stats()
+
+    rejected, stats = asyncio.run(scenario())
+
+    assert rejected.reason == "queue_timeout"
+    assert "0.05 秒" in str(rejected)
+    assert stats["rejected_timeout"] == 1
+    assert stats["timeout_wait_avg_ms"] >= 50
+    assert stats["wait_max_ms"] >= 50
+    assert stats["wait_avg_ms"] == 0.0 # 唯一被接纳的请求没有排队
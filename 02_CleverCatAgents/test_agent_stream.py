@@ -0,0 +1,82 @@
+# test_agent_stream.py
+import asyncio
+from typing import Any, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from agent import CleverCatAgent
+
+MODEL_LATENCY = 0.2 # 假模型每次调用的耗时(秒)
+NUM_REQUESTS = 5 # 并发请求数
+
+
+class SlowFakeChatModel(BaseChatModel):
+    """代替 deepseek-chat：异步等待一段时间后直接给出结构化回答，并记录同时在执行的调用数"""
+
+    in_flight: int = 0
+    max_in_flight: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "slow-fake"
+
+    def bind_tools(self, tools: Any, **kwargs: Any) -> "SlowFakeChatModel":
+        return self
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, **kwargs: Any) -> ChatResult:
+        raise AssertionError("stream 应该调用异步接口")
+
+    async def _agenerate(
+        self,
+        messages: List[BaseMessage],
+        stop: Optional[List[str]] = None,
+        run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+        **kwargs: Any,
+    ) -> ChatResult:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(MODEL_LATENCY) # 模拟网络请求，不阻塞事件循环
+        finally:
+            self.in_flight -= 1
+        message = AIMessage(
+            content="",
+            tool_calls=[{
+                "name": "ResponseFormat",
+                "args": {"status": "completed", "message": "解密结果: hello"},
+                "id": f"call_{len(messages)}",
+            }],
+        )
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+
+async def collect(agent: CleverCatAgent, context_id: str) -> List[dict]:
+    return [item async for item in agent.stream('帮我把"CBMeEHwsKzctOTs="这串字符串解密', context_id)]
+
+
+def test_single_stream_returns_structured_response():
+    agent = CleverCatAgent(llm=SlowFakeChatModel())
+
+    items = asyncio.run(collect(agent, "ctx-0"))
+
+    assert items[-1] == {
+        'is_task_complete': True,
+        'require_user_input': False,
+        'content': '解密结果: hello',
+    }
+
+
+def test_concurrent_streams_overlap():
+    llm = SlowFakeChatModel()
+    agent = CleverCatAgent(llm=llm)
+
+    async def run_all() -> List[List[dict]]:
+        return await asyncio.gather(*(collect(agent, f"ctx-{i}") for i in range(NUM_REQUESTS)))
+
+    results = asyncio.run(run_all())
+
+    assert llm.max_in_flight == NUM_REQUESTS # 模型调用同时进行，没有被事件循环串行化
+    assert all(items[-1]['is_task_complete'] for items in results)
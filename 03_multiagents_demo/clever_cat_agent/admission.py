@@ -0,0 +1,175 @@
+# admission.py
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict
+
+from a2a.server.agent_execution import AgentExecutor, RequestContext
+from a2a.server.events import EventQueue
+from a2a.types import InternalError
+from a2a.utils.errors import ServerError
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+
+class AdmissionRejected(Exception):
+    """服务器繁忙，请求没有被接纳"""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason # queue_full | queue_timeout
+
+
+class AdmissionController:
+    """
+    准入控制：限制同时执行的请求数
+
+    - 最多 max_in_flight 个请求同时执行，其余请求按到达顺序排队
+    - 排队的请求最多 max_queue 个，队列满时新请求立即被拒绝
+    - 排队超过 queue_timeout 秒仍未轮到的请求被拒绝
+    """
+
+    def __init__(self, max_in_flight: int = 8, max_queue: int = 32, queue_timeout: float = 30.0):
+        """
+        Args:
+            max_in_flight: 最多同时执行的请求数，小于等于 0 表示不限制
+            max_queue: 最多排队的请求数，为 0 时执行槽位占满后直接拒绝
+            queue_timeout: 排队的最长时间（秒），小于等于 0 表示一直等待
+        """
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._slots = asyncio.Semaphore(max_in_flight) if max_in_flight > 0 else None
+        self._in_flight = 0 # 正在执行的请求数
+        self._queued = 0 # 正在排队的请求数
+        self._counters = {
+            "admitted": 0, # 被接纳的请求数
+            "queued_total": 0, # 需要排队的请求数
+            "rejected_full": 0, # 队列已满被拒绝
+            "rejected_timeout": 0, # 排队超时被拒绝
+            "wait_total": 0.0, # 被接纳的请求累计排队时间（秒）
+            "wait_max": 0.0, # 最长排队时间（秒），包括超时被拒绝的请求
+            "timeout_wait_total": 0.0, # 超时被拒绝的请求累计排队时间（秒）
+        }
+
+    @asynccontextmanager
+    async def admit(self) -> AsyncIterator[float]:
+        """
+        占用一个执行槽位，返回排队时间（秒），被拒绝时抛出 AdmissionRejected
+
+        用法:
+            async with controller.admit() as waited:
+                ...
+        """
+        waited = await self._acquire()
+        self._in_flight += 1
+        try:
+            yield waited
+        finally:
+            self._in_flight -= 1
+            if self._slots is not None:
+                self._slots.release() # 取消或出错时同样释放槽位
+
+    async def _acquire(self) -> float:
+        if self._slots is None:
+            self._counters["admitted"] += 1
+            return 0.0
+        if not self._slots.locked(): # 有空闲槽位，不用排队
+            await self._slots.acquire()
+            self._counters["admitted"] += 1
+            return 0.0
+        if self._queued >= self.max_queue:
+            self._counters["rejected_full"] += 1
+            raise AdmissionRejected(
+                "queue_full",
+                f"服务器繁忙: {self._in_flight} 个请求正在执行，{self._queued} 个请求正在排队，请稍后重试",
+            )
+
+        self._queued += 1
+        self._counters["queued_total"] += 1
+        start = time.perf_counter()
+        try:
+            if self.queue_timeout > 0:
+                await asyncio.wait_for(self._slots.acquire(), timeout=self.queue_timeout)
+            else:
+                await self._slots.acquire()
+        except asyncio.TimeoutError:
+            waited = time.perf_counter() - start
+            self._counters["rejected_timeout"] += 1
+            self._counters["timeout_wait_total"] += waited
+            self._counters["wait_max"] = max(self._counters["wait_max"], waited)
+            raise AdmissionRejected(
+                "queue_timeout", f"服务器繁忙: 排队超过 {self.queue_timeout:g} 秒，请稍后重试"
+            ) from None
+        finally:
+            self._queued -= 1
+        waited = time.perf_counter() - start
+        self._counters["admitted"] += 1
+        self._counters["wait_total"] += waited
+        self._counters["wait_max"] = max(self._counters["wait_max"], waited)
+        return waited
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        执行数、队列深度、拒绝数和排队耗时(毫秒)
+
+        wait_avg_ms 是被接纳请求的平均排队时间（不用排队的记为 0），
+        timeout_wait_avg_ms 是超时被拒绝请求的平均排队时间
+        """
+        admitted = self._counters["admitted"]
+        rejected_timeout = self._counters["rejected_timeout"]
+        return {
+            "in_flight": self._in_flight,
+            "queue_depth": self._queued,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "admitted": admitted,
+            "queued_total": self._counters["queued_total"],
+            "rejected_full": self._counters["rejected_full"],
+            "rejected_timeout": rejected_timeout,
+            "wait_avg_ms": round(self._counters["wait_total"] * 1000 / admitted, 2) if admitted else 0.0,
+            "wait_max_ms": round(self._counters["wait_max"] * 1000, 2),
+            "timeout_wait_avg_ms": (
+                round(self._counters["timeout_wait_total"] * 1000 / rejected_timeout, 2) if rejected_timeout else 0.0
+            ),
+        }
+
+
+class AdmissionControlledExecutor(AgentExecutor):
+    """在 AgentExecutor.execute 外面加一层准入控制，被拒绝的请求返回 A2A 错误"""
+
+    def __init__(self, executor: AgentExecutor, controller: AdmissionController):
+        self.executor = executor
+        self.controller = controller
+
+    async def execute(self, context: RequestContext, event_queue: EventQueue) -> None:
+        try:
+            async with self.controller.admit() as waited:
+                if waited > 0:
+                    logger.info(f'任务 {context.task_id} 排队 {waited * 1000:.1f}ms 后开始执行')
+                await self.executor.execute(context, event_queue)
+        except AdmissionRejected as e:
+            logger.warning(f'拒绝任务 {context.task_id}: {e}, 准入统计: {self.controller.stats()}')
+            raise ServerError(
+                error=InternalError(
+                    message=str(e),
+                    data={"reason": e.reason, **self.controller.stats()},
+                )
+            ) from e
+
+    async def cancel(self, context: RequestContext, event_queue: EventQueue) -> None:
+        # 还在排队的任务由请求处理器取消，等待被取消时不占用槽位
+        await self.executor.cancel(context, event_queue)
+
+
+def add_stats_route(app: Starlette, controller: AdmissionController, path: str = '/admission/stats') -> None:
+    """添加查看准入统计的 GET 接口"""
+
+    async def stats(request: Request) -> JSONResponse:
+        return JSONResponse(controller.stats())
+
+    app.add_route(path, stats, methods=['GET'])
@@ -8,9 +8,10 @@ from langchain.tools import tool
 from langchain_core.runnables import RunnableConfig
 from pydantic import BaseModel
 from langchain_core.messages import AIMessage, ToolMessage
-from typing import Literal, Any
+from typing import Literal, Any, Optional
 from langchain_openai import ChatOpenAI
 from langchain.agents.middleware import SummarizationMiddleware
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.checkpoint.memory import InMemorySaver
 
 @tool
@@ -81,7 +82,7 @@ class CleverCatAgent:
     """
 
     # 1.配置智能体
-    def __init__(self):
+    def __init__(self, checkpointer: Optional[BaseCheckpointSaver] = None):
         llm = ChatOpenAI(
             model='deepseek-chat',
             temperature=0.8,
@@ -97,15 +98,15 @@ class CleverCatAgent:
                 max_tokens_before_summary=4000,  # Trigger summarization at 4000 tokens
                 messages_to_keep=20,  # Keep last 20 messages after summary
             )],
-            checkpointer=InMemorySaver(),
+            checkpointer=checkpointer if checkpointer is not None else InMemorySaver(),
             response_format=ToolStrategy(ResponseFormat)
         )
 
     # 2. 定义信息处理方法
     async def stream(self, query, context_id) -> AsyncIterable[dict[str, Any]]:
         config : RunnableConfig = {'configurable' : {"thread_id" : context_id}}
-        # 2.1 流式调用
-        for chunk in self.agent.stream(
+        # 2.1 异步流式调用，不阻塞事件循环，并发请求可以同时处理
+        async for chunk in self.agent.astream(
                 input={"messages": [{"role": "user", "content": query}]},
                 config=config,
                 stream_mode="values",
@@ -0,0 +1,199 @@
+# checkpointer.py
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+from typing import Any, AsyncIterator, Optional, Sequence
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.base import (
+    BaseCheckpointSaver,
+    ChannelVersions,
+    Checkpoint,
+    CheckpointMetadata,
+    CheckpointTuple,
+)
+from langgraph.checkpoint.memory import InMemorySaver
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINTER_BACKENDS = ('memory', 'sqlite') # 可选的 checkpointer 后端
+
+
+class CompactingSqliteSaver(SqliteSaver):
+    """
+    带压缩和过期清理的本地 SQLite checkpointer
+
+    - 每个线程(thread_id)只保留最近 max_checkpoints_per_thread 个 checkpoint，旧的连同写入记录一起删除
+    - 超过 ttl 秒没有新 checkpoint 的线程整体删除
+    - 同步接口由 SqliteSaver 实现，异步接口放到线程中执行同步接口，
+      智能体在事件循环里调用同步的 get_state 也不会报错（AsyncSqliteSaver 不允许这样调用）
+    """
+
+    def __init__(
+        self,
+        path: str,
+        max_checkpoints_per_thread: int = 20,
+        ttl: float = 7 * 24 * 3600.0,
+        purge_interval: float = 600.0,
+    ):
+        """
+        Args:
+            path: 数据库文件路径
+            max_checkpoints_per_thread: 每个线程保留的 checkpoint 数，小于等于 0 表示不限制
+            ttl: 线程的有效期（秒），从最近一次写入 checkpoint 开始计算，小于等于 0 表示永不过期
+            purge_interval: 清理过期线程的最小间隔（秒）
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        conn = sqlite3.connect(path, check_same_thread=False) # SqliteSaver 内部用锁串行化访问
+        conn.execute('PRAGMA journal_mode=WAL')
+        super().__init__(conn)
+        self.max_checkpoints_per_thread = max_checkpoints_per_thread
+        self.ttl = ttl
+        self.purge_interval = purge_interval
+        self._last_purge = 0.0
+
+    def setup(self) -> None:
+        if self.is_setup:
+            return
+        super().setup()
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS thread_activity (thread_id TEXT PRIMARY KEY, updated_at REAL NOT NULL)'
+        )
+        self.conn.commit()
+
+    def _is_expired(self, thread_id: str) -> bool:
+        if self.ttl <= 0:
+            return False
+        with self.cursor(transaction=False) as cur:
+            cur.execute('SELECT updated_at FROM thread_activity WHERE thread_id = ?', (thread_id,))
+            row = cur.fetchone()
+        return row is not None and row[0] + self.ttl <= time.time()
+
+    def _delete_threads(self, thread_ids: Sequence[str]) -> None:
+        for thread_id in thread_ids:
+            self.delete_thread(thread_id)
+        with self.cursor() as cur:
+            cur.executemany('DELETE FROM thread_activity WHERE thread_id = ?', [(t,) for t in thread_ids])
+
+    def purge_expired(self) -> int:
+        """删除过期线程并回收 WAL 空间，返回删除的线程数"""
+        self._last_purge = time.monotonic()
+        if self.ttl <= 0:
+            return 0
+        with self.cursor(transaction=False) as cur:
+            cur.execute('SELECT thread_id FROM thread_activity WHERE updated_at <= ?', (time.time() - self.ttl,))
+            expired = [row[0] for row in cur.fetchall()]
+        if expired:
+            self._delete_threads(expired)
+            with self.cursor(transaction=False) as cur:
+                cur.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+            logger.info(f'已清理 {len(expired)} 个过期线程的 checkpoint')
+        return len(expired)
+
+    def _compact(self, thread_id: str, checkpoint_ns: str) -> None:
+        """只保留线程最近的若干个 checkpoint"""
+        if self.max_checkpoints_per_thread <= 0:
+            return
+        with self.cursor() as cur:
+            cur.execute(
+                'DELETE FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN ('
+                'SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? '
+                'ORDER BY checkpoint_id DESC LIMIT ?)',
+                (thread_id, checkpoint_ns, thread_id, checkpoint_ns, self.max_checkpoints_per_thread),
+            )
+            if cur.rowcount:
+                cur.execute(
+                    'DELETE FROM writes WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id NOT IN ('
+                    'SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ?)',
+                    (thread_id, checkpoint_ns, thread_id, checkpoint_ns),
+                )
+
+    def get_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        thread_id = str(config['configurable']['thread_id'])
+        if self._is_expired(thread_id): # 过期的会话从头开始
+            self._delete_threads([thread_id])
+            return None
+        return super().get_tuple(config)
+
+    def put(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        next_config = super().put(config, checkpoint, metadata, new_versions)
+        thread_id = str(config['configurable']['thread_id'])
+        with self.cursor() as cur:
+            cur.execute(
+                'INSERT OR REPLACE INTO thread_activity (thread_id, updated_at) VALUES (?, ?)',
+                (thread_id, time.time()),
+            )
+        self._compact(thread_id, config['configurable'].get('checkpoint_ns', ''))
+        if time.monotonic() - self._last_purge >= self.purge_interval:
+            self.purge_expired()
+        return next_config
+
+    # ---------- 异步接口 ----------
+    async def aget_tuple(self, config: RunnableConfig) -> Optional[CheckpointTuple]:
+        return await asyncio.to_thread(self.get_tuple, config)
+
+    async def alist(
+        self,
+        config: Optional[RunnableConfig],
+        *,
+        filter: Optional[dict[str, Any]] = None,
+        before: Optional[RunnableConfig] = None,
+        limit: Optional[int] = None,
+    ) -> AsyncIterator[CheckpointTuple]:
+        items = await asyncio.to_thread(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(
+        self,
+        config: RunnableConfig,
+        checkpoint: Checkpoint,
+        metadata: CheckpointMetadata,
+        new_versions: ChannelVersions,
+    ) -> RunnableConfig:
+        return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(
+        self,
+        config: RunnableConfig,
+        writes: Sequence[tuple[str, Any]],
+        task_id: str,
+        task_path: str = '',
+    ) -> None:
+        await asyncio.to_thread(self.put_writes, config, writes, task_id, task_path)
+
+    async def adelete_thread(self, thread_id: str) -> None:
+        await asyncio.to_thread(self._delete_threads, [str(thread_id)])
+
+
+def build_checkpointer(
+    backend: str = 'memory',
+    path: str = 'checkpoints.sqlite',
+    max_checkpoints_per_thread: int = 20,
+    ttl: float = 7 * 24 * 3600.0,
+) -> BaseCheckpointSaver:
+    """
+    按配置创建 checkpointer
+
+    Args:
+        backend: 'memory'（进程内，重启即丢失）| 'sqlite'（本地 SQLite，带压缩和过期清理）
+        path: SQLite 数据库文件路径
+        max_checkpoints_per_thread: 每个线程保留的 checkpoint 数
+        ttl: 线程的有效期（秒）
+    """
+    if backend == 'memory':
+        return InMemorySaver()
+    if backend == 'sqlite':
+        return CompactingSqliteSaver(path, max_checkpoints_per_thread=max_checkpoints_per_thread, ttl=ttl)
+    raise ValueError(f'不支持的 checkpointer 后端: {backend}, 可选: {CHECKPOINTER_BACKENDS}')
@@ -1,3 +1,5 @@
+import os
+
 import uvicorn
 
 from a2a.server.apps import A2AStarletteApplication
@@ -14,10 +16,22 @@ from dotenv import load_dotenv
 
 from agent import FileAgent
 from agent_executor import FileAgentExecutor
+from checkpointer import build_checkpointer
+from admission import AdmissionController, AdmissionControlledExecutor, add_stats_route
 
 load_dotenv()
 
-def main(host="localhost", port=10001):
+def main(
+    host="localhost",
+    port=10001,
+    checkpointer_backend: str = os.getenv('CHECKPOINTER', 'memory'), # 对话历史的 checkpointer 后端: memory | sqlite
+    checkpoint_db: str = os.getenv('CHECKPOINT_DB', 'checkpoints.sqlite'), # SQLite checkpointer 的数据库文件
+    checkpoint_ttl: float = 7 * 24 * 3600.0, # 会话线程的有效期(秒)
+    max_checkpoints: int = 20, # 每个会话线程保留的 checkpoint 数
+    max_in_flight: int = int(os.getenv('MAX_IN_FLIGHT', '8')), # 最多同时执行的请求数，0 表示不限制
+    max_queue: int = int(os.getenv('MAX_QUEUE', '32')), # 最多排队的请求数，队列满时立即拒绝
+    queue_timeout: float = float(os.getenv('QUEUE_TIMEOUT', '30')), # 排队的最长时间(秒)
+):
     """启动CleverAgent Server"""
     # 1. 定义AgentSkill
     change_file_skill = AgentSkill(
@@ -42,8 +56,15 @@ def main(host="localhost", port=10001):
     )
 
     # 3. 配置服务器
+    checkpointer = build_checkpointer(
+        checkpointer_backend,
+        path=checkpoint_db,
+        max_checkpoints_per_thread=max_checkpoints,
+        ttl=checkpoint_ttl,
+    )
+    admission = AdmissionController(max_in_flight, max_queue, queue_timeout) # 准入控制
     request_handler = DefaultRequestHandler(
-        agent_executor=FileAgentExecutor(),
+        agent_executor=AdmissionControlledExecutor(FileAgentExecutor(checkpointer=checkpointer), admission),
         task_store=InMemoryTaskStore(),
     )
     server = A2AStarletteApplication(
@@ -51,7 +72,9 @@ def main(host="localhost", port=10001):
     )
 
     # 4. 启动服务器
-    uvicorn.run(server.build(), host=host, port=port)
+    app = server.build()
+    add_stats_route(app, admission) # GET /admission/stats 查看队列深度和排队时间
+    uvicorn.run(app, host=host, port=port)
 
 if __name__ == '__main__':
     main()
@@ -7,9 +7,10 @@ from langchain.agents.structured_output import ToolStrategy
 from langchain_core.runnables import RunnableConfig
 from pydantic import BaseModel
 from langchain_core.messages import AIMessage, ToolMessage
-from typing import Literal, Any
+from typing import Literal, Any, Optional
 from langchain_openai import ChatOpenAI
 from langchain.agents.middleware import SummarizationMiddleware
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.checkpoint.memory import InMemorySaver
 
 # 2.2 配置MCP客户端
@@ -54,7 +55,7 @@ class FileAgent:
     """
 
     # 1.配置智能体
-    def __init__(self):
+    def __init__(self, checkpointer: Optional[BaseCheckpointSaver] = None):
         llm = ChatOpenAI(
             model='deepseek-chat',
             temperature=0.8,
@@ -77,7 +78,7 @@ class FileAgent:
                 max_tokens_before_summary=4000,
                 messages_to_keep=20,
             )],
-            checkpointer=InMemorySaver(),
+            checkpointer=checkpointer if checkpointer is not None else InMemorySaver(),
             response_format=ToolStrategy(ResponseFormat)
         )
 
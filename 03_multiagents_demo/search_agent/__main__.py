@@ -24,6 +24,7 @@ from agent_executor import (
 from agent import (
     create_search_agent,
 )
+from admission import AdmissionController, AdmissionControlledExecutor, add_stats_route
 
 
 load_dotenv()
@@ -34,7 +35,13 @@ DEFAULT_HOST = 'localhost'
 DEFAULT_PORT = 10002
 
 
-def main(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+def main(
+    host: str = DEFAULT_HOST,
+    port: int = DEFAULT_PORT,
+    max_in_flight: int = int(os.getenv('MAX_IN_FLIGHT', '8')), # 最多同时执行的请求数，0 表示不限制
+    max_queue: int = int(os.getenv('MAX_QUEUE', '32')), # 最多排队的请求数，队列满时立即拒绝
+    queue_timeout: float = float(os.getenv('QUEUE_TIMEOUT', '30')), # 排队的最长时间(秒)
+):
 
     skill = AgentSkill(
         id='search_manager',
@@ -63,7 +70,8 @@ def main(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
         session_service=InMemorySessionService(),
         memory_service=InMemoryMemoryService(),
     )
-    agent_executor = SearchAgentExecutor(runner,agent_card)
+    admission = AdmissionController(max_in_flight, max_queue, queue_timeout) # 准入控制
+    agent_executor = AdmissionControlledExecutor(SearchAgentExecutor(runner,agent_card), admission)
 
     request_handler = DefaultRequestHandler(
         agent_executor=agent_executor,
@@ -74,7 +82,9 @@ def main(host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
         agent_card=agent_card, http_handler=request_handler
     )
 
-    uvicorn.run(server.build(), host=host, port=port)
+    app = server.build()
+    add_stats_route(app, admission) # GET /admission/stats 查看队列深度和排队时间
+    uvicorn.run(app, host=host, port=port)
 
 if __name__ == '__main__':
     main()
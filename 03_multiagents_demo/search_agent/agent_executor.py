@@ -1,6 +1,7 @@
+import asyncio
 import logging
 
-from typing import  AsyncGenerator
+from typing import  AsyncGenerator, Dict
 
 from a2a.server.agent_execution import AgentExecutor
 from a2a.server.agent_execution.context import RequestContext
@@ -14,7 +15,6 @@ from a2a.types import (
     Part,
     TaskState,
     TextPart,
-    UnsupportedOperationError,
 )
 from a2a.utils.errors import ServerError
 from google.adk import Runner
@@ -26,6 +26,7 @@ logger = logging.getLogger(__name__)
 logger.setLevel(logging.DEBUG)
 
 DEFAULT_USER_ID = 'self'
+CANCEL_TIMEOUT = 10.0 # 取消时等待任务退出的最长时间(秒)
 
 # Executor继承类
 class SearchAgentExecutor(AgentExecutor):
@@ -33,6 +34,7 @@ class SearchAgentExecutor(AgentExecutor):
     def __init__(self, runner: Runner, card: AgentCard):
         self.runner = runner
         self._card = card
+        self._running: Dict[str, asyncio.Task] = {} # 正在执行的任务 task_id -> asyncio.Task
 
     async def _process_request(
             self,
@@ -45,43 +47,47 @@ class SearchAgentExecutor(AgentExecutor):
         session_id = session_obj.id
 
         # 2. 运行智能体，处理请求
-        async for event in self.runner.run_async(
-                session_id=session_id,
-                user_id=DEFAULT_USER_ID,
-                new_message=new_message,
-        ):
-            # 2.1 请求结束
-            if event.is_final_response():
-                parts = [
-                    convert_genai_part_to_a2a(part)
-                    for part in event.content.parts
-                    if (part.text or part.file_data or part.inline_data)
-                ]
-                logger.debug('Yielding final response: %s', parts)
-                await task_updater.add_artifact(parts)
-                await task_updater.update_status( # 更新任务状态：结束
-                    TaskState.completed, final=True
-                )
-                break
-            # 2.2 回应事件
-            if not event.get_function_calls():
-                logger.debug('Yielding update response')
-                await task_updater.update_status( # 更新任务状态:工作中
-                    TaskState.working,
-                    message=task_updater.new_agent_message(
-                        [
-                            convert_genai_part_to_a2a(part)
-                            for part in event.content.parts
-                            if (
-                                part.text
-                                or part.file_data
-                                or part.inline_data
-                        )
-                        ],
-                    ),
-                )
-            else:
-                logger.debug('Skipping event')
+        events = self.runner.run_async(
+            session_id=session_id,
+            user_id=DEFAULT_USER_ID,
+            new_message=new_message,
+        )
+        try:
+            async for event in events:
+                # 2.1 请求结束
+                if event.is_final_response():
+                    parts = [
+                        convert_genai_part_to_a2a(part)
+                        for part in event.content.parts
+                        if (part.text or part.file_data or part.inline_data)
+                    ]
+                    logger.debug('Yielding final response: %s', parts)
+                    await task_updater.add_artifact(parts)
+                    await task_updater.update_status( # 更新任务状态：结束
+                        TaskState.completed, final=True
+                    )
+                    break
+                # 2.2 回应事件
+                if not event.get_function_calls():
+                    logger.debug('Yielding update response')
+                    await task_updater.update_status( # 更新任务状态:工作中
+                        TaskState.working,
+                        message=task_updater.new_agent_message(
+                            [
+                                convert_genai_part_to_a2a(part)
+                                for part in event.content.parts
+                                if (
+                                    part.text
+                                    or part.file_data
+                                    or part.inline_data
+                            )
+                            ],
+                        ),
+                    )
+                else:
+                    logger.debug('Skipping event')
+        finally:
+            await events.aclose() # 被取消或提前结束时关闭 runner，停止后续的模型和工具调用
 
     # 核心方法，连接服务器时首先执行这个方法
     async def execute(
@@ -97,22 +103,36 @@ class SearchAgentExecutor(AgentExecutor):
             await updater.update_status(TaskState.submitted)
         await updater.update_status(TaskState.working)  # 任务状态：工作
         # 3. 处理请求
-        await self._process_request(
-            types.UserContent(
-                parts=[
-                    convert_a2a_part_to_genai(part)
-                    for part in context.message.parts
-                ],
-            ),
-            context.context_id,
-            updater,
-        )
+        current = asyncio.current_task()
+        self._running[context.task_id] = current # 登记正在执行的任务，cancel 时取消它
+        try:
+            await self._process_request(
+                types.UserContent(
+                    parts=[
+                        convert_a2a_part_to_genai(part)
+                        for part in context.message.parts
+                    ],
+                ),
+                context.context_id,
+                updater,
+            )
+        except asyncio.CancelledError:
+            logger.info('任务 %s 已取消', context.task_id)
+            raise
+        finally:
+            if self._running.get(context.task_id) is current:
+                del self._running[context.task_id]
         logger.debug('execute exiting')
 
     async def cancel(
             self, context: RequestContext, event_queue: EventQueue
     ) -> None:
-        raise ServerError(error=UnsupportedOperationError())
+        running = self._running.pop(context.task_id, None)
+        if running is not None and not running.done():
+            running.cancel() # 在下一个 await 处抛出 CancelledError，停止 runner
+            await asyncio.wait([running], timeout=CANCEL_TIMEOUT) # 等待任务退出，释放占用的资源
+        updater = TaskUpdater(event_queue, context.task_id, context.context_id)
+        await updater.cancel() # 发布 canceled 状态
 
     async def _upsert_session(self, session_id: str) -> Session:
         """检索或者创建一个会话
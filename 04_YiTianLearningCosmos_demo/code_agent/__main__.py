@@ -15,13 +15,22 @@ from dotenv import load_dotenv
 
 from agent import CodeAgent
 from agent_executor import CodeAgentExecutor
+from checkpointer import CHECKPOINTER_BACKENDS, build_checkpointer
+from admission import AdmissionController, AdmissionControlledExecutor, add_stats_route
 
 load_dotenv()
 
 @click.command() # 创建命令行接口
 @click.option('--host', 'host', default='localhost') # 主机
 @click.option('--port', 'port', default=10002) # 端口
-def main(host, port):
+@click.option('--checkpointer', 'checkpointer_backend', type=click.Choice(CHECKPOINTER_BACKENDS), default='memory', envvar='CHECKPOINTER') # 对话历史的 checkpointer 后端
+@click.option('--checkpoint-db', 'checkpoint_db', default='checkpoints.sqlite', envvar='CHECKPOINT_DB') # SQLite checkpointer 的数据库文件
+@click.option('--checkpoint-ttl', 'checkpoint_ttl', type=float, default=7 * 24 * 3600.0) # 会话线程的有效期(秒)
+@click.option('--max-checkpoints', 'max_checkpoints', type=int, default=20) # 每个会话线程保留的 checkpoint 数
+@click.option('--max-in-flight', 'max_in_flight', type=int, default=8, envvar='MAX_IN_FLIGHT') # 最多同时执行的请求数，0 表示不限制
+@click.option('--max-queue', 'max_queue', type=int, default=32, envvar='MAX_QUEUE') # 最多排队的请求数，队列满时立即拒绝
+@click.option('--queue-timeout', 'queue_timeout', type=float, default=30.0, envvar='QUEUE_TIMEOUT') # 排队的最长时间(秒)
+def main(host, port, checkpointer_backend, checkpoint_db, checkpoint_ttl, max_checkpoints, max_in_flight, max_queue, queue_timeout):
     """启动CleverAgent Server"""
     # 1. 定义AgentSkill
     change_file_skill = AgentSkill(
@@ -44,8 +53,15 @@ def main(host, port):
     )
 
     # 3. 配置服务器
+    checkpointer = build_checkpointer(
+        checkpointer_backend,
+        path=checkpoint_db,
+        max_checkpoints_per_thread=max_checkpoints,
+        ttl=checkpoint_ttl,
+    )
+    admission = AdmissionController(max_in_flight, max_queue, queue_timeout) # 准入控制
     request_handler = DefaultRequestHandler(
-        agent_executor=CodeAgentExecutor(),
+        agent_executor=AdmissionControlledExecutor(CodeAgentExecutor(checkpointer=checkpointer), admission),
         task_store=InMemoryTaskStore(),
     )
     server = A2AStarletteApplication(
@@ -53,7 +69,9 @@ def main(host, port):
     )
 
     # 4. 启动服务器
-    uvicorn.run(server.build(), host=host, port=port)
+    app = server.build()
+    add_stats_route(app, admission) # GET /admission/stats 查看队列深度和排队时间
+    uvicorn.run(app, host=host, port=port)
 
 if __name__ == '__main__':
     main()
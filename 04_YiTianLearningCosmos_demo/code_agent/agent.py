@@ -8,9 +8,10 @@ from langchain.agents.structured_output import ToolStrategy
 from langchain_core.runnables import RunnableConfig
 from pydantic import BaseModel
 from langchain_core.messages import AIMessage, ToolMessage
-from typing import Literal, Any
+from typing import Literal, Any, Optional
 from langchain_openai import ChatOpenAI
 from langchain.agents.middleware import SummarizationMiddleware
+from langgraph.checkpoint.base import BaseCheckpointSaver
 from langgraph.checkpoint.memory import InMemorySaver
 
 dotenv.load_dotenv()
@@ -52,7 +53,7 @@ def square_evens(lst):
     """
 
     # 1.配置智能体
-    def __init__(self, use_minimind=False):
+    def __init__(self, use_minimind=False, checkpointer: Optional[BaseCheckpointSaver] = None):
         if use_minimind:
             llm = ChatOpenAI(
                 model='minimind',
@@ -75,7 +76,7 @@ def square_evens(lst):
                 max_tokens_before_summary=4000,
                 messages_to_keep=20,
             )],
-            checkpointer=InMemorySaver(),
+            checkpointer=checkpointer if checkpointer is not None else InMemorySaver(),
             response_format=ToolStrategy(ResponseFormat)
         )
 
@@ -1,21 +1,39 @@
 # rag_query_engine.py
+import asyncio
+import functools
 import logging
 import os
 import sys
+import threading
+import time
 import torch
-from typing import List, Iterator, Tuple, Union
-from llama_index.core import Settings, StorageContext, load_index_from_storage, PromptTemplate
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, List, Iterator, Optional, Tuple, TypeVar, Union
+from llama_index.core import Settings, StorageContext, load_index_from_storage, PromptTemplate, QueryBundle, VectorStoreIndex
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.base.embeddings.base import BaseEmbedding
 from llama_index.core.indices.query.query_transform.base import HyDEQueryTransform
 from llama_index.core.query_engine import TransformQueryEngine
 from llama_index.embeddings.huggingface import HuggingFaceEmbedding
 from llama_index.core.postprocessor import LLMRerank
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
 from llama_index.llms.huggingface import HuggingFaceLLM
 from llama_index.core.query_engine import RetrieverQueryEngine
 from llama_index.vector_stores.faiss import FaissVectorStore
 from llama_index.core.response_synthesizers import get_response_synthesizer
+from llama_index.core.schema import NodeWithScore
 from transformers import AutoTokenizer, BitsAndBytesConfig
 # from llama_index.llms.dashscope import DashScope, DashScopeGenerationModels
 
+from embed_batcher import EmbeddingMicroBatcher, query_embedding_batch
+from embedding_cache import CachedEmbedding
+from index_tool import load_faiss_index
+from ingest import IncrementalIngestor, read_index_version
+from lazy_docstore import load_lazy_docstore
+from mmr_retriever import MMR_CANDIDATE_FACTOR, MMRRetriever
+from model_server import ModelServerClient
+from query_rewriter import QueryRewriter
+
 import dotenv
 dotenv.load_dotenv()
 
@@ -30,6 +48,10 @@ QA_TEMPLATE = PromptTemplate(
     "回答: "
 )
 
+EMBED_CACHE_FILE = "embedding_cache.npz" # 嵌入缓存持久化文件名
+
+T = TypeVar("T")
+
 def get_device():
     if torch.cuda.is_available():
         return "cuda:0"
@@ -49,9 +71,33 @@ class RAGQueryEngine:
         device: str = None,
         with_rerank: bool = False,
         reranker_top_n: int = 3,
+        reranker_type: str = "llm",
+        reranker_model_path: Optional[str] = None,
         with_mmr: bool = False,
         mmr_threshold: float = 0.5,
+        with_hybrid: bool = False,
+        hybrid_candidate_k: int = 10,
+        rrf_k: int = 60,
         with_query_transform: bool = False,
+        rewrite_cache_size: int = 1024,
+        lazy_load: bool = True,
+        embed_cache_size: int = 2048,
+        persist_embed_cache: bool = False,
+        embed_model: Optional[BaseEmbedding] = None,
+        embed_batch_max_size: int = 32,
+        embed_batch_wait_ms: float = 5.0,
+        embed_backend: str = "torch",
+        onnx_model_dir: Optional[str] = None,
+        index_type: str = "flat",
+        nprobe: int = 16,
+        ef_search: int = 64,
+        mmap_index: bool = False,
+        lazy_docstore: bool = False,
+        max_workers: int = 4,
+        max_concurrency: int = 4,
+        auto_reload: bool = False,
+        reload_check_interval: float = 5.0,
+        model_server: Optional[str] = None,
     ):
         """
         初始化 RAG 查询引擎
@@ -67,19 +113,76 @@ class RAGQueryEngine:
             device: 运行设备（如 'cuda:0', 'cpu'）
             with_rerank: 是否启用重排序,
             reranker_top_n: 重排序 top-n 文档
+            reranker_type: 重排序方式 'llm'（LLMRerank，会加载本地 LLM）| 'cross_encoder'（本地交叉编码器）
+            reranker_model_path: 交叉编码器模型路径（如 bge-reranker），reranker_type='cross_encoder' 时必填
             with_mmr: 是否启用 MMR,
             mmr_threshold: MMR 阈值
+            with_hybrid: 是否启用 BM25 + 向量混合检索（需先用 index_tool.py build-bm25 建索引）
+            hybrid_candidate_k: 混合检索时 BM25 和向量检索各自的候选数
+            rrf_k: 倒数排序融合的平滑常数
+            with_query_transform: 是否启用查询改写
+            rewrite_cache_size: 查询改写结果 LRU 缓存的容量，0 表示不缓存
+            lazy_load: 是否懒加载各组件（LLM 在首次合成回答或查询改写时才加载）,
+                为 False 时在初始化阶段加载全部组件
+            embed_cache_size: 查询嵌入 LRU 缓存的容量，0 表示不缓存
+            persist_embed_cache: 是否把嵌入缓存持久化到 storage_dir
+            embed_model: 直接使用的嵌入模型（如评测用的确定性模型），为 None 时从 embed_model_path 加载
+            embed_batch_max_size: 异步查询嵌入微批的最大条数
+            embed_batch_wait_ms: 异步查询嵌入凑批的最长等待时间（毫秒）
+            embed_backend: 嵌入推理后端 'torch'（HuggingFaceEmbedding）| 'onnx'（onnxruntime，CPU 上可用 int8 量化模型）
+            onnx_model_dir: ONNX 嵌入模型目录（由 onnx_embedding.py export 生成），embed_backend='onnx' 时必填
+            index_type: 向量索引类型 'flat' | 'ivf_flat' | 'hnsw' | 'ivf_pq' | 'sq_fp16' | 'sq_int8'，
+                非 flat 索引需先用 index_tool.py convert 生成
+            nprobe: IVF 类索引每次查询扫描的聚类数
+            ef_search: HNSW 索引查询时的搜索宽度
+            mmap_index: 是否以内存映射方式加载向量索引
+            lazy_docstore: 是否按需从 docstore.sqlite 读取节点
+                （需先用 index_tool.py export-docstore 生成）
+            max_workers: 异步接口执行检索/生成的线程池大小
+            max_concurrency: 异步接口同时执行的检索/生成任务上限
+            auto_reload: 是否在检索前检查 index_version，发现增量合并后自动热切换索引
+            reload_check_interval: 检查 index_version 的最小间隔（秒）
+            model_server: 本机共享模型服务地址（Unix socket 路径或 'tcp://host:port'，见 model_server.py），
+                设置后嵌入和检索都交给模型服务，本进程不再加载嵌入模型和向量索引
         """
         self.llm_model_path = llm_model_path
         self.embed_model_path = embed_model_path
         self.storage_dir = storage_dir
+        self.context_window = context_window
+        self.max_new_tokens = max_new_tokens
         self.similarity_top_k = similarity_top_k
         self.streaming = streaming
         self.with_rerank = with_rerank
         self.reranker_top_n = reranker_top_n
+        self.reranker_type = reranker_type
+        self.reranker_model_path = reranker_model_path
         self.with_mmr = with_mmr
         self.mmr_threshold = mmr_threshold
+        self.with_hybrid = with_hybrid
+        self.hybrid_candidate_k = hybrid_candidate_k
+        self.rrf_k = rrf_k
         self.with_query_transform = with_query_transform
+        self._query_rewriter = QueryRewriter(
+            lambda question: self.rewrite_query_simple(question, self.llm),
+            cache_size=rewrite_cache_size,
+        ) # 带缓存和门控的查询改写
+        self.embed_cache_size = embed_cache_size
+        self.persist_embed_cache = persist_embed_cache
+        self.embed_batch_max_size = embed_batch_max_size
+        self.embed_batch_wait_ms = embed_batch_wait_ms
+        self.embed_backend = embed_backend
+        self.onnx_model_dir = onnx_model_dir
+        self.index_type = index_type
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        self.mmap_index = mmap_index
+        self.lazy_docstore = lazy_docstore
+        self.auto_reload = auto_reload
+        self.reload_check_interval = reload_check_interval
+
+        # 异步接口把 CPU 密集的检索/生成放到有界线程池中，避免阻塞事件循环
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="rag")
+        self._semaphore = asyncio.Semaphore(max_concurrency)
 
         if device is None:
             self.device = get_device()
@@ -90,12 +193,109 @@ class RAGQueryEngine:
         logging.basicConfig(stream=sys.stdout, level=logging.INFO)
         self.logger = logging.getLogger(__name__)
 
-        # 初始化组件
-        self._setup_models(context_window, max_new_tokens)
-        self._load_index()
+        # 各组件均在首次使用时加载
+        self._llm = None
+        self._embed_model = None
+        self._base_embed_model = embed_model
+        self._index = None
+        self._retriever = None
+        self._node_postprocessors = None
+        self._query_engine = None
+        self._embed_batcher = None
+        self._index_version = read_index_version(storage_dir) # 当前加载的索引版本
+        self._last_reload_check = time.monotonic()
+        self._load_lock = threading.RLock() # 防止并发请求重复加载同一组件
+        self._model_server = ModelServerClient(model_server) if model_server else None
+
+        if not lazy_load:
+            self.preload(llm=True, embed_model=True, index=True)
+
+    def preload(self, llm: bool = False, embed_model: bool = True, index: bool = True):
+        """
+        按需预加载组件，避免首个请求承担加载耗时
+
+        Args:
+            llm: 是否加载本地大语言模型
+            embed_model: 是否加载嵌入模型
+            index: 是否加载向量索引（会同时加载嵌入模型）
+        """
+        if self._model_server is not None: # 嵌入模型和向量索引由模型服务加载
+            embed_model = index = False
+        if embed_model:
+            _ = self.embed_model
+        if index:
+            _ = self.retriever
+        if llm:
+            _ = self.llm
+
+    @property
+    def llm(self) -> HuggingFaceLLM:
+        """本地大语言模型（首次访问时加载）"""
+        if self._llm is None:
+            with self._load_lock:
+                if self._llm is None:
+                    self._llm = self._load_llm()
+        return self._llm
+
+    @property
+    def embed_model(self) -> BaseEmbedding:
+        """嵌入模型（首次访问时加载）"""
+        if self._embed_model is None:
+            with self._load_lock:
+                if self._embed_model is None:
+                    self._embed_model = self._load_embed_model()
+        return self._embed_model
+
+    @property
+    def embed_batcher(self) -> EmbeddingMicroBatcher:
+        """跨请求合并查询嵌入计算的微批处理器"""
+        if self._embed_batcher is None:
+            self._embed_batcher = EmbeddingMicroBatcher(
+                lambda queries: query_embedding_batch(self.embed_model, queries),
+                max_batch_size=self.embed_batch_max_size,
+                max_wait_ms=self.embed_batch_wait_ms,
+                executor=self._executor,
+            )
+        return self._embed_batcher
+
+    @property
+    def index(self) -> VectorStoreIndex:
+        """向量索引（首次访问时加载）"""
+        if self._index is None:
+            with self._load_lock:
+                if self._index is None:
+                    self._index = self._load_index()
+        return self._index
+
+    @property
+    def retriever(self) -> BaseRetriever:
+        """检索器，只依赖嵌入模型和向量索引（混合检索时另加 BM25 索引）"""
+        if self._retriever is None:
+            with self._load_lock:
+                if self._retriever is None:
+                    self._retriever = self._build_retriever()
+        return self._retriever
+
+    @property
+    def node_postprocessors(self) -> List[BaseNodePostprocessor]:
+        """节点后处理器，使用 LLMRerank 时会触发 LLM 加载"""
+        if self._node_postprocessors is None:
+            with self._load_lock:
+                if self._node_postprocessors is None:
+                    self._node_postprocessors = self._build_node_postprocessors()
+        return self._node_postprocessors
+
+    @property
+    def query_engine(self) -> RetrieverQueryEngine:
+        """完整的检索 + 合成查询引擎（首次访问时加载 LLM）"""
+        if self._query_engine is None:
+            with self._load_lock:
+                if self._query_engine is None:
+                    self._query_engine = self._build_query_engine()
+        return self._query_engine
 
-    def _setup_models(self, context_window: int, max_new_tokens: int):
-        """加载 LLM 和 Embedding 模型"""
+    def _load_llm(self) -> HuggingFaceLLM:
+        """加载本地 LLM 和分词器"""
         quantization_config = BitsAndBytesConfig(
             load_in_4bit=True,
             bnb_4bit_use_double_quant=True,
@@ -109,9 +309,9 @@ class RAGQueryEngine:
             padding_side="left"  # Qwen 推荐
         )
 
-        Settings.llm = HuggingFaceLLM(
-            context_window=context_window,
-            max_new_tokens=max_new_tokens,
+        llm = HuggingFaceLLM(
+            context_window=self.context_window,
+            max_new_tokens=self.max_new_tokens,
             generate_kwargs={
                 "temperature": 0.7,
                 "do_sample": True,
@@ -127,58 +327,284 @@ class RAGQueryEngine:
                 "quantization_config": quantization_config,
             },
         )
+        Settings.llm = llm
 
-        Settings.embed_model = HuggingFaceEmbedding(model_name=self.embed_model_path)
+        self.logger.info("==========LLM加载完成===========")
+        return llm
 
-        self.logger.info("==========模型加载完成===========")
+    def _load_embed_model(self) -> BaseEmbedding:
+        """加载 Embedding 模型"""
+        if self._base_embed_model is not None:
+            embed_model = self._base_embed_model
+        elif self.embed_backend == "onnx":
+            if not self.onnx_model_dir:
+                raise ValueError("embed_backend='onnx' 时必须提供 onnx_model_dir")
+            from onnx_embedding import OnnxEmbedding # 只有 onnx 后端需要 onnxruntime
+            embed_model = OnnxEmbedding(self.onnx_model_dir)
+        elif self.embed_backend == "torch":
+            embed_model = HuggingFaceEmbedding(model_name=self.embed_model_path)
+        else:
+            raise ValueError(f"不支持的嵌入后端: {self.embed_backend}")
+        if self.embed_cache_size > 0: # 在嵌入模型前加一层缓存
+            embed_model = CachedEmbedding(
+                embed_model,
+                max_size=self.embed_cache_size,
+                persist_path=(
+                    os.path.join(self.storage_dir, EMBED_CACHE_FILE)
+                    if self.persist_embed_cache
+                    else None
+                ),
+            )
+        Settings.embed_model = embed_model
+
+        self.logger.info("==========Embedding模型加载完成===========")
+        return embed_model
 
-    def _load_index(self):
+    def _load_index(self) -> VectorStoreIndex:
         """从磁盘加载向量索引"""
 
-        vector_store = FaissVectorStore.from_persist_dir(self.storage_dir)
+        # 近似索引与精确索引的 faiss id 一致，可共用 docstore 和 index_store
+        vector_store = FaissVectorStore(
+            faiss_index=load_faiss_index(
+                self.storage_dir,
+                self.index_type,
+                nprobe=self.nprobe,
+                ef_search=self.ef_search,
+                mmap=self.mmap_index,
+            )
+        )
         storage_context = StorageContext.from_defaults(
             persist_dir=self.storage_dir,
-            vector_store=vector_store
+            vector_store=vector_store,
+            docstore=load_lazy_docstore(self.storage_dir) if self.lazy_docstore else None,
         )
-        self.index = load_index_from_storage(storage_context)
+        index = load_index_from_storage(storage_context, embed_model=self.embed_model)
         
-        self.logger.info("=========索引加载完成===========")
+        self.logger.info(f"=========索引加载完成({self.index_type})===========")
+        return index
 
-        # 基础查询引擎
-        retriever = self.index.as_retriever(
-            similarity_top_k=self.similarity_top_k,  # 增加检索数量
-            mmr=self.with_mmr,            # 启用MMR
-            mmr_threshold=self.mmr_threshold,    # MMR阈值
-        )
+    def _build_retriever(self) -> BaseRetriever:
+        """构建向量检索器，启用混合检索时与 BM25 融合"""
+        vector_top_k = self.similarity_top_k
+        if self.with_hybrid: # 混合检索时向量侧多取一些候选
+            vector_top_k = max(self.similarity_top_k, self.hybrid_candidate_k)
+        if self.with_mmr: # FaissVectorStore 不支持 MMR 查询模式，多取候选后自行按 MMR 挑选
+            retriever = MMRRetriever(
+                vector_retriever=self.index.as_retriever(similarity_top_k=vector_top_k * MMR_CANDIDATE_FACTOR),
+                faiss_index=self.index.vector_store.client,
+                nodes_dict=self.index.index_struct.nodes_dict,
+                similarity_top_k=vector_top_k,
+                mmr_threshold=self.mmr_threshold,    # MMR阈值
+            )
+        else:
+            retriever = self.index.as_retriever(
+                similarity_top_k=vector_top_k,  # 增加检索数量
+            )
+        if self.with_hybrid:
+            # 只有混合检索需要 jieba 分词
+            from hybrid_retriever import BM25_INDEX_FILE, BM25Index, HybridRetriever, load_user_dict
+            load_user_dict(self.storage_dir)
+            retriever = HybridRetriever(
+                vector_retriever=retriever,
+                bm25_index=BM25Index.load(os.path.join(self.storage_dir, BM25_INDEX_FILE)),
+                docstore=self.index.docstore,
+                similarity_top_k=self.similarity_top_k,
+                sparse_top_k=self.hybrid_candidate_k,
+                rrf_k=self.rrf_k,
+            )
+            self.logger.info("=========混合检索器初始化完成===========")
+        return retriever
+
+    def _build_node_postprocessors(self) -> List[BaseNodePostprocessor]:
+        """按配置构建重排序后处理器"""
+        if not self.with_rerank:
+            return []
+        if self.reranker_type == "cross_encoder":
+            if not self.reranker_model_path:
+                raise ValueError("reranker_type='cross_encoder' 时必须提供 reranker_model_path")
+            from cross_encoder_rerank import CrossEncoderRerank # 只有交叉编码器重排序需要 sentence_transformers
+            return [CrossEncoderRerank(
+                model=self.reranker_model_path,
+                top_n=self.reranker_top_n,
+                device=self.device,
+            )]
+        if self.reranker_type == "llm":
+            return [LLMRerank(llm=self.llm, top_n=self.reranker_top_n)]
+        raise ValueError(f"不支持的重排序方式: {self.reranker_type}")
+
+    def _build_query_engine(self) -> RetrieverQueryEngine:
+        """构建带回答合成的查询引擎"""
         response_synthesizer = get_response_synthesizer(
             streaming=self.streaming,
-            llm=Settings.llm,
+            llm=self.llm,
             # text_qa_template=QA_TEMPLATE,
         )
         query_engine = RetrieverQueryEngine(
-            retriever = retriever,
+            retriever = self.retriever,
             response_synthesizer = response_synthesizer,
-            node_postprocessors = [LLMRerank(top_n=self.reranker_top_n)] if self.with_rerank else None,
+            node_postprocessors = self.node_postprocessors or None,
         )
 
         # 应用 HyDE 查询转换
         # hyde = HyDEQueryTransform(include_original=True)
-        # self.query_engine = TransformQueryEngine(query_engine, query_transform=hyde)
-        self.query_engine = query_engine
+        # query_engine = TransformQueryEngine(query_engine, query_transform=hyde)
         
         self.logger.info("=========查询引擎初始化完成===========")
+        return query_engine
     
     
-    def query_with_contexts(self, question: str) -> Tuple[str, List[str]]:
-        # 获取底层 response object
-        response = self.query_engine.query(question)
+    def embed_cache_stats(self) -> dict:
+        """查询嵌入缓存的命中统计，未启用缓存时返回空字典"""
+        if isinstance(self._embed_model, CachedEmbedding):
+            return self._embed_model.stats()
+        return {}
+
+    def rewrite_stats(self) -> dict:
+        """查询改写的缓存命中与跳过统计"""
+        return self._query_rewriter.stats()
+
+    @property
+    def index_version(self) -> Optional[str]:
+        """当前检索使用的索引版本，使用模型服务时由服务端热切换，读取磁盘上的版本号"""
+        if self._model_server is not None:
+            return read_index_version(self.storage_dir)
+        return self._index_version
+
+    def reload_index(self):
+        """
+        重新加载磁盘上的索引并热切换
+
+        新索引和检索器全部构建完成后才替换引用，期间的请求继续使用旧索引
+        """
+        version = read_index_version(self.storage_dir)
+        index = self._load_index()
+        with self._load_lock:
+            self._index = index
+            self._retriever = None
+            retriever = self.retriever
+            self._query_engine = None # 下次合成回答时基于新检索器重建
+            self._index_version = version
+        self.logger.info(f"=========索引已热切换, 版本 {version}===========")
+        return retriever
+
+    def _maybe_reload(self):
+        """按间隔检查 index_version，发现新版本时热切换"""
+        now = time.monotonic()
+        if now - self._last_reload_check < self.reload_check_interval:
+            return
+        self._last_reload_check = now
+        if read_index_version(self.storage_dir) != self._index_version:
+            self.reload_index()
+
+    def ingest_documents(self, paths: List[str], background: bool = True, **ingestor_kwargs: Any):
+        """
+        增量添加文档：切块嵌入写入增量后合并进主索引，完成后热切换
+
+        Args:
+            paths: 文件或目录路径列表
+            background: 是否在后台线程中合并
+            ingestor_kwargs: 传给 IncrementalIngestor 的切块参数
 
-        # 提取检索到的节点（即上下文）
-        retrieved_nodes = response.source_nodes if hasattr(response, 'source_nodes') else []
+        Returns:
+            background=True 时返回合并线程，否则返回合并的节点数
+        """
+        embed_model = self.embed_model
+        if isinstance(embed_model, CachedEmbedding): # 文档嵌入不写入查询向量缓存，避免挤掉热点问题
+            embed_model = embed_model.inner
+        ingestor = IncrementalIngestor(self.storage_dir, embed_model, **ingestor_kwargs)
+        ingestor.ingest(paths)
+        on_merged = lambda _version: self.reload_index()
+        if background:
+            return ingestor.start_background_merge(on_merged=on_merged)
+        return ingestor.merge(on_merged=on_merged)
+
+    def embed_query(self, question: str) -> List[float]:
+        """计算问题的查询向量（经过嵌入缓存）"""
+        if self._model_server is not None:
+            return self._model_server.embed_query(question)
+        return self.embed_model.get_query_embedding(question)
+
+    async def aembed_query(self, question: str) -> List[float]:
+        """异步计算查询向量，并发请求会被合并成一次批量前向计算"""
+        if self._model_server is not None: # 由模型服务与其他工作进程的请求一起合批
+            return await self._model_server.aembed_query(question)
+        return await self.embed_batcher.embed(question)
+
+    def retrieve(self, question: str, query_embedding: Optional[List[float]] = None) -> List[NodeWithScore]:
+        """
+        只执行检索（含 MMR 与可选重排序），不进行回答合成
+
+        Args:
+            question: 用户问题
+            query_embedding: 已经算好的查询向量，传入时不再重复计算
+
+        Returns:
+            按相关度排序、带分数的节点列表
+        """
+        if self._model_server is not None:
+            return self._model_server.retrieve(question, query_embedding=query_embedding)
+        if self.auto_reload:
+            self._maybe_reload()
+        query_bundle = QueryBundle(query_str=question, embedding=query_embedding)
+        nodes = self.retriever.retrieve(query_bundle)
+        for postprocessor in self.node_postprocessors:
+            nodes = postprocessor.postprocess_nodes(nodes, query_bundle=query_bundle)
+        return nodes
+
+    def query_with_contexts(self, question: str, query_embedding: Optional[List[float]] = None) -> List[str]:
+        """只检索上下文文本，不调用本地 LLM 生成回答"""
+        retrieved_nodes = self.retrieve(question, query_embedding=query_embedding)
         contexts = [node.get_content() for node in retrieved_nodes]
 
         return contexts
     
+    async def _run_in_executor(self, fn: Callable[..., T], *args: Any) -> T:
+        """在有界线程池中执行同步函数，并限制同时执行的任务数"""
+        async with self._semaphore:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, functools.partial(fn, *args))
+
+    async def aretrieve(self, question: str, query_embedding: Optional[List[float]] = None) -> List[NodeWithScore]:
+        """
+        异步检索，不阻塞事件循环
+
+        Args:
+            question: 用户问题
+            query_embedding: 已经算好的查询向量，为 None 时通过微批处理器计算
+
+        Returns:
+            按相关度排序、带分数的节点列表
+        """
+        if self._model_server is not None: # 模型服务端完成嵌入和检索，只需一次往返
+            return await self._model_server.aretrieve(question, query_embedding=query_embedding)
+        if query_embedding is None:
+            query_embedding = await self.aembed_query(question)
+        return await self._run_in_executor(self.retrieve, question, query_embedding)
+
+    async def aquery_with_contexts(self, question: str, query_embedding: Optional[List[float]] = None) -> List[str]:
+        """异步检索上下文文本"""
+        retrieved_nodes = await self.aretrieve(question, query_embedding=query_embedding)
+        return [node.get_content() for node in retrieved_nodes]
+
+    async def aquery(self, question: str) -> str:
+        """
+        异步执行 RAG 查询（检索 + 本地 LLM 生成）
+
+        Returns:
+            完整回答字符串（streaming=True 时在线程池中拼接全部 token）
+        """
+        def _query() -> str:
+            response = self.query(question)
+            return response if isinstance(response, str) else "".join(response)
+
+        return await self._run_in_executor(_query)
+
+    def shutdown(self):
+        """关闭异步接口使用的线程池和模型服务连接"""
+        self._executor.shutdown(wait=False, cancel_futures=True)
+        if self._model_server is not None:
+            self._model_server.close()
+
     def query(self, question: str) -> Union[str, Iterator[str]]:
         """
         执行 RAG 查询
@@ -195,7 +621,7 @@ class RAGQueryEngine:
         if self.with_query_transform:
             self.logger.info("========执行查询改写========")
             print(f"输入问题:{question}\n")
-            question = self.rewrite_query_simple(question, Settings.llm)
+            question = self._query_rewriter.rewrite(question) # 规范的问题跳过，重复的问题命中缓存
             print(f"改写问题:{question}\n")
         self.logger.info("========向量数据库开始查询========")
         response = self.query_engine.query(question)
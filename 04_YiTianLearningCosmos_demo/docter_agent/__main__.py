@@ -12,6 +12,8 @@ from a2a.types import (
 )
 from agent_executor import DoctorRAGAgentExecutor
 from agent import DoctorRAGWorkflow
+from session_store import SessionStore, SQLiteSessionBackend
+from admission import AdmissionController, AdmissionControlledExecutor, add_stats_route
 
 from dotenv import load_dotenv
 load_dotenv() # 加载环境变量
@@ -22,7 +24,11 @@ logger = logging.getLogger(__name__) # 创建日志记录器
 @click.command() # 创建命令行接口
 @click.option('--host', 'host', default='localhost') # 主机
 @click.option('--port', 'port', default=10003) # 端口
-def main(host, port): # 主函数
+@click.option('--session-db', 'session_db', default=None, envvar='SESSION_DB') # 会话持久化数据库(SQLite)，不设置时会话只保存在内存中
+@click.option('--max-in-flight', 'max_in_flight', type=int, default=8, envvar='MAX_IN_FLIGHT') # 最多同时执行的请求数，0 表示不限制
+@click.option('--max-queue', 'max_queue', type=int, default=32, envvar='MAX_QUEUE') # 最多排队的请求数，队列满时立即拒绝
+@click.option('--queue-timeout', 'queue_timeout', type=float, default=30.0, envvar='QUEUE_TIMEOUT') # 排队的最长时间(秒)
+def main(host, port, session_db, max_in_flight, max_queue, queue_timeout): # 主函数
     """启动A2A服务器"""
     try:
         capabilities = AgentCapabilities( # 智能体能力
@@ -49,10 +55,16 @@ def main(host, port): # 主函数
         )
 
         # httpx_client = httpx.AsyncClient()
+        agent_executor = DoctorRAGAgentExecutor( # 创建智能体执行器
+            agent=DoctorRAGWorkflow(), # 创建智能体
+            session_store=SessionStore(
+                max_entries=64, # 内存中只保留最近使用的会话
+                backend=SQLiteSessionBackend(session_db),
+            ) if session_db else None, # 会话存储
+        )
+        admission = AdmissionController(max_in_flight, max_queue, queue_timeout) # 准入控制
         request_handler = DefaultRequestHandler( # 创建请求处理器
-            agent_executor=DoctorRAGAgentExecutor( # 创建智能体执行器
-                agent=DoctorRAGWorkflow(), # 创建智能体
-            ),
+            agent_executor=AdmissionControlledExecutor(agent_executor, admission), # 超过并发上限的请求排队或被拒绝
             task_store=InMemoryTaskStore(), # 任务存储
             # push_notifier=InMemoryPushNotifier(httpx_client), 推送器
         )
@@ -61,7 +73,9 @@ def main(host, port): # 主函数
         )
         import uvicorn # 导入unicorn模块
 
-        uvicorn.run(server.build(), host=host, port=port, timeout_keep_alive=300) # 运行服务器
+        app = server.build()
+        add_stats_route(app, admission) # GET /admission/stats 查看队列深度和排队时间
+        uvicorn.run(app, host=host, port=port, timeout_keep_alive=300) # 运行服务器
     except Exception as e:
         logger.error(f'在服务器启动时出现错误: {e}') # 错误日志
         exit(1) # 退出
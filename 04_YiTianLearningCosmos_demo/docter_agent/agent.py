@@ -13,9 +13,11 @@ from llama_index.core.workflow import (
     step,
 )
 from llama_index.llms.dashscope import DashScope, DashScopeGenerationModels
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, TypeAdapter
 
 from RAG_query_engine import RAGQueryEngine
+from answer_cache import SemanticAnswerCache
+from context_packer import ContextPacker
 
 import dotenv
 dotenv.load_dotenv()
@@ -32,6 +34,10 @@ class InputEvent(StartEvent):
 class ChatEvent(Event):
     msg: str # 消息
 
+# 回答正文的增量
+class AnswerDeltaEvent(Event):
+    delta: str # 新生成的文本
+
 # 输出的 event
 class ChatResponseEvent(StopEvent):
     response: str # 回复
@@ -61,16 +67,108 @@ class ChatResponse(BaseModel):
     )
     # 引用
     citations: list[Citation] = Field(
-        default=list,
+        default_factory=list,
         description='包含了多个引用的列表',
     )
 
+CITATION_SEPARATOR = '<<<引用>>>' # 回答正文与引用 JSON 之间的分隔符
+JSON_ANSWER_PREFIXES = ('{', '```json') # 模型仍按旧的 JSON 格式回答时的开头
+
+
+class AnswerStreamSplitter:
+    """
+    把流式输出拆成回答正文和引用两部分，正文可以边生成边推送
+
+    模型偶尔仍按旧格式输出整段 JSON，开头像 JSON 时先不推送，输出结束后整段解析，
+    解析成功时没有流式正文，由 result() 给出解析后的回答
+    """
+
+    def __init__(self):
+        self._buffer = '' # 尚未确认不属于分隔符的文本
+        self._answer_parts: list[str] = [] # 已推送的正文
+        self._tail = '' # 分隔符之后的引用 JSON
+        self._separated = False # 是否已经读到分隔符
+        self._json_mode: bool | None = None # 是否是旧的 JSON 格式，None 表示还判断不了
+        self._parsed: ChatResponse | None = None # 按旧格式解析出的回答
+
+    def _detect_json(self) -> bool | None:
+        head = self._buffer.lstrip()
+        if head.startswith(JSON_ANSWER_PREFIXES):
+            return True
+        if any(prefix.startswith(head) for prefix in JSON_ANSWER_PREFIXES): # 包括还没有非空白字符的情况
+            return None
+        return False
+
+    def feed(self, delta: str) -> str:
+        """输入模型新生成的文本，返回可以推送的正文"""
+        if self._separated:
+            self._tail += delta
+            return ''
+        self._buffer += delta
+        if self._json_mode is None:
+            self._json_mode = self._detect_json()
+        if self._json_mode is not False: # 可能是整段 JSON，留到结束时解析
+            return ''
+        index = self._buffer.find(CITATION_SEPARATOR)
+        if index >= 0: # 读到分隔符，之后都是引用
+            out = self._buffer[:index]
+            self._tail = self._buffer[index + len(CITATION_SEPARATOR):]
+            self._buffer = ''
+            self._separated = True
+        else: # 结尾可能是分隔符的前半部分，先留着
+            keep = next(
+                (size for size in range(min(len(self._buffer), len(CITATION_SEPARATOR) - 1), 0, -1)
+                 if CITATION_SEPARATOR.startswith(self._buffer[-size:])),
+                0,
+            )
+            out = self._buffer[:len(self._buffer) - keep]
+            self._buffer = self._buffer[len(out):]
+        self._answer_parts.append(out)
+        return out
+
+    def flush(self) -> str:
+        """输出结束，返回剩余的正文"""
+        if self._json_mode is not False and not self._separated: # 留着的文本现在可以判断了
+            held, self._buffer = self._buffer, ''
+            if self._json_mode:
+                try:
+                    self._parsed = PydanticOutputParser(ChatResponse).parse(held)
+                    return ''
+                except ValueError as _: # 不是合法的 JSON 回答，按普通正文处理
+                    pass
+            self._json_mode = False
+            return self.feed(held) + self.flush()
+        out, self._buffer = self._buffer, ''
+        self._answer_parts.append(out)
+        return out
+
+    def result(self) -> 'ChatResponse':
+        """解析完整的回答和引用"""
+        if self._parsed is not None: # 模型按旧的 JSON 格式回答
+            return self._parsed
+        answer = ''.join(self._answer_parts).strip()
+        if not self._separated:
+            return ChatResponse(response=answer) # 只返回消息即可
+
+        tail = self._tail.strip().removeprefix('```json').removeprefix('```').removesuffix('```')
+        try:
+            citations = TypeAdapter(list[Citation]).validate_json(tail[tail.index('['):tail.rindex(']') + 1])
+        except ValueError as _: # 引用解析失败时只返回正文
+            citations = []
+        return ChatResponse(response=answer, citations=citations)
+
+
 # 工作流
 class DoctorRAGWorkflow(Workflow):
     def __init__( # 初始化
         self,
         timeout: float | None = None, # 超时时间
         verbose: bool = False, # 是否打印日志
+        with_answer_cache: bool = True, # 是否启用语义回答缓存
+        answer_cache_threshold: float = 0.95, # 命中缓存所需的最低相似度
+        answer_cache_ttl: float = 3600.0, # 缓存有效期(秒)
+        answer_cache_size: int = 1024, # 最大缓存条目数
+        context_token_budget: int = 2048, # 拼入提示词的检索上下文 token 预算
         **workflow_kwargs: Any, # 其他参数
     ):
         super().__init__(timeout=timeout, verbose=verbose, **workflow_kwargs) # 父类初始化
@@ -86,11 +184,32 @@ class DoctorRAGWorkflow(Workflow):
             storage_dir=os.getenv('STORAGE_DIR'),
             streaming=False,
             similarity_top_k=3,
-            with_rerank=False,
+            with_rerank=bool(os.getenv('RERANKER_PATH')), # 配置了交叉编码器时启用重排序
+            reranker_type='cross_encoder', # 本地交叉编码器，不调用LLM
+            reranker_model_path=os.getenv('RERANKER_PATH'),
             with_mmr=True,
             mmr_threshold=0.5,
+            with_hybrid=os.getenv('WITH_HYBRID', '0') == '1', # BM25 + 向量混合检索
             with_query_transform=False,
+            index_type=os.getenv('INDEX_TYPE', 'flat'), # 向量索引类型
+            mmap_index=os.getenv('MMAP_INDEX', '0') == '1', # 内存映射加载向量索引
+            lazy_docstore=os.getenv('LAZY_DOCSTORE', '0') == '1', # 按需读取节点文本
+            auto_reload=True, # 增量文档合并后自动热切换索引
+            lazy_load=True, # 只检索不合成，本地LLM不会被加载
+            persist_embed_cache=True, # 重复的问诊问题直接命中嵌入缓存
+            embed_backend=os.getenv('EMBED_BACKEND', 'torch'), # 'onnx' 时使用量化的 ONNX 嵌入模型
+            onnx_model_dir=os.getenv('ONNX_EMBED_DIR'),
+            model_server=os.getenv('MODEL_SERVER'), # 设置后嵌入和检索交给本机共享的模型服务
         ) # RAG查询引擎
+        self._rag_engine.preload(embed_model=True, index=True) # 预加载嵌入模型和向量索引
+
+        self._answer_cache = SemanticAnswerCache(
+            threshold=answer_cache_threshold,
+            ttl=answer_cache_ttl,
+            max_entries=answer_cache_size,
+        ) if with_answer_cache else None # 语义回答缓存
+
+        self._context_packer = ContextPacker(token_budget=context_token_budget) # 上下文去重与按预算裁剪
         
         self._system_prompt_template = """ 
 你是一个专业的中医助手，能够基于提供的医学知识库内容回答用户的问题、提供引用，并进行对话。
@@ -107,17 +226,17 @@ class DoctorRAGWorkflow(Workflow):
 4. 例如：如果回答中包含 "根据中医理论……[1]。" 和 "这种情况需要……[2]。"，且这两句话分别来自知识库的不同段落，那么对应的引用应为：citations = [["根据中医理论..."], ["这种情况需要..."]]。
 5. 务必从 [1] 开始编号，并按顺序递增。绝对不要直接用段落内容作为引用编号，否则我会丢掉工作。
 
-请严格按照以下 JSON 格式回答，不要包含任何其他内容：
-{{
-  "response": "你的回答文本",
-  "citations": [
-    {{
-      "citation_number": 1,
-      "texts": ["引用的文本内容"]
-    }},
-    ...
-  ]
-}}
+请按以下格式回答，不要包含任何其他内容：先直接输出回答正文（正文中使用行内引用编号），
+正文结束后另起一行输出分隔符 {separator}，再输出引用列表的 JSON：
+你的回答文本
+{separator}
+[
+  {{
+    "citation_number": 1,
+    "texts": ["引用的文本内容"]
+  }},
+  ...
+]
 """ # 系统提示词
 
     @step # 路由
@@ -126,35 +245,58 @@ class DoctorRAGWorkflow(Workflow):
 
     @step # 聊天
     async def chat(self, ctx: Context, event: ChatEvent) -> ChatResponseEvent:
+        query_embedding = await self._rag_engine.aembed_query(event.msg) # 计算问题向量(与并发请求合批)
+        index_version = self._rag_engine.index_version # 检索前记录索引版本，回答只缓存在这个版本下
+        if self._answer_cache is not None: # 先查语义缓存
+            self._answer_cache.sync_index_version(index_version) # 索引热切换后清空旧回答
+            cached = self._answer_cache.lookup(query_embedding)
+            if cached is not None: # 命中相似问题
+                ctx.write_event_to_stream(LogEvent(msg='命中相似问题的历史回答')) # 推送事件
+                return ChatResponseEvent(
+                    response=cached.response,
+                    citations=cached.citations
+                ) # 直接返回缓存的回答
+
         ctx.write_event_to_stream(LogEvent(msg='正在查询医学知识库...')) # 推送事件
         
         # 使用RAG引擎查询
         # response_text = self._rag_engine.query(event.msg)
-        contexts = self._rag_engine.query_with_contexts(event.msg)
-        
+        nodes = await self._rag_engine.aretrieve(
+            event.msg, query_embedding=query_embedding
+        ) # 在线程池中检索，不阻塞事件循环
+        contexts = self._context_packer.pack(nodes).texts # 去掉重复内容，按检索分数裁剪到token预算
+
         ctx.write_event_to_stream(LogEvent(msg='医学知识库查询完成')) # 推送事件
 
         if contexts: # 如果有上下文
             ctx.write_event_to_stream(LogEvent(msg='添加系统提示词...')) # 推送事件
-            prompt = self._system_prompt_template.format(context_str="\n\n".join(contexts)) # 获取系统提示
+            prompt = self._system_prompt_template.format(
+                context_str=self._context_packer.separator.join(contexts), separator=CITATION_SEPARATOR
+            ) # 获取系统提示
             prompt += f"\n\nUSER: {event.msg}" # 添加用户提问
         else: # 如果没有上下文
             prompt = f"USER: {event.msg}\n\n请直接回答。" # 获取用户提问
 
-        response = await self._llm.acomplete(prompt) # 调用模型
-        raw_output = response.text.strip() # 获取模型输出
-
-        parser = PydanticOutputParser(ChatResponse)  # 创建解析器
-        try:
-            response_obj: ChatResponse = parser.parse(raw_output) # 解析结构化输出
-        except ValueError as _: # 如果解析失败
-            response_obj = ChatResponse(response=raw_output) # 只返回消息即可
+        splitter = AnswerStreamSplitter() # 拆分回答正文和引用
+        async for chunk in await self._llm.astream_complete(prompt): # 流式调用模型
+            delta = splitter.feed(chunk.delta or '')
+            if delta: # 正文逐段推送给客户端
+                ctx.write_event_to_stream(AnswerDeltaEvent(delta=delta))
+        delta = splitter.flush()
+        if delta:
+            ctx.write_event_to_stream(AnswerDeltaEvent(delta=delta))
+        response_obj = splitter.result() # 解析结构化输出
 
         citations = {} # 创建引用字典
         if contexts and response_obj.citations: # 如果有上下文且有引用
             for citation in response_obj.citations: # 遍历引用
                 citations[citation.citation_number] = citation.texts # 添加引用的内容
 
+        if self._answer_cache is not None and response_obj.response: # 写入语义缓存
+            self._answer_cache.add(
+                event.msg, query_embedding, response_obj.response, citations, index_version=index_version
+            )
+
         return ChatResponseEvent(
             response=response_obj.response,
             citations=citations
@@ -1,11 +1,14 @@
+import asyncio
 import logging
 import traceback
-from typing import Dict, Any
+import uuid
+from typing import Dict, Optional
 
 from a2a.server.agent_execution import AgentExecutor, RequestContext
 from a2a.server.events import EventQueue
 from a2a.server.tasks import TaskUpdater
 from a2a.types import (
+    DataPart,
     FilePart,
     InternalError,
     InvalidParamsError,
@@ -13,20 +16,24 @@ from a2a.types import (
     Task,
     TaskState,
     TextPart,
-    UnsupportedOperationError,
 )
 from a2a.utils import are_modalities_compatible, new_agent_text_message
 from a2a.utils.errors import ServerError
 from agent import (
+    AnswerDeltaEvent,
     ChatResponseEvent,
     InputEvent,
     LogEvent,
     DoctorRAGWorkflow,
 )
 from llama_index.core.workflow import Context
+from keyed_lock import KeyedLock
+from session_store import SessionStore
 
 logger = logging.getLogger(__name__) # 获取日志记录器
 
+CANCEL_TIMEOUT = 10.0 # 取消时等待任务退出的最长时间(秒)
+
 
 class DoctorRAGAgentExecutor(AgentExecutor):
 
@@ -38,9 +45,14 @@ class DoctorRAGAgentExecutor(AgentExecutor):
     def __init__(
         self,
         agent: DoctorRAGWorkflow,
+        session_store: Optional[SessionStore] = None, # 会话状态存储，为 None 时使用默认容量
     ): # 初始化
         self.agent = agent # 智能体
-        self.ctx_states: Dict[str, Dict[str, Any]] = {} # 存储会话状态
+        self.ctx_states = (
+            session_store if session_store is not None else SessionStore()
+        ) # 存储会话状态(LRU + TTL + 字节预算)
+        self._running: Dict[str, asyncio.Task] = {} # 正在执行的任务 task_id -> asyncio.Task
+        self._context_locks = KeyedLock() # 同一会话的消息依次执行，不同会话并行
 
     # 执行方法
     async def execute(
@@ -55,73 +67,128 @@ class DoctorRAGAgentExecutor(AgentExecutor):
         input_event = self._get_input_event(context) # 获取输入事件
         context_id = context.context_id # 获取会话ID
         task_id = context.task_id # 获取任务ID
+        current = asyncio.current_task()
+        self._running[task_id] = current # 登记正在执行的任务，cancel 时取消它
+        handler = None # 工作流句柄
         try:
-            # 检查这个会话是否已经存在
-            print(f'会话状态数量: {len(self.ctx_states)}', flush=True) # 打印会话数量
-            saved_ctx_state = self.ctx_states.get(context_id, None) # 获取保存的会话状态
-
-            if saved_ctx_state is not None: # 如果会话状态已经存在
-                logger.info(f'从已经保存的上下文中恢复会话:{context_id}') # 输出会话信息
-                ctx = Context.from_dict(self.agent, saved_ctx_state) # 从字典中恢复会话状态
-                handler = self.agent.run( # 运行智能体
-                    start_event=input_event, # 输出事件
-                    ctx=ctx, # 上下文
-                )
-            else: # 如果会话状态不存在
-                logger.info(f'启动一个新的会话:{context_id}') # 打印日志
-                handler = self.agent.run( # 直接运行智能体
-                    start_event=input_event, # 输入事件
-                )
-
-            updater = TaskUpdater(event_queue, task_id, context_id) # 创建任务更新器
-            await updater.submit() # 提交任务更新
-            async for event in handler.stream_events(): # 遍历事件
-                if isinstance(event, LogEvent): # 如果是日志事件
-                    await updater.update_status( # 将日志信息作为信息更新任务状态
-                        TaskState.working, # 任务状态：正在工作
-                        new_agent_text_message(event.msg, context_id, task_id), # 创建信息
+            # 同一会话的消息依次执行，避免并发读取同一个旧状态、后写入的覆盖先写入的
+            async with self._context_locks.acquire(context_id) as waited: # 等待同一会话的上一条消息处理完
+                if waited > 0.001: # 排过队才打印
+                    logger.info(f'会话 {context_id} 等待了 {waited * 1000:.1f}ms') # 打印等待时间
+                # 检查这个会话是否已经存在
+                logger.debug(f'会话状态统计: {self.ctx_states.stats()}') # 会话数量和淘汰统计
+                logger.debug(f'会话锁统计: {self._context_locks.stats()}') # 等锁次数和耗时
+                saved_ctx_state = await self.ctx_states.get(context_id) # 获取保存的会话状态
+
+                if saved_ctx_state is not None: # 如果会话状态已经存在
+                    logger.info(f'从已经保存的上下文中恢复会话:{context_id}') # 输出会话信息
+                    ctx = Context.from_dict(self.agent, saved_ctx_state) # 从字典中恢复会话状态
+                    handler = self.agent.run( # 运行智能体
+                        start_event=input_event, # 输出事件
+                        ctx=ctx, # 上下文
+                    )
+                else: # 如果会话状态不存在
+                    logger.info(f'启动一个新的会话:{context_id}') # 打印日志
+                    handler = self.agent.run( # 直接运行智能体
+                        start_event=input_event, # 输入事件
                     )
 
-            final_response = await handler # 获取最终回复
-            if isinstance(final_response, ChatResponseEvent): # 如果是聊天事件
-                content = final_response.response # 获取回复内容
-                metadata = ( # 创建元数据
-                    final_response.citations # 引用
-                    if hasattr(final_response, 'citations')
-                    else None
-                )
-                if metadata is not None: # 如果元数据不是空
-                    metadata = {str(k): v for k, v in metadata.items()} # 确保元数据是字典类型
-
-                self.ctx_states[context_id] = handler.ctx.to_dict() # 保存会话状态
-
-                await updater.add_artifact( # 添加文件
-                    parts=[Part(root=TextPart(text=content))], # 回复内容
-                    name='医生RAG回答', # 名称
-                    metadata=metadata, # 元数据
-                )
-                await updater.complete() # 完成任务
-            else: # 如果不是聊天事件
-                # 创建信息
-                msg = new_agent_text_message(f'预期之外的结果: {final_response}', context_id, task_id)
-                await updater.failed(msg) # 任务失败
-
+                updater = TaskUpdater(event_queue, task_id, context_id) # 创建任务更新器
+                await updater.submit() # 提交任务更新
+                artifact_id = str(uuid.uuid4()) # 流式回答的文件ID
+                streamed = False # 是否已经推送过回答片段
+                pending = None # 延后一个片段推送，流结束时才能标记最后一块
+                async for event in handler.stream_events(): # 遍历事件
+                    if isinstance(event, LogEvent): # 如果是日志事件
+                        await updater.update_status( # 将日志信息作为信息更新任务状态
+                            TaskState.working, # 任务状态：正在工作
+                            new_agent_text_message(event.msg, context_id, task_id), # 创建信息
+                        )
+                    elif isinstance(event, AnswerDeltaEvent): # 如果是回答片段
+                        if pending is not None:
+                            await self._add_answer_chunk(updater, artifact_id, pending, append=streamed)
+                            streamed = True
+                        pending = event.delta
+
+                final_response = await handler # 获取最终回复
+                if isinstance(final_response, ChatResponseEvent): # 如果是聊天事件
+                    content = final_response.response # 获取回复内容
+                    metadata = ( # 创建元数据
+                        final_response.citations # 引用
+                        if hasattr(final_response, 'citations')
+                        else None
+                    )
+                    if metadata is not None: # 如果元数据不是空
+                        metadata = {str(k): v for k, v in metadata.items()} # 确保元数据是字典类型
+
+                    await self.ctx_states.set(context_id, handler.ctx.to_dict()) # 保存会话状态
+
+                    if pending is not None: # 流式回答：推送最后一个片段，引用单独作为一个文件
+                        await self._add_answer_chunk(
+                            updater, artifact_id, pending, append=streamed, last_chunk=True
+                        )
+                        if metadata:
+                            await updater.add_artifact(
+                                parts=[Part(root=DataPart(data=metadata))], # 引用内容
+                                name='医生RAG引用', # 名称
+                            )
+                    else: # 命中缓存等非流式回答
+                        await updater.add_artifact( # 添加文件
+                            parts=[Part(root=TextPart(text=content))], # 回复内容
+                            name='医生RAG回答', # 名称
+                            metadata=metadata, # 元数据
+                        )
+                    await updater.complete() # 完成任务
+                else: # 如果不是聊天事件
+                    # 创建信息
+                    msg = new_agent_text_message(f'预期之外的结果: {final_response}', context_id, task_id)
+                    await updater.failed(msg) # 任务失败
+
+        except asyncio.CancelledError: # 被 cancel 取消
+            logger.info(f'任务 {task_id} 已取消') # 打印日志
+            if handler is not None and not handler.done(): # 停止工作流中还在运行的步骤
+                await handler.cancel_run()
+            raise # 会话状态保持上一轮的结果
         except Exception as e: # 异常捕获
             logger.error(f'流式输出时出现错误: {e}') # 打印错误信息
             logger.error(traceback.format_exc()) # 打印错误堆栈
 
-            if context_id in self.ctx_states: # 如果会话状态存在
-                del self.ctx_states[context_id] # 删除会话状态
+            await self.ctx_states.delete(context_id) # 删除会话状态
             raise ServerError( # 抛出服务器错误
                 error=InternalError( # 内部错误
                     message=f'流式输出时出现错误: {e}' # 错误信息
                 )
             )
+        finally:
+            if self._running.get(task_id) is current: # 注销任务
+                del self._running[task_id]
+
+    @staticmethod
+    async def _add_answer_chunk( # 推送一个回答片段
+        updater: TaskUpdater,
+        artifact_id: str,
+        text: str,
+        append: bool,
+        last_chunk: bool = False,
+    ) -> None:
+        await updater.add_artifact(
+            parts=[Part(root=TextPart(text=text))], # 回答片段
+            artifact_id=artifact_id, # 同一个文件ID，客户端按顺序拼接
+            name='医生RAG回答', # 名称
+            append=append, # 第一个片段创建文件，之后的片段追加
+            last_chunk=last_chunk, # 是否是最后一个片段
+        )
 
     async def cancel( # 取消方法
         self, request: RequestContext, event_queue: EventQueue # 请求和事件队列
     ) -> Task | None:
-        raise ServerError(error=UnsupportedOperationError()) # 抛出服务器错误
+        running = self._running.pop(request.task_id, None) # 找到正在执行的任务
+        if running is not None and not running.done():
+            running.cancel() # 在下一个 await 处抛出 CancelledError，停止工作流
+            await asyncio.wait([running], timeout=CANCEL_TIMEOUT) # 等待任务退出，释放占用的资源
+        updater = TaskUpdater(event_queue, request.task_id, request.context_id) # 创建任务更新器
+        await updater.cancel() # 发布 canceled 状态
+        return None
 
     # 验证请求
     def _validate_request(self, context: RequestContext) -> bool:
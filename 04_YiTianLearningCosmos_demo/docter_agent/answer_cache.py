@@ -0,0 +1,160 @@
+# answer_cache.py
+import logging
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class CachedAnswer:
+    """缓存的一条回答"""
+    query: str # 原始问题
+    response: str # 回答
+    citations: Dict[int, List[str]] # 引用
+    created_at: float # 写入时间
+    similarity: float = 1.0 # 命中时与新问题的相似度
+
+
+class SemanticAnswerCache:
+    """
+    语义回答缓存
+
+    用问题的嵌入向量建立索引，新问题与历史问题的余弦相似度不低于阈值、
+    且缓存未过期时直接返回历史回答，跳过检索和大模型调用。
+    回答与生成时的索引版本绑定，索引增量合并、热切换后旧回答全部作废。
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.95,
+        ttl: float = 3600.0,
+        max_entries: int = 1024,
+    ):
+        """
+        Args:
+            threshold: 命中所需的最低余弦相似度
+            ttl: 缓存有效期（秒），小于等于 0 表示永不过期
+            max_entries: 最大缓存条目数，超出时淘汰最早写入的条目
+        """
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+
+        self._entries: List[CachedAnswer] = []
+        self._vectors: Optional[np.ndarray] = None # 归一化后的问题向量矩阵，每行对应一个条目
+        self._index_version: Optional[str] = None # 缓存的回答所基于的索引版本
+        self._hits = 0
+        self._misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm > 0 else vector
+
+    def _evict_expired(self) -> None:
+        """删除过期条目"""
+        if self.ttl <= 0 or not self._entries:
+            return
+        deadline = time.time() - self.ttl
+        keep = [i for i, entry in enumerate(self._entries) if entry.created_at >= deadline]
+        if len(keep) == len(self._entries):
+            return
+        self._entries = [self._entries[i] for i in keep]
+        self._vectors = self._vectors[keep] if keep else None
+
+    def sync_index_version(self, index_version: Optional[str]) -> None:
+        """索引版本变化时清空缓存，旧回答可能没有用到新加入的文档"""
+        if index_version == self._index_version:
+            return
+        if self._entries:
+            logger.info(f'索引版本 {self._index_version} -> {index_version}，清空 {len(self._entries)} 条缓存回答')
+        self.clear()
+        self._index_version = index_version
+
+    def lookup(self, embedding: List[float]) -> Optional[CachedAnswer]:
+        """
+        查找与给定问题向量最相似的缓存回答
+
+        Args:
+            embedding: 新问题的嵌入向量
+
+        Returns:
+            命中时返回缓存的回答，否则返回 None
+        """
+        self._evict_expired()
+        if self._vectors is None:
+            self._misses += 1
+            return None
+
+        similarities = self._vectors @ self._normalize(embedding) # 余弦相似度
+        best = int(np.argmax(similarities))
+        similarity = float(similarities[best])
+        if similarity < self.threshold:
+            self._misses += 1
+            return None
+
+        self._hits += 1
+        entry = self._entries[best]
+        logger.info(f'语义缓存命中，相似度 {similarity:.4f}，原问题: {entry.query}')
+        return CachedAnswer(
+            query=entry.query,
+            response=entry.response,
+            citations=entry.citations,
+            created_at=entry.created_at,
+            similarity=similarity,
+        )
+
+    def add(
+        self,
+        query: str,
+        embedding: List[float],
+        response: str,
+        citations: Dict[int, List[str]],
+        index_version: Optional[str] = None,
+    ) -> None:
+        """
+        写入一条回答
+
+        Args:
+            query: 原始问题
+            embedding: 问题的嵌入向量
+            response: 回答
+            citations: 引用
+            index_version: 检索时的索引版本，与缓存当前版本不一致（生成期间索引已切换）时不写入
+        """
+        if index_version != self._index_version:
+            return
+        self._evict_expired()
+        vector = self._normalize(embedding)[np.newaxis, :]
+        self._entries.append(
+            CachedAnswer(query=query, response=response, citations=citations, created_at=time.time())
+        )
+        self._vectors = vector if self._vectors is None else np.vstack([self._vectors, vector])
+
+        overflow = len(self._entries) - self.max_entries
+        if overflow > 0: # 淘汰最早写入的条目
+            self._entries = self._entries[overflow:]
+            self._vectors = self._vectors[overflow:]
+
+    def clear(self) -> None:
+        """清空缓存"""
+        self._entries = []
+        self._vectors = None
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存命中统计"""
+        total = self._hits + self._misses
+        return {
+            "hits": self._hits,
+            "misses": self._misses,
+            "size": len(self._entries),
+            "hit_rate": self._hits / total if total else 0.0,
+        }
@@ -0,0 +1,156 @@
+# context_packer.py
+import logging
+from dataclasses import dataclass, field
+from typing import Callable, List, Optional, Set
+
+from llama_index.core import Settings
+from llama_index.core.schema import NodeWithScore
+
+from embedding_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class PackedContext:
+    """打包后的上下文"""
+    texts: List[str] = field(default_factory=list) # 按检索分数降序的上下文文本
+    node_ids: List[str] = field(default_factory=list) # 对应的节点ID
+    input_tokens: int = 0 # 打包前的总 token 数
+    output_tokens: int = 0 # 打包后的总 token 数（含块之间的分隔符）
+    num_duplicates: int = 0 # 因近似重复被丢弃的块数
+    num_truncated: int = 0 # 被截断的块数
+    num_dropped: int = 0 # 因超出预算被丢弃的块数
+
+
+class ContextPacker:
+    """
+    按 token 预算打包检索上下文
+
+    按检索分数从高到低依次放入上下文：与已选块字符 shingle 的 Jaccard 相似度
+    不低于阈值的近似重复块直接丢弃；与已选块首尾重叠的部分（切块时的 chunk_overlap）
+    被去掉；放不下时截断到剩余预算，剩余预算过少时丢弃。
+    调用方用 separator 拼接各块，分隔符的 token 数也计入预算（按单独分词近似）。
+    """
+
+    def __init__(
+        self,
+        token_budget: int = 2048,
+        dedup_threshold: float = 0.8,
+        shingle_size: int = 3,
+        min_overlap_chars: int = 20,
+        min_chunk_tokens: int = 64,
+        tokenizer: Optional[Callable[[str], List]] = None,
+        separator: str = "\n\n",
+    ):
+        """
+        Args:
+            token_budget: 上下文的 token 预算
+            dedup_threshold: 判定近似重复的 shingle Jaccard 相似度阈值
+            shingle_size: 字符 shingle 的长度
+            min_overlap_chars: 去除首尾重叠时的最短重叠字符数
+            min_chunk_tokens: 截断后至少保留的 token 数，剩余预算更少时直接丢弃该块
+            tokenizer: 分词函数，为 None 时使用 Settings.tokenizer
+            separator: 拼接各块时使用的分隔符
+        """
+        self.token_budget = token_budget
+        self.dedup_threshold = dedup_threshold
+        self.shingle_size = shingle_size
+        self.min_overlap_chars = min_overlap_chars
+        self.min_chunk_tokens = min_chunk_tokens
+        self._tokenizer = tokenizer
+        self.separator = separator
+
+    def count_tokens(self, text: str) -> int:
+        tokenizer = self._tokenizer or Settings.tokenizer
+        return len(tokenizer(text))
+
+    def _shingles(self, text: str) -> Set[str]:
+        text = normalize_text(text).replace(" ", "")
+        if len(text) <= self.shingle_size:
+            return {text}
+        return {text[i:i + self.shingle_size] for i in range(len(text) - self.shingle_size + 1)}
+
+    @staticmethod
+    def _jaccard(a: Set[str], b: Set[str]) -> float:
+        if not a or not b:
+            return 0.0
+        return len(a & b) / len(a | b)
+
+    def _strip_overlap(self, text: str, selected: List[str]) -> str:
+        """去掉与已选块首尾重叠的部分"""
+        for other in selected:
+            max_len = min(len(text), len(other)) - 1
+            for size in range(max_len, self.min_overlap_chars - 1, -1):
+                if other.endswith(text[:size]): # 已选块的结尾 == 当前块的开头
+                    text = text[size:]
+                    break
+                if other.startswith(text[-size:]): # 当前块的结尾 == 已选块的开头
+                    text = text[:-size]
+                    break
+        return text.strip()
+
+    def _truncate(self, text: str, max_tokens: int) -> str:
+        """二分查找不超过 max_tokens 的最长前缀"""
+        low, high = 0, len(text)
+        while low < high:
+            mid = (low + high + 1) // 2
+            if self.count_tokens(text[:mid]) <= max_tokens:
+                low = mid
+            else:
+                high = mid - 1
+        return text[:low]
+
+    def pack(self, nodes: List[NodeWithScore]) -> PackedContext:
+        """
+        打包检索到的节点
+
+        Args:
+            nodes: 检索结果（含分数）
+
+        Returns:
+            打包结果，texts 按检索分数降序
+        """
+        packed = PackedContext()
+        ranked = sorted(nodes, key=lambda node: node.score if node.score is not None else 0.0, reverse=True)
+        selected_shingles: List[Set[str]] = []
+        remaining = self.token_budget
+        separator_tokens = self.count_tokens(self.separator)
+
+        for node in ranked:
+            text = node.get_content().strip()
+            if not text:
+                continue
+            packed.input_tokens += self.count_tokens(text)
+
+            shingles = self._shingles(text)
+            if any(self._jaccard(shingles, other) >= self.dedup_threshold for other in selected_shingles):
+                packed.num_duplicates += 1
+                continue
+            text = self._strip_overlap(text, packed.texts)
+            if not text:
+                packed.num_duplicates += 1
+                continue
+
+            available = remaining - (separator_tokens if packed.texts else 0) # 第二块起前面有分隔符
+            tokens = self.count_tokens(text)
+            if tokens > available:
+                if available < self.min_chunk_tokens:
+                    packed.num_dropped += 1
+                    continue
+                text = self._truncate(text, available)
+                tokens = self.count_tokens(text)
+                packed.num_truncated += 1
+
+            tokens += remaining - available # 加上分隔符
+            packed.texts.append(text)
+            packed.node_ids.append(node.node.node_id)
+            selected_shingles.append(shingles)
+            packed.output_tokens += tokens
+            remaining -= tokens
+
+        logger.debug(
+            f"上下文打包: {packed.input_tokens} -> {packed.output_tokens} tokens, "
+            f"重复 {packed.num_duplicates}, 截断 {packed.num_truncated}, 丢弃 {packed.num_dropped}"
+        )
+        return packed
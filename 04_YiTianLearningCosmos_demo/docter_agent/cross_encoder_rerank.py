@@ -0,0 +1,121 @@
+# cross_encoder_rerank.py
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, List, Optional, Tuple
+
+from llama_index.core import QueryBundle
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.core.postprocessor.types import BaseNodePostprocessor
+from llama_index.core.schema import MetadataMode, NodeWithScore
+from sentence_transformers import CrossEncoder
+
+from embedding_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+
+class CrossEncoderRerank(BaseNodePostprocessor):
+    """
+    本地交叉编码器重排序（如 bge-reranker）
+
+    分批为 (问题, 节点) 对打分，并按 (问题哈希, 节点ID) 缓存分数，
+    替代每次都要调用大模型生成的 LLMRerank。
+    """
+
+    model: str = Field(description="交叉编码器模型路径")
+    top_n: int = Field(default=3, description="重排序后保留的节点数")
+    batch_size: int = Field(default=32, description="打分的批大小")
+    device: Optional[str] = Field(default=None, description="运行设备")
+    max_length: int = Field(default=512, description="问题+文本的最大 token 数")
+    cache_size: int = Field(default=4096, description="分数缓存的最大条目数")
+
+    _model: Any = PrivateAttr()
+    _cache: "OrderedDict[Tuple[str, str], float]" = PrivateAttr()
+    _lock: Any = PrivateAttr()
+
+    def __init__(
+        self,
+        model: str,
+        top_n: int = 3,
+        batch_size: int = 32,
+        device: Optional[str] = None,
+        max_length: int = 512,
+        cache_size: int = 4096,
+    ):
+        """
+        Args:
+            model: 交叉编码器模型路径
+            top_n: 重排序后保留的节点数
+            batch_size: 打分的批大小
+            device: 运行设备（如 'cuda:0', 'cpu'）
+            max_length: 问题+文本的最大 token 数
+            cache_size: 分数缓存的最大条目数，0 表示不缓存
+        """
+        super().__init__(
+            model=model,
+            top_n=top_n,
+            batch_size=batch_size,
+            device=device,
+            max_length=max_length,
+            cache_size=cache_size,
+        )
+        self._model = CrossEncoder(model, device=device, max_length=max_length)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        logger.info("==========交叉编码器重排序模型加载完成===========")
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CrossEncoderRerank"
+
+    def _cached_score(self, key: Tuple[str, str]) -> Optional[float]:
+        with self._lock:
+            score = self._cache.get(key)
+            if score is not None:
+                self._cache.move_to_end(key)
+            return score
+
+    def _store_score(self, key: Tuple[str, str], score: float) -> None:
+        if self.cache_size <= 0:
+            return
+        with self._lock:
+            self._cache[key] = score
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _postprocess_nodes(
+        self,
+        nodes: List[NodeWithScore],
+        query_bundle: Optional[QueryBundle] = None,
+    ) -> List[NodeWithScore]:
+        if query_bundle is None:
+            raise ValueError("交叉编码器重排序需要提供 query_bundle")
+        if not nodes:
+            return []
+
+        query = query_bundle.query_str
+        query_hash = hashlib.sha1(normalize_text(query).encode("utf-8")).hexdigest()
+        keys = [(query_hash, node.node.node_id) for node in nodes]
+        scores: List[Optional[float]] = [self._cached_score(key) for key in keys]
+
+        # 未缓存的 (问题, 节点) 对一次性分批打分
+        missing = [i for i, score in enumerate(scores) if score is None]
+        if missing:
+            pairs = [
+                (query, nodes[i].node.get_content(metadata_mode=MetadataMode.EMBED))
+                for i in missing
+            ]
+            new_scores = self._model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+            for i, score in zip(missing, new_scores):
+                scores[i] = float(score)
+                self._store_score(keys[i], scores[i])
+
+        reranked = sorted(
+            (NodeWithScore(node=node.node, score=score) for node, score in zip(nodes, scores)),
+            key=lambda node: node.score,
+            reverse=True,
+        )
+        return reranked[:self.top_n]
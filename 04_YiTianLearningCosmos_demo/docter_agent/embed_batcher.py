@@ -0,0 +1,118 @@
+# embed_batcher.py
+import asyncio
+import logging
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from llama_index.embeddings.huggingface.utils import (
+    get_query_instruct_for_model_name,
+    get_text_instruct_for_model_name,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def query_embedding_batch(embed_model: BaseEmbedding, queries: List[str]) -> List[Embedding]:
+    """
+    对一批查询做一次批量前向计算
+
+    Args:
+        embed_model: 嵌入模型
+        queries: 查询列表
+
+    Returns:
+        与 queries 一一对应的查询向量
+    """
+    if hasattr(embed_model, "get_query_embedding_batch"): # 缓存包装器等自带批量接口
+        return embed_model.get_query_embedding_batch(queries)
+    if isinstance(embed_model, HuggingFaceEmbedding):
+        # 与 HuggingFaceEmbedding 构造 SentenceTransformer prompts 时的取值一致
+        query_instruction = embed_model.query_instruction or get_query_instruct_for_model_name(embed_model.model_name)
+        text_instruction = embed_model.text_instruction or get_text_instruct_for_model_name(embed_model.model_name)
+        if not text_instruction: # 文档没有前缀时，加上查询前缀后走文本批量接口，结果与逐条查询嵌入相同
+            return embed_model.get_text_embedding_batch([query_instruction + query for query in queries])
+    return [embed_model.get_query_embedding(query) for query in queries]
+
+
+class EmbeddingMicroBatcher:
+    """
+    跨请求的查询嵌入微批处理器
+
+    并发到达的查询先在队列里等待 max_wait_ms 毫秒（或凑满 max_batch_size 条），
+    然后在线程池中做一次批量前向计算，再把各自的向量交还给调用方。
+    """
+
+    def __init__(
+        self,
+        embed_fn: Callable[[List[str]], List[Embedding]],
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        executor: Optional[Executor] = None,
+    ):
+        """
+        Args:
+            embed_fn: 批量计算查询向量的同步函数
+            max_batch_size: 单批最大查询数
+            max_wait_ms: 凑批的最长等待时间（毫秒）
+            executor: 执行批量计算的线程池，为 None 时使用事件循环默认线程池
+        """
+        self.embed_fn = embed_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.executor = executor
+
+        self._pending: List[Tuple[str, asyncio.Future]] = [] # 等待凑批的查询
+        self._flush_handle: Optional[asyncio.TimerHandle] = None # 定时触发的批处理
+        self._batches = 0
+        self._items = 0
+
+    async def embed(self, text: str) -> Embedding:
+        """提交一条查询并等待它的向量"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((text, future))
+
+        if len(self._pending) >= self.max_batch_size: # 凑满一批立即计算
+            self._flush(loop)
+        elif self._flush_handle is None: # 第一条查询启动计时
+            self._flush_handle = loop.call_later(self.max_wait_ms / 1000, self._flush, loop)
+        return await future
+
+    def _flush(self, loop: asyncio.AbstractEventLoop) -> None:
+        """把当前队列里的查询作为一批提交计算"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        batch = [(text, future) for text, future in batch if not future.done()] # 跳过已取消的调用方
+        if batch:
+            loop.create_task(self._run_batch(batch))
+
+    async def _run_batch(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        loop = asyncio.get_running_loop()
+        texts = [text for text, _ in batch]
+        try:
+            embeddings = await loop.run_in_executor(self.executor, self.embed_fn, texts)
+        except Exception as e:
+            logger.error(f'批量计算查询向量失败: {e}')
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        self._batches += 1
+        self._items += len(batch)
+        for (_, future), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(embedding)
+
+    def stats(self) -> Dict[str, Any]:
+        """批处理统计"""
+        return {
+            "batches": self._batches,
+            "items": self._items,
+            "avg_batch_size": self._items / self._batches if self._batches else 0.0,
+            "pending": len(self._pending),
+        }
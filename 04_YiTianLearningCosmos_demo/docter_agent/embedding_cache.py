@@ -0,0 +1,231 @@
+# embedding_cache.py
+import atexit
+import logging
+import os
+import re
+import tempfile
+import threading
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+
+from embed_batcher import query_embedding_batch
+
+logger = logging.getLogger(__name__)
+
+
+def normalize_text(text: str) -> str:
+    """规范化文本作为缓存键：全角转半角、合并空白、转小写"""
+    text = unicodedata.normalize("NFKC", text)
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.lower()
+
+
+class CachedEmbedding(BaseEmbedding):
+    """
+    带 LRU 缓存的嵌入模型包装器
+
+    以规范化后的文本为键缓存向量，超过容量时淘汰最久未使用的条目；
+    指定 persist_path 时会把缓存写入磁盘(.npz: 键列表 + float32 向量矩阵)，重启后继续使用。
+    写盘在后台线程中进行，不占用计算嵌入的请求线程。
+    """
+
+    max_size: int = Field(default=2048, description="缓存的最大条目数")
+    persist_path: Optional[str] = Field(default=None, description="缓存持久化文件路径")
+    persist_every: int = Field(default=32, description="新增多少条目后在后台写一次磁盘")
+
+    _inner: BaseEmbedding = PrivateAttr()
+    _cache: "OrderedDict[str, Embedding]" = PrivateAttr()
+    _lock: Any = PrivateAttr()
+    _hits: int = PrivateAttr(default=0)
+    _misses: int = PrivateAttr(default=0)
+    _dirty: int = PrivateAttr(default=0)
+    _persist_event: Any = PrivateAttr(default=None)
+    _save_lock: Any = PrivateAttr()
+
+    def __init__(
+        self,
+        embed_model: BaseEmbedding,
+        max_size: int = 2048,
+        persist_path: Optional[str] = None,
+        persist_every: int = 32,
+        **kwargs: Any,
+    ):
+        """
+        Args:
+            embed_model: 被包装的嵌入模型
+            max_size: 缓存的最大条目数
+            persist_path: 缓存持久化文件路径，为 None 时只缓存在内存中
+            persist_every: 新增多少条目后在后台写一次磁盘
+        """
+        super().__init__(
+            model_name=embed_model.model_name,
+            embed_batch_size=embed_model.embed_batch_size,
+            max_size=max_size,
+            persist_path=persist_path,
+            persist_every=persist_every,
+            **kwargs,
+        )
+        self._inner = embed_model
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock() # 后台写盘和退出时写盘不能同时进行
+
+        if persist_path:
+            self._load()
+            self._persist_event = threading.Event()
+            threading.Thread(target=self._persist_loop, name="embed-cache-persist", daemon=True).start()
+            atexit.register(self.save) # 进程退出时落盘
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "CachedEmbedding"
+
+    @property
+    def inner(self) -> BaseEmbedding:
+        """被包装的嵌入模型"""
+        return self._inner
+
+    # ---------- 缓存读写 ----------
+    @staticmethod
+    def _key(kind: str, text: str) -> str:
+        # 查询和文档的向量可能不同（如 bge 的查询指令），键里区分两者
+        return f"{kind}:{normalize_text(text)}"
+
+    def _lookup(self, key: str) -> Optional[Embedding]:
+        with self._lock:
+            embedding = self._cache.get(key)
+            if embedding is None:
+                self._misses += 1
+                return None
+            self._cache.move_to_end(key)
+            self._hits += 1
+            return embedding
+
+    def _store(self, key: str, embedding: Embedding) -> None:
+        with self._lock:
+            self._cache[key] = embedding
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.max_size:
+                self._cache.popitem(last=False) # 淘汰最久未使用的条目
+            self._dirty += 1
+            should_persist = self._persist_event is not None and self._dirty >= self.persist_every
+        if should_persist:
+            self._persist_event.set() # 由后台线程写盘
+
+    # ---------- BaseEmbedding 接口 ----------
+    def _get_query_embedding(self, query: str) -> Embedding:
+        key = self._key("query", query)
+        embedding = self._lookup(key)
+        if embedding is None:
+            embedding = self._inner.get_query_embedding(query)
+            self._store(key, embedding)
+        return embedding
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        key = self._key("query", query)
+        embedding = self._lookup(key)
+        if embedding is None:
+            embedding = await self._inner.aget_query_embedding(query)
+            self._store(key, embedding)
+        return embedding
+
+    def get_query_embedding_batch(self, queries: List[str]) -> List[Embedding]:
+        """批量获取查询向量，未命中的查询合并成一次前向计算"""
+        keys = [self._key("query", query) for query in queries]
+        results: List[Optional[Embedding]] = [self._lookup(key) for key in keys]
+
+        missing = [i for i, embedding in enumerate(results) if embedding is None]
+        if missing:
+            embeddings = query_embedding_batch(self._inner, [queries[i] for i in missing])
+            for i, embedding in zip(missing, embeddings):
+                results[i] = embedding
+                self._store(keys[i], embedding)
+        return results
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        key = self._key("text", text)
+        embedding = self._lookup(key)
+        if embedding is None:
+            embedding = self._inner.get_text_embedding(text)
+            self._store(key, embedding)
+        return embedding
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        keys = [self._key("text", text) for text in texts]
+        results: List[Optional[Embedding]] = [self._lookup(key) for key in keys]
+
+        # 未命中的文本合并成一个批次计算
+        missing = [i for i, embedding in enumerate(results) if embedding is None]
+        if missing:
+            embeddings = self._inner.get_text_embedding_batch([texts[i] for i in missing])
+            for i, embedding in zip(missing, embeddings):
+                results[i] = embedding
+                self._store(keys[i], embedding)
+        return results
+
+    # ---------- 持久化 ----------
+    def _load(self) -> None:
+        """从磁盘加载缓存，模型不一致时忽略"""
+        if not os.path.exists(self.persist_path):
+            return
+        try:
+            with np.load(self.persist_path, allow_pickle=False) as data:
+                if str(data["model_name"]) != str(self.model_name):
+                    logger.info("嵌入缓存对应的模型已变化，丢弃旧缓存")
+                    return
+                keys = data["keys"][-self.max_size:].tolist()
+                vectors = data["vectors"][-self.max_size:].tolist()
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"嵌入缓存文件读取失败，已忽略: {e}")
+            return
+        self._cache.update(zip(keys, vectors))
+        logger.info(f"已加载 {len(self._cache)} 条嵌入缓存")
+
+    def _persist_loop(self) -> None:
+        """后台写盘线程：新增条目达到 persist_every 时被唤醒"""
+        while True:
+            self._persist_event.wait()
+            self._persist_event.clear()
+            self.save()
+
+    def save(self) -> None:
+        """把缓存写入磁盘（先写临时文件再替换，避免写坏）"""
+        if not self.persist_path:
+            return
+        with self._lock: # 只复制引用，序列化在锁外进行
+            keys = list(self._cache.keys())
+            vectors = list(self._cache.values())
+            self._dirty = 0
+        if not keys:
+            return
+        directory = os.path.dirname(os.path.abspath(self.persist_path))
+        with self._save_lock:
+            try:
+                fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".tmp")
+                with os.fdopen(fd, "wb") as f:
+                    np.savez(
+                        f,
+                        model_name=np.array(str(self.model_name)),
+                        keys=np.array(keys),
+                        vectors=np.asarray(vectors, dtype=np.float32),
+                    )
+                os.replace(tmp_path, self.persist_path)
+            except OSError as e:
+                logger.warning(f"嵌入缓存写入失败: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """缓存命中统计"""
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "size": len(self._cache),
+                "max_size": self.max_size,
+                "hit_rate": self._hits / total if total else 0.0,
+            }
@@ -0,0 +1,241 @@
+# hybrid_retriever.py
+import json
+import logging
+import math
+import os
+import re
+from collections import Counter, defaultdict
+from typing import Dict, List, Optional, Tuple
+
+import jieba
+from llama_index.core import QueryBundle
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.schema import BaseNode, NodeWithScore
+from llama_index.core.storage.docstore.types import BaseDocumentStore
+from llama_index.core.storage.docstore import SimpleDocumentStore
+from llama_index.core.storage.index_store import SimpleIndexStore
+
+from embedding_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+BM25_INDEX_FILE = "bm25_index.json" # 稀疏倒排索引文件
+BM25_USER_DICT_FILE = "bm25_userdict.txt" # jieba 自定义词典（如"舌质淡胖"等中医术语），存在时自动加载
+
+_NON_WORD = re.compile(r"^[\W_]+$") # 纯标点/空白的词
+
+
+def tokenize(text: str) -> List[str]:
+    """中文分词（搜索引擎模式），去掉标点和空白"""
+    return [
+        token for token in jieba.lcut_for_search(normalize_text(text))
+        if token.strip() and not _NON_WORD.match(token)
+    ]
+
+
+def load_user_dict(storage_dir: str) -> None:
+    """加载 storage_dir 中的 jieba 自定义词典"""
+    path = os.path.join(storage_dir, BM25_USER_DICT_FILE)
+    if os.path.exists(path):
+        jieba.load_userdict(path)
+        logger.info(f"已加载自定义词典: {path}")
+
+
+class BM25Index:
+    """基于 BM25 打分的倒排索引"""
+
+    def __init__(
+        self,
+        node_ids: List[str],
+        doc_lens: List[int],
+        postings: Dict[str, List[Tuple[int, int]]],
+        k1: float = 1.5,
+        b: float = 0.75,
+    ):
+        """
+        Args:
+            node_ids: 文档序号到节点 ID 的映射
+            doc_lens: 每个文档的词数
+            postings: 倒排表 {词: [(文档序号, 词频), ...]}
+            k1: BM25 词频饱和参数
+            b: BM25 文档长度归一化参数
+        """
+        self.node_ids = node_ids
+        self.doc_lens = doc_lens
+        self.postings = postings
+        self.k1 = k1
+        self.b = b
+        self._refresh_stats()
+
+    def _refresh_stats(self) -> None:
+        """重新计算平均文档长度和各词的 idf"""
+        self.avgdl = sum(self.doc_lens) / len(self.doc_lens) if self.doc_lens else 0.0
+        num_docs = len(self.node_ids)
+        self._idf = {
+            term: math.log(1 + (num_docs - len(posting) + 0.5) / (len(posting) + 0.5))
+            for term, posting in self.postings.items()
+        }
+
+    @classmethod
+    def build(cls, node_ids: List[str], texts: List[str], **kwargs) -> "BM25Index":
+        """对一组节点文本分词并建立倒排索引"""
+        postings: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        doc_lens = []
+        for doc_idx, text in enumerate(texts):
+            counts = Counter(tokenize(text))
+            doc_lens.append(sum(counts.values()))
+            for term, tf in counts.items():
+                postings[term].append((doc_idx, tf))
+        return cls(list(node_ids), doc_lens, dict(postings), **kwargs)
+
+    def add(self, node_ids: List[str], texts: List[str]) -> int:
+        """
+        追加一批节点，只对新节点分词，已索引的节点ID跳过
+
+        Returns:
+            实际追加的节点数
+        """
+        indexed = set(self.node_ids)
+        added = 0
+        for node_id, text in zip(node_ids, texts):
+            if node_id in indexed:
+                continue
+            indexed.add(node_id)
+            doc_idx = len(self.node_ids)
+            counts = Counter(tokenize(text))
+            self.node_ids.append(node_id)
+            self.doc_lens.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings.setdefault(term, []).append((doc_idx, tf))
+            added += 1
+        self._refresh_stats() # idf 与 avgdl 依赖全部文档，只需遍历词表，不用重新分词
+        return added
+
+    def search(self, query: str, top_k: int = 10) -> List[Tuple[str, float]]:
+        """
+        BM25 检索
+
+        Returns:
+            按分数降序的 (节点ID, 分数) 列表
+        """
+        scores: Dict[int, float] = defaultdict(float)
+        for term in set(tokenize(query)):
+            posting = self.postings.get(term)
+            if not posting:
+                continue
+            idf = self._idf[term]
+            for doc_idx, tf in posting:
+                norm = self.k1 * (1 - self.b + self.b * self.doc_lens[doc_idx] / self.avgdl)
+                scores[doc_idx] += idf * tf * (self.k1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:top_k]
+        return [(self.node_ids[doc_idx], score) for doc_idx, score in ranked]
+
+    def save(self, path: str) -> None:
+        data = {
+            "k1": self.k1,
+            "b": self.b,
+            "node_ids": self.node_ids,
+            "doc_lens": self.doc_lens,
+            "postings": self.postings,
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path) # 写完再替换，正在加载的进程不会读到半个文件
+
+    @classmethod
+    def load(cls, path: str) -> "BM25Index":
+        if not os.path.exists(path):
+            raise FileNotFoundError(
+                f"找不到 {path}，请先运行: python index_tool.py build-bm25 --storage-dir {os.path.dirname(path)}"
+            )
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        postings = {term: [tuple(p) for p in posting] for term, posting in data["postings"].items()}
+        return cls(data["node_ids"], data["doc_lens"], postings, k1=data["k1"], b=data["b"])
+
+
+def build_bm25_index(storage_dir: str, docstore: Optional[BaseDocumentStore] = None) -> str:
+    """
+    对向量索引中的全部节点离线构建 BM25 索引
+
+    Args:
+        storage_dir: 向量索引存储目录
+        docstore: 节点所在的 docstore，为 None 时读取 storage_dir 中的 docstore.json
+
+    Returns:
+        BM25 索引文件路径
+    """
+    load_user_dict(storage_dir)
+    index_struct = SimpleIndexStore.from_persist_dir(storage_dir).index_structs()[0]
+    docstore = docstore or SimpleDocumentStore.from_persist_dir(storage_dir)
+
+    node_ids = list(dict.fromkeys(index_struct.nodes_dict.values())) # 只索引向量库中的节点，保持顺序去重
+    nodes: List[BaseNode] = docstore.get_nodes(node_ids)
+    bm25 = BM25Index.build(node_ids, [node.get_content() for node in nodes])
+
+    path = os.path.join(storage_dir, BM25_INDEX_FILE)
+    bm25.save(path)
+    logger.info(f"已写入 BM25 索引: {path} ({len(node_ids)} 个节点, {len(bm25.postings)} 个词)")
+    return path
+
+
+class HybridRetriever(BaseRetriever):
+    """
+    稀疏 + 稠密混合检索器
+
+    BM25 与向量检索各取候选，再用倒数排序融合(RRF)合并，
+    精确的症状术语能由 BM25 补召回。
+    """
+
+    def __init__(
+        self,
+        vector_retriever: BaseRetriever,
+        bm25_index: BM25Index,
+        docstore: BaseDocumentStore,
+        similarity_top_k: int = 3,
+        sparse_top_k: int = 10,
+        rrf_k: int = 60,
+    ):
+        """
+        Args:
+            vector_retriever: 向量检索器
+            bm25_index: BM25 索引
+            docstore: 读取 BM25 召回节点的 docstore
+            similarity_top_k: 融合后返回的节点数
+            sparse_top_k: BM25 候选数
+            rrf_k: RRF 平滑常数
+        """
+        super().__init__()
+        self._vector_retriever = vector_retriever
+        self._bm25_index = bm25_index
+        self._docstore = docstore
+        self._similarity_top_k = similarity_top_k
+        self._sparse_top_k = sparse_top_k
+        self._rrf_k = rrf_k
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        dense = self._vector_retriever.retrieve(query_bundle)
+        sparse = self._bm25_index.search(query_bundle.query_str, top_k=self._sparse_top_k)
+
+        scores: Dict[str, float] = defaultdict(float)
+        nodes: Dict[str, BaseNode] = {}
+        for rank, node_with_score in enumerate(dense):
+            node_id = node_with_score.node.node_id
+            scores[node_id] += 1.0 / (self._rrf_k + rank + 1)
+            nodes[node_id] = node_with_score.node
+        for rank, (node_id, _) in enumerate(sparse):
+            scores[node_id] += 1.0 / (self._rrf_k + rank + 1)
+
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)[:self._similarity_top_k]
+        missing = [node_id for node_id, _ in ranked if node_id not in nodes] # 只有 BM25 召回的节点
+        if missing:
+            for node in self._docstore.get_nodes(missing, raise_error=False):
+                if node is not None:
+                    nodes[node.node_id] = node
+
+        return [
+            NodeWithScore(node=nodes[node_id], score=score)
+            for node_id, score in ranked
+            if node_id in nodes
+        ]
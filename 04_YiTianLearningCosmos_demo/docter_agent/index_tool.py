@@ -0,0 +1,287 @@
+# index_tool.py
+import json
+import logging
+import math
+import os
+import time
+from typing import Any, Dict, Optional
+
+import click
+import faiss
+import numpy as np
+
+from lazy_docstore import export_docstore
+
+logger = logging.getLogger(__name__)
+
+INDEX_TYPES = ("flat", "ivf_flat", "hnsw", "ivf_pq", "sq_fp16", "sq_int8") # 支持的索引类型
+SCALAR_QUANTIZERS = { # 标量量化的精确检索：每维 2 字节 / 1 字节，内存为 float32 的 1/2、1/4
+    "sq_fp16": faiss.ScalarQuantizer.QT_fp16,
+    "sq_int8": faiss.ScalarQuantizer.QT_8bit,
+}
+FLAT_INDEX_FILE = "default__vector_store.json" # FaissVectorStore 默认的持久化文件(内容是二进制 faiss 索引)
+
+
+def index_file(storage_dir: str, index_type: str = "flat") -> str:
+    """获取某种索引类型在 storage_dir 中的文件路径"""
+    if index_type not in INDEX_TYPES:
+        raise ValueError(f"不支持的索引类型: {index_type}, 可选: {INDEX_TYPES}")
+    if index_type == "flat":
+        return os.path.join(storage_dir, FLAT_INDEX_FILE)
+    return os.path.join(storage_dir, f"faiss_{index_type}.index")
+
+
+def read_vectors(index: faiss.Index) -> np.ndarray:
+    """取出索引中的全部向量（按 faiss id 顺序）"""
+    return index.reconstruct_n(0, index.ntotal)
+
+
+def default_nlist(num_vectors: int) -> int:
+    """IVF 聚类中心数的经验值：约 4*sqrt(n)，并保证每个中心有足够的训练样本"""
+    nlist = int(4 * math.sqrt(num_vectors))
+    return max(1, min(nlist, num_vectors // 39 or 1, 65536))
+
+
+def build_index(
+    vectors: np.ndarray,
+    index_type: str,
+    metric_type: int = faiss.METRIC_L2,
+    nlist: Optional[int] = None,
+    pq_m: int = 16,
+    pq_bits: int = 8,
+    hnsw_m: int = 32,
+    ef_construction: int = 200,
+) -> faiss.Index:
+    """
+    用给定向量构建指定类型的索引，向量的 faiss id 与输入顺序一致
+
+    Args:
+        vectors: 形状为 (n, d) 的 float32 向量
+        index_type: 索引类型，见 INDEX_TYPES
+        metric_type: 距离度量，需与原索引保持一致
+        nlist: IVF 聚类中心数，为 None 时按数据量自动选择
+        pq_m: IVF-PQ 的子空间个数（需整除向量维度）
+        pq_bits: IVF-PQ 每个子空间的编码位数
+        hnsw_m: HNSW 每个节点的邻居数
+        ef_construction: HNSW 建图时的搜索宽度
+
+    Returns:
+        构建好的 faiss 索引
+    """
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    num_vectors, dim = vectors.shape
+
+    if index_type == "flat":
+        index = faiss.IndexFlat(dim, metric_type)
+    elif index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, hnsw_m, metric_type)
+        index.hnsw.efConstruction = ef_construction
+    elif index_type in ("ivf_flat", "ivf_pq"):
+        nlist = nlist or default_nlist(num_vectors)
+        quantizer = faiss.IndexFlat(dim, metric_type)
+        if index_type == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dim, nlist, metric_type)
+        else:
+            if dim % pq_m != 0:
+                raise ValueError(f"向量维度 {dim} 不能被 pq_m={pq_m} 整除")
+            index = faiss.IndexIVFPQ(quantizer, dim, nlist, pq_m, pq_bits, metric_type)
+        logger.info(f"训练 {index_type} 索引: n={num_vectors}, nlist={nlist}")
+        index.train(vectors)
+    elif index_type in SCALAR_QUANTIZERS:
+        index = faiss.IndexScalarQuantizer(dim, SCALAR_QUANTIZERS[index_type], metric_type)
+        index.train(vectors) # int8 需要统计每维的取值范围，fp16 无需训练
+    else:
+        raise ValueError(f"不支持的索引类型: {index_type}, 可选: {INDEX_TYPES}")
+
+    index.add(vectors)
+    return index
+
+
+def tune_index(index: faiss.Index, nprobe: Optional[int] = None, ef_search: Optional[int] = None) -> faiss.Index:
+    """
+    设置查询参数
+
+    Args:
+        index: faiss 索引
+        nprobe: IVF 类索引每次查询扫描的聚类数
+        ef_search: HNSW 查询时的搜索宽度
+    """
+    ivf = faiss.try_extract_index_ivf(index)
+    if ivf is not None and nprobe:
+        ivf.nprobe = min(nprobe, ivf.nlist)
+    if isinstance(index, faiss.IndexHNSW) and ef_search:
+        index.hnsw.efSearch = ef_search
+    return index
+
+
+def load_faiss_index(
+    storage_dir: str,
+    index_type: str = "flat",
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    mmap: bool = False,
+) -> faiss.Index:
+    """
+    从 storage_dir 读取指定类型的索引并设置查询参数
+
+    Args:
+        storage_dir: 向量索引存储目录
+        index_type: 索引类型
+        nprobe: IVF 类索引每次查询扫描的聚类数
+        ef_search: HNSW 查询时的搜索宽度
+        mmap: 是否以只读内存映射方式加载，多个进程可共享页缓存
+    """
+    path = index_file(storage_dir, index_type)
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f"找不到 {index_type} 索引文件 {path}，请先运行: python index_tool.py convert --storage-dir {storage_dir} --index-type {index_type}"
+        )
+    io_flags = 0
+    if mmap: # IO_FLAG_MMAP_IFC 让 flat 编码也走内存映射(较新的 faiss 才有)
+        io_flags = faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+    return tune_index(faiss.read_index(path, io_flags), nprobe=nprobe, ef_search=ef_search)
+
+
+def convert_index(storage_dir: str, index_type: str, **build_kwargs: Any) -> str:
+    """
+    把 storage_dir 中的精确(flat)索引转换为指定类型，写在同一目录下
+
+    Args:
+        storage_dir: 向量索引存储目录
+        index_type: 目标索引类型
+        build_kwargs: 传给 build_index 的构建参数
+
+    Returns:
+        新索引的文件路径
+    """
+    flat_index = faiss.read_index(index_file(storage_dir, "flat"))
+    vectors = read_vectors(flat_index)
+    index = build_index(vectors, index_type, metric_type=flat_index.metric_type, **build_kwargs)
+
+    path = index_file(storage_dir, index_type)
+    faiss.write_index(index, path)
+    logger.info(f"已写入 {index_type} 索引: {path} ({index.ntotal} 条向量)")
+    return path
+
+
+def sample_queries(vectors: np.ndarray, num_queries: int, noise: float = 0.05, seed: int = 0) -> np.ndarray:
+    """从库内向量中抽样并加扰动，作为评测查询"""
+    rng = np.random.default_rng(seed)
+    picked = rng.choice(len(vectors), size=min(num_queries, len(vectors)), replace=False)
+    queries = vectors[picked] + rng.normal(scale=noise, size=(len(picked), vectors.shape[1]))
+    queries /= np.linalg.norm(queries, axis=1, keepdims=True) # bge 向量是归一化的
+    return queries.astype(np.float32)
+
+
+def recall_at_k(exact_ids: np.ndarray, approx_ids: np.ndarray, k: int) -> float:
+    """近似索引 top-k 中命中精确 top-k 的比例"""
+    hits = sum(len(set(e[:k]) & set(a[:k]) - {-1}) for e, a in zip(exact_ids, approx_ids))
+    return hits / (len(exact_ids) * k)
+
+
+def evaluate_recall(
+    storage_dir: str,
+    index_type: str,
+    k: int = 10,
+    num_queries: int = 200,
+    nprobe: Optional[int] = None,
+    ef_search: Optional[int] = None,
+    seed: int = 0,
+) -> Dict[str, Any]:
+    """
+    以精确索引为基准评估近似/量化索引的召回率、查询耗时和内存占用
+
+    Returns:
+        包含 recall@k、召回损失、平均查询耗时和索引大小的字典
+    """
+    flat_index = faiss.read_index(index_file(storage_dir, "flat"))
+    approx_index = load_faiss_index(storage_dir, index_type, nprobe=nprobe, ef_search=ef_search)
+    queries = sample_queries(read_vectors(flat_index), num_queries, seed=seed)
+
+    start = time.perf_counter()
+    _, exact_ids = flat_index.search(queries, k)
+    exact_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    start = time.perf_counter()
+    _, approx_ids = approx_index.search(queries, k)
+    approx_ms = (time.perf_counter() - start) * 1000 / len(queries)
+
+    recall = recall_at_k(exact_ids, approx_ids, k)
+    flat_bytes = os.path.getsize(index_file(storage_dir, "flat")) # faiss 索引加载后的常驻内存约等于文件大小
+    index_bytes = os.path.getsize(index_file(storage_dir, index_type))
+    return {
+        "index_type": index_type,
+        "ntotal": int(flat_index.ntotal),
+        "k": k,
+        "num_queries": len(queries),
+        "nprobe": nprobe,
+        "ef_search": ef_search,
+        f"recall@{k}": recall,
+        "recall_loss": 1.0 - recall,
+        "exact_ms_per_query": exact_ms,
+        "approx_ms_per_query": approx_ms,
+        "flat_bytes": flat_bytes,
+        "index_bytes": index_bytes,
+        "memory_saved_ratio": 1.0 - index_bytes / flat_bytes,
+    }
+
+
+@click.group()
+def cli():
+    """FAISS 向量索引的构建/转换工具"""
+    logging.basicConfig(level=logging.INFO)
+
+
+@cli.command()
+@click.option('--storage-dir', required=True, help='向量索引存储目录')
+@click.option('--index-type', type=click.Choice(INDEX_TYPES[1:]), required=True, help='目标索引类型')
+@click.option('--nlist', type=int, default=None, help='IVF 聚类中心数')
+@click.option('--pq-m', type=int, default=16, help='IVF-PQ 子空间个数')
+@click.option('--pq-bits', type=int, default=8, help='IVF-PQ 编码位数')
+@click.option('--hnsw-m', type=int, default=32, help='HNSW 邻居数')
+@click.option('--ef-construction', type=int, default=200, help='HNSW 建图搜索宽度')
+def convert(storage_dir, index_type, nlist, pq_m, pq_bits, hnsw_m, ef_construction):
+    """把精确索引转换为近似索引或标量量化索引(sq_fp16 / sq_int8)"""
+    convert_index(
+        storage_dir,
+        index_type,
+        nlist=nlist,
+        pq_m=pq_m,
+        pq_bits=pq_bits,
+        hnsw_m=hnsw_m,
+        ef_construction=ef_construction,
+    )
+
+
+@cli.command()
+@click.option('--storage-dir', required=True, help='向量索引存储目录')
+@click.option('--index-type', type=click.Choice(INDEX_TYPES[1:]), required=True, help='被评估的索引类型')
+@click.option('--k', type=int, default=10, help='评估 recall@k')
+@click.option('--num-queries', type=int, default=200, help='评测查询数')
+@click.option('--nprobe', type=int, default=None, help='IVF 查询扫描的聚类数')
+@click.option('--ef-search', type=int, default=None, help='HNSW 查询搜索宽度')
+def evaluate(storage_dir, index_type, k, num_queries, nprobe, ef_search):
+    """评估近似/量化索引相对精确索引的召回率和节省的内存"""
+    report = evaluate_recall(
+        storage_dir, index_type, k=k, num_queries=num_queries, nprobe=nprobe, ef_search=ef_search
+    )
+    click.echo(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+@cli.command('export-docstore')
+@click.option('--storage-dir', required=True, help='向量索引存储目录')
+def export_docstore_command(storage_dir):
+    """把 docstore.json 导出为按需读取的 docstore.sqlite"""
+    click.echo(export_docstore(storage_dir))
+
+
+@cli.command('build-bm25')
+@click.option('--storage-dir', required=True, help='向量索引存储目录')
+def build_bm25_command(storage_dir):
+    """对向量索引中的节点离线构建 BM25 倒排索引"""
+    from hybrid_retriever import build_bm25_index # 只有这个命令需要 jieba
+    click.echo(build_bm25_index(storage_dir))
+
+
+if __name__ == '__main__':
+    cli()
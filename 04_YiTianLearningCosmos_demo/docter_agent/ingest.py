@@ -0,0 +1,320 @@
+# ingest.py
+import contextlib
+import itertools
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterator, List, Optional
+
+import click
+import faiss
+import numpy as np
+from llama_index.core import SimpleDirectoryReader
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.ingestion import IngestionPipeline
+from llama_index.core.node_parser import SentenceSplitter
+from llama_index.core.schema import BaseNode, MetadataMode
+from llama_index.core.storage.docstore import SimpleDocumentStore
+from llama_index.core.storage.docstore.utils import doc_to_json, json_to_doc
+from llama_index.core.storage.index_store import SimpleIndexStore
+from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+from index_tool import INDEX_TYPES, index_file, read_vectors
+from lazy_docstore import DOCSTORE_JSON_FILE, DOCSTORE_SQLITE_FILE, add_nodes
+
+logger = logging.getLogger(__name__)
+
+DELTA_DIR = "delta" # 待合并的增量数据目录
+DELTA_INDEX_FILE = "delta.index" # 增量向量(faiss flat 索引)
+DELTA_NODES_FILE = "nodes.jsonl" # 增量节点，每行一个，顺序与增量向量一致
+INDEX_STORE_FILE = "index_store.json"
+INDEX_VERSION_FILE = "index_version" # 每次合并后更新，运行中的引擎据此热切换
+LOCK_FILE = "ingest.lock"
+
+
+def read_index_version(storage_dir: str) -> Optional[str]:
+    """读取索引版本号，从未合并过时返回 None"""
+    path = os.path.join(storage_dir, INDEX_VERSION_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return f.read().strip()
+
+
+@contextlib.contextmanager
+def storage_lock(storage_dir: str, timeout: float = 600.0) -> Iterator[None]:
+    """
+    跨进程的存储目录锁（基于独占创建锁文件，Windows/Linux 通用）
+
+    进程异常退出时锁文件可能残留，需要手动删除 storage_dir/ingest.lock
+    """
+    path = os.path.join(storage_dir, LOCK_FILE)
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            break
+        except FileExistsError:
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"等待存储目录锁超时: {path}")
+            time.sleep(0.2)
+    try:
+        os.write(fd, str(os.getpid()).encode())
+        os.close(fd)
+        yield
+    finally:
+        os.remove(path)
+
+
+def _atomic_write_index(index: faiss.Index, path: str) -> None:
+    tmp_path = path + ".tmp"
+    faiss.write_index(index, tmp_path)
+    os.replace(tmp_path, path)
+
+
+def _atomic_write_text(path: str, text: str) -> None:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path) # 读到的要么是旧版本号，要么是完整的新版本号
+
+
+def _truncate_lines(path: str, count: int) -> None:
+    """只保留文件的前 count 行"""
+    if not os.path.exists(path):
+        return
+    with open(path, "r+b") as f:
+        for _ in range(count):
+            if not f.readline():
+                break
+        f.truncate()
+
+
+def _atomic_persist(store, storage_dir: str, file_name: str) -> None:
+    """把 docstore/index_store 先写到临时目录，再替换正式文件"""
+    with tempfile.TemporaryDirectory(dir=storage_dir) as tmp_dir:
+        tmp_path = os.path.join(tmp_dir, file_name)
+        store.persist(persist_path=tmp_path)
+        os.replace(tmp_path, os.path.join(storage_dir, file_name))
+
+
+class IncrementalIngestor:
+    """
+    向已持久化的 FAISS 存储增量写入文档
+
+    ingest() 负责并行切块、嵌入并追加到 delta 目录；
+    merge() 把 delta 合并进主索引（含已转换的近似索引、BM25 与 SQLite docstore），
+    完成后更新 index_version，运行中的 RAGQueryEngine 可据此热切换。
+    近似索引、SQLite docstore 和 BM25 只追加新节点，不重新导出或重新分词全部语料。
+    """
+
+    def __init__(
+        self,
+        storage_dir: str,
+        embed_model: BaseEmbedding,
+        chunk_size: int = 512,
+        chunk_overlap: int = 64,
+        num_workers: int = 4,
+        embed_batch_size: int = 32,
+    ):
+        """
+        Args:
+            storage_dir: 向量索引存储目录
+            embed_model: 嵌入模型，必须与建库时使用的模型一致
+            chunk_size: 切块大小（token）
+            chunk_overlap: 相邻块重叠的 token 数
+            num_workers: 并行读取/切块/嵌入的工作数
+            embed_batch_size: 每个嵌入批次的文本数
+        """
+        self.storage_dir = storage_dir
+        self.embed_model = embed_model
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.num_workers = num_workers
+        self.embed_batch_size = embed_batch_size
+        self.delta_dir = os.path.join(storage_dir, DELTA_DIR)
+        self._merge_thread: Optional[threading.Thread] = None
+
+    # ---------- 写入增量 ----------
+    def ingest(self, paths: List[str]) -> int:
+        """
+        切块、嵌入并追加到增量索引
+
+        Args:
+            paths: 文件或目录路径列表
+
+        Returns:
+            新增节点数
+        """
+        input_files = []
+        for path in paths:
+            if os.path.isdir(path):
+                input_files.extend(SimpleDirectoryReader(input_dir=path, recursive=True).input_files)
+            else:
+                input_files.append(path)
+        documents = SimpleDirectoryReader(input_files=input_files).load_data(num_workers=self.num_workers)
+
+        pipeline = IngestionPipeline(
+            transformations=[SentenceSplitter(chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap)]
+        )
+        nodes = pipeline.run(documents=documents, num_workers=self.num_workers) # 多进程切块
+        if not nodes:
+            return 0
+
+        vectors = self._embed_parallel([node.get_content(metadata_mode=MetadataMode.EMBED) for node in nodes])
+        with storage_lock(self.storage_dir):
+            self._append_delta(nodes, vectors)
+        logger.info(f"已写入增量: {len(documents)} 个文档, {len(nodes)} 个节点")
+        return len(nodes)
+
+    def _embed_parallel(self, texts: List[str]) -> np.ndarray:
+        """按批并行计算文本向量"""
+        batches = [texts[i:i + self.embed_batch_size] for i in range(0, len(texts), self.embed_batch_size)]
+        with ThreadPoolExecutor(max_workers=self.num_workers) as executor:
+            results = list(executor.map(self.embed_model.get_text_embedding_batch, batches))
+        return np.asarray([vector for batch in results for vector in batch], dtype=np.float32)
+
+    def _append_delta(self, nodes: List[BaseNode], vectors: np.ndarray) -> None:
+        os.makedirs(self.delta_dir, exist_ok=True)
+        delta_index_path = os.path.join(self.delta_dir, DELTA_INDEX_FILE)
+        if os.path.exists(delta_index_path):
+            delta_index = faiss.read_index(delta_index_path)
+        else: # 与主索引的维度和度量保持一致
+            main_index = faiss.read_index(
+                index_file(self.storage_dir, "flat"), faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY
+            )
+            delta_index = faiss.IndexFlat(main_index.d, main_index.metric_type)
+
+        # 增量向量的原子替换是提交点：节点先追加，向量后写入。
+        # 上次写入在两者之间中断时，节点文件会多出没有向量的行，追加前先截掉
+        nodes_path = os.path.join(self.delta_dir, DELTA_NODES_FILE)
+        _truncate_lines(nodes_path, delta_index.ntotal)
+        delta_index.add(vectors)
+
+        with open(nodes_path, "a", encoding="utf-8") as f:
+            for node in nodes:
+                node = node.model_copy()
+                node.embedding = None
+                f.write(json.dumps(doc_to_json(node), ensure_ascii=False) + "\n")
+        _atomic_write_index(delta_index, delta_index_path)
+
+    def _read_delta(self) -> tuple[List[BaseNode], Optional[np.ndarray]]:
+        delta_index_path = os.path.join(self.delta_dir, DELTA_INDEX_FILE)
+        if not os.path.exists(delta_index_path):
+            return [], None
+        vectors = read_vectors(faiss.read_index(delta_index_path))
+        with open(os.path.join(self.delta_dir, DELTA_NODES_FILE), "r", encoding="utf-8") as f:
+            lines = list(itertools.islice(f, len(vectors))) # 多出的行是中断的写入，没有对应向量
+        nodes = [json_to_doc(json.loads(line)) for line in lines]
+        if len(nodes) != len(vectors):
+            raise RuntimeError(f"增量数据不一致: {len(nodes)} 个节点, {len(vectors)} 条向量")
+        return nodes, vectors
+
+    # ---------- 合并 ----------
+    def merge(self, on_merged: Optional[Callable[[str], None]] = None) -> int:
+        """
+        把增量合并进主索引
+
+        Args:
+            on_merged: 合并完成后的回调，参数为新的索引版本号
+
+        Returns:
+            合并的节点数
+        """
+        with storage_lock(self.storage_dir):
+            nodes, vectors = self._read_delta()
+            if not nodes:
+                return 0
+
+            flat_index = faiss.read_index(index_file(self.storage_dir, "flat"))
+            docstore = SimpleDocumentStore.from_persist_dir(self.storage_dir)
+            index_store = SimpleIndexStore.from_persist_dir(self.storage_dir)
+            index_struct = index_store.index_structs()[0]
+
+            start_id = flat_index.ntotal
+            flat_index.add(vectors)
+            for offset, node in enumerate(nodes):
+                index_struct.add_node(node, text_id=str(start_id + offset)) # faiss id -> 节点ID
+            docstore.add_documents(nodes, allow_update=True)
+            index_store.add_index_struct(index_struct)
+
+            # 先写节点和映射，最后写向量，读到新向量时一定能找到对应节点
+            _atomic_persist(docstore, self.storage_dir, DOCSTORE_JSON_FILE)
+            if os.path.exists(os.path.join(self.storage_dir, DOCSTORE_SQLITE_FILE)):
+                add_nodes(self.storage_dir, nodes)
+            _atomic_persist(index_store, self.storage_dir, INDEX_STORE_FILE)
+            _atomic_write_index(flat_index, index_file(self.storage_dir, "flat"))
+            self._update_sidecars(nodes, vectors)
+
+            shutil.rmtree(self.delta_dir)
+            version = str(time.time_ns())
+            _atomic_write_text(os.path.join(self.storage_dir, INDEX_VERSION_FILE), version)
+
+        logger.info(f"已合并 {len(nodes)} 个节点, 索引版本 {version}")
+        if on_merged is not None:
+            on_merged(version)
+        return len(nodes)
+
+    def _update_sidecars(self, nodes: List[BaseNode], vectors: np.ndarray) -> None:
+        """向已存在的近似索引和 BM25 索引追加新节点"""
+        for index_type in INDEX_TYPES[1:]:
+            path = index_file(self.storage_dir, index_type)
+            if os.path.exists(path): # 已训练的 IVF/HNSW 可直接追加向量
+                ann_index = faiss.read_index(path)
+                ann_index.add(vectors)
+                _atomic_write_index(ann_index, path)
+        from hybrid_retriever import BM25_INDEX_FILE, BM25Index, load_user_dict # 合并时才需要 jieba
+        bm25_path = os.path.join(self.storage_dir, BM25_INDEX_FILE)
+        if os.path.exists(bm25_path): # 只对新节点分词
+            load_user_dict(self.storage_dir)
+            bm25 = BM25Index.load(bm25_path)
+            bm25.add([node.node_id for node in nodes], [node.get_content() for node in nodes])
+            bm25.save(bm25_path)
+
+    def start_background_merge(self, on_merged: Optional[Callable[[str], None]] = None) -> threading.Thread:
+        """在后台线程中合并增量，已有合并在进行时直接返回该线程"""
+        if self._merge_thread is not None and self._merge_thread.is_alive():
+            return self._merge_thread
+
+        def _run():
+            try:
+                self.merge(on_merged=on_merged)
+            except Exception as e:
+                logger.error(f"后台合并增量失败: {e}")
+
+        self._merge_thread = threading.Thread(target=_run, name="ingest-merge", daemon=True)
+        self._merge_thread.start()
+        return self._merge_thread
+
+
+@click.command()
+@click.option('--storage-dir', required=True, help='向量索引存储目录')
+@click.option('--embed-path', required=True, help='本地嵌入模型路径(与建库时一致)')
+@click.option('--chunk-size', type=int, default=512, help='切块大小')
+@click.option('--chunk-overlap', type=int, default=64, help='相邻块重叠大小')
+@click.option('--num-workers', type=int, default=4, help='并行工作数')
+@click.option('--merge/--no-merge', default=True, help='写入增量后是否立即合并进主索引')
+@click.argument('paths', nargs=-1)
+def main(storage_dir, embed_path, chunk_size, chunk_overlap, num_workers, merge, paths):
+    """向医学知识库增量添加文档"""
+    logging.basicConfig(level=logging.INFO)
+    ingestor = IncrementalIngestor(
+        storage_dir,
+        HuggingFaceEmbedding(model_name=embed_path),
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        num_workers=num_workers,
+    )
+    if paths:
+        ingestor.ingest(list(paths))
+    if merge:
+        ingestor.merge()
+
+
+if __name__ == '__main__':
+    main()
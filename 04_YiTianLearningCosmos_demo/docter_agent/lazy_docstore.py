@@ -0,0 +1,148 @@
+# lazy_docstore.py
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from llama_index.core.schema import BaseNode
+from llama_index.core.storage.docstore.keyval_docstore import KVDocumentStore
+from llama_index.core.storage.kvstore.types import DEFAULT_COLLECTION, BaseKVStore
+
+logger = logging.getLogger(__name__)
+
+DOCSTORE_JSON_FILE = "docstore.json" # SimpleDocumentStore 的持久化文件
+DOCSTORE_SQLITE_FILE = "docstore.sqlite" # 按需读取的 docstore 文件
+
+
+class SQLiteKVStore(BaseKVStore):
+    """
+    基于 SQLite 的键值存储
+
+    每次只按键读取需要的记录，不会把整个 docstore 读入内存；
+    多个进程打开同一文件时共享操作系统的页缓存。
+    """
+
+    def __init__(self, db_path: str, read_only: bool = True):
+        """
+        Args:
+            db_path: SQLite 文件路径
+            read_only: 是否以只读方式打开
+        """
+        self.db_path = db_path
+        self.read_only = read_only
+        self._local = threading.local() # 每个线程一个连接
+
+        if read_only and not os.path.exists(db_path):
+            raise FileNotFoundError(
+                f"找不到 {db_path}，请先运行: python index_tool.py export-docstore --storage-dir {os.path.dirname(db_path)}"
+            )
+        if not read_only:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS kv ("
+                "collection TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL, "
+                "PRIMARY KEY (collection, key)) WITHOUT ROWID"
+            )
+            self._conn.commit()
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            if self.read_only:
+                conn = sqlite3.connect(f"file:{self.db_path}?mode=ro", uri=True, check_same_thread=False)
+            else:
+                conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._local.conn = conn
+        return conn
+
+    def put(self, key: str, val: dict, collection: str = DEFAULT_COLLECTION) -> None:
+        self.put_all([(key, val)], collection=collection)
+
+    async def aput(self, key: str, val: dict, collection: str = DEFAULT_COLLECTION) -> None:
+        self.put(key, val, collection=collection)
+
+    def put_all(
+        self,
+        kv_pairs: List[Tuple[str, dict]],
+        collection: str = DEFAULT_COLLECTION,
+        batch_size: int = 1,
+    ) -> None:
+        self._conn.executemany(
+            "INSERT OR REPLACE INTO kv (collection, key, value) VALUES (?, ?, ?)",
+            [(collection, key, json.dumps(val, ensure_ascii=False)) for key, val in kv_pairs],
+        )
+        self._conn.commit()
+
+    def get(self, key: str, collection: str = DEFAULT_COLLECTION) -> Optional[dict]:
+        row = self._conn.execute(
+            "SELECT value FROM kv WHERE collection = ? AND key = ?", (collection, key)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    async def aget(self, key: str, collection: str = DEFAULT_COLLECTION) -> Optional[dict]:
+        return self.get(key, collection=collection)
+
+    def get_all(self, collection: str = DEFAULT_COLLECTION) -> Dict[str, dict]:
+        rows = self._conn.execute(
+            "SELECT key, value FROM kv WHERE collection = ?", (collection,)
+        ).fetchall()
+        return {key: json.loads(value) for key, value in rows}
+
+    async def aget_all(self, collection: str = DEFAULT_COLLECTION) -> Dict[str, dict]:
+        return self.get_all(collection=collection)
+
+    def delete(self, key: str, collection: str = DEFAULT_COLLECTION) -> bool:
+        cursor = self._conn.execute(
+            "DELETE FROM kv WHERE collection = ? AND key = ?", (collection, key)
+        )
+        self._conn.commit()
+        return cursor.rowcount > 0
+
+    async def adelete(self, key: str, collection: str = DEFAULT_COLLECTION) -> bool:
+        return self.delete(key, collection=collection)
+
+
+def load_lazy_docstore(storage_dir: str) -> KVDocumentStore:
+    """打开 storage_dir 中按需读取的 docstore"""
+    return KVDocumentStore(SQLiteKVStore(os.path.join(storage_dir, DOCSTORE_SQLITE_FILE), read_only=True))
+
+
+def export_docstore(storage_dir: str) -> str:
+    """
+    把 docstore.json 转换为 docstore.sqlite
+
+    Args:
+        storage_dir: 向量索引存储目录
+
+    Returns:
+        生成的 SQLite 文件路径
+    """
+    with open(os.path.join(storage_dir, DOCSTORE_JSON_FILE), "r", encoding="utf-8") as f:
+        data: Dict[str, Dict[str, dict]] = json.load(f) # {collection: {key: value}}
+
+    db_path = os.path.join(storage_dir, DOCSTORE_SQLITE_FILE)
+    tmp_path = db_path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    kvstore = SQLiteKVStore(tmp_path, read_only=False)
+    for collection, items in data.items():
+        kvstore.put_all(list(items.items()), collection=collection)
+        logger.info(f"已导出 {collection}: {len(items)} 条")
+    kvstore._conn.close()
+    os.replace(tmp_path, db_path) # 写完再替换，正在读取的进程不受影响
+    return db_path
+
+
+def add_nodes(storage_dir: str, nodes: List[BaseNode]) -> None:
+    """
+    把新节点直接写入已导出的 docstore.sqlite，不重新导出整个 docstore
+
+    SQLite 的事务保证正在读取的进程只会看到提交后的记录
+    """
+    kvstore = SQLiteKVStore(os.path.join(storage_dir, DOCSTORE_SQLITE_FILE), read_only=False)
+    try:
+        KVDocumentStore(kvstore).add_documents(nodes, allow_update=True)
+    finally:
+        kvstore._conn.close()
@@ -0,0 +1,97 @@
+# mmr_retriever.py
+from typing import Dict, List
+
+import faiss
+import numpy as np
+from llama_index.core import QueryBundle
+from llama_index.core.base.base_retriever import BaseRetriever
+from llama_index.core.schema import NodeWithScore
+
+MMR_CANDIDATE_FACTOR = 4 # 从 similarity_top_k 的多少倍候选中挑选
+
+
+def enable_reconstruct(faiss_index: faiss.Index) -> None:
+    """IVF 类索引需要建立 id -> 位置 的直接映射后才能按 id 还原向量"""
+    try:
+        ivf = faiss.extract_index_ivf(faiss_index)
+    except RuntimeError: # 不是 IVF 索引
+        return
+    ivf.make_direct_map()
+
+
+def mmr_select(
+    query_embedding: np.ndarray,
+    embeddings: np.ndarray,
+    top_k: int,
+    mmr_threshold: float = 0.5,
+) -> List[int]:
+    """
+    最大边际相关选择
+
+    每一步选 mmr_threshold * 与问题的相似度 - (1 - mmr_threshold) * 与已选节点的最大相似度 最高的候选
+
+    Returns:
+        选中候选的下标，按选中顺序排列
+    """
+    query_sims = embeddings @ query_embedding
+    pair_sims = embeddings @ embeddings.T
+    selected: List[int] = []
+    max_overlap = np.full(len(embeddings), -np.inf) # 每个候选与已选节点的最大相似度
+    remaining = np.ones(len(embeddings), dtype=bool)
+    while len(selected) < min(top_k, len(embeddings)):
+        redundancy = np.where(np.isfinite(max_overlap), max_overlap, 0.0)
+        scores = mmr_threshold * query_sims - (1 - mmr_threshold) * redundancy
+        scores[~remaining] = -np.inf
+        best = int(np.argmax(scores))
+        selected.append(best)
+        remaining[best] = False
+        max_overlap = np.maximum(max_overlap, pair_sims[best])
+    return selected
+
+
+class MMRRetriever(BaseRetriever):
+    """
+    最大边际相关(MMR)检索器
+
+    FaissVectorStore 不支持 MMR 查询模式，as_retriever(mmr=...) 的参数会被忽略。
+    这里先用向量检索取较多候选，再从 faiss 索引中还原候选向量，选出既相关又互不重复的节点。
+    """
+
+    def __init__(
+        self,
+        vector_retriever: BaseRetriever,
+        faiss_index: faiss.Index,
+        nodes_dict: Dict[str, str],
+        similarity_top_k: int = 3,
+        mmr_threshold: float = 0.5,
+    ):
+        """
+        Args:
+            vector_retriever: 取候选的向量检索器（它的 similarity_top_k 就是候选数）
+            faiss_index: 向量索引，用来还原候选向量
+            nodes_dict: 索引中的 {faiss id: 节点 ID}（index.index_struct.nodes_dict）
+            similarity_top_k: 返回的节点数
+            mmr_threshold: 相关性的权重，1 时只看相关性，0 时只看多样性
+        """
+        super().__init__()
+        self._vector_retriever = vector_retriever
+        self._faiss_index = faiss_index
+        self._faiss_ids = {node_id: int(faiss_id) for faiss_id, node_id in nodes_dict.items()}
+        self._similarity_top_k = similarity_top_k
+        self._mmr_threshold = mmr_threshold
+        enable_reconstruct(faiss_index)
+
+    def _retrieve(self, query_bundle: QueryBundle) -> List[NodeWithScore]:
+        candidates = self._vector_retriever.retrieve(query_bundle) # 同时会算好 query_bundle.embedding
+        candidates = [c for c in candidates if c.node.node_id in self._faiss_ids]
+        if len(candidates) <= 1 or query_bundle.embedding is None:
+            return candidates[:self._similarity_top_k]
+
+        ids = np.array([self._faiss_ids[c.node.node_id] for c in candidates], dtype="int64")
+        embeddings = self._faiss_index.reconstruct_batch(ids).astype(np.float32)
+        embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True).clip(min=1e-12)
+        query_embedding = np.asarray(query_bundle.embedding, dtype=np.float32)
+        query_embedding /= max(float(np.linalg.norm(query_embedding)), 1e-12)
+
+        selected = mmr_select(query_embedding, embeddings, self._similarity_top_k, self._mmr_threshold)
+        return [candidates[i] for i in selected] # 保留向量检索的相似度分数
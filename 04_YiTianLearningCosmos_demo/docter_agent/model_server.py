@@ -0,0 +1,319 @@
+# model_server.py
+import asyncio
+import itertools
+import json
+import logging
+import os
+import socket
+import struct
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+import click
+from llama_index.core.schema import NodeWithScore
+from llama_index.core.storage.docstore.utils import doc_to_json, json_to_doc
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SOCKET_PATH = "/tmp/doctor_rag.sock"
+
+_HEADER = struct.Struct("!I") # 每帧: 4 字节大端长度 + UTF-8 JSON
+
+
+def parse_address(address: str) -> Tuple[str, Any]:
+    """
+    解析模型服务地址
+
+    'tcp://host:port' 使用 TCP（Windows 下没有 Unix socket），其余视为 Unix socket 路径
+
+    Returns:
+        ('tcp', (host, port)) 或 ('unix', path)
+    """
+    if address.startswith("tcp://"):
+        host, port = address[len("tcp://"):].rsplit(":", 1)
+        return "tcp", (host, int(port))
+    return "unix", address.removeprefix("unix://")
+
+
+def encode_frame(message: Dict[str, Any]) -> bytes:
+    data = json.dumps(message, ensure_ascii=False).encode("utf-8")
+    return _HEADER.pack(len(data)) + data
+
+
+async def read_frame(reader: asyncio.StreamReader) -> Dict[str, Any]:
+    (size,) = _HEADER.unpack(await reader.readexactly(_HEADER.size))
+    return json.loads(await reader.readexactly(size))
+
+
+def node_to_json(node_with_score: NodeWithScore) -> Dict[str, Any]:
+    node = node_with_score.node.model_copy()
+    node.embedding = None # 节点向量不需要回传
+    return {"node": doc_to_json(node), "score": node_with_score.score}
+
+
+def node_from_json(data: Dict[str, Any]) -> NodeWithScore:
+    return NodeWithScore(node=json_to_doc(data["node"]), score=data["score"])
+
+
+class ModelServer:
+    """
+    本机共享的嵌入 + 检索服务
+
+    同一台机器上的多个医生智能体工作进程通过 Unix socket 连接到同一个服务，
+    只加载一份嵌入模型和向量索引；各进程的查询嵌入经同一个微批处理器合批计算。
+    """
+
+    def __init__(self, engine, address: str = DEFAULT_SOCKET_PATH):
+        """
+        Args:
+            engine: 实际执行嵌入和检索的 RAGQueryEngine
+            address: 监听地址，Unix socket 路径或 'tcp://host:port'
+        """
+        self.engine = engine
+        self.address = address
+        self._connections = 0
+        self._requests = 0
+
+    async def _dispatch(self, request: Dict[str, Any]) -> Any:
+        op = request.get("op")
+        if op == "embed_query":
+            return await self.engine.aembed_query(request["question"])
+        if op == "retrieve":
+            nodes = await self.engine.aretrieve(
+                request["question"], query_embedding=request.get("query_embedding")
+            )
+            return [node_to_json(node) for node in nodes]
+        if op == "stats":
+            return {
+                "connections": self._connections,
+                "requests": self._requests,
+                "embed_cache": self.engine.embed_cache_stats(),
+                "embed_batcher": self.engine.embed_batcher.stats(),
+            }
+        raise ValueError(f"不支持的操作: {op}")
+
+    async def _handle_request(
+        self, request: Dict[str, Any], writer: asyncio.StreamWriter, write_lock: asyncio.Lock
+    ) -> None:
+        self._requests += 1
+        try:
+            response = {"id": request.get("id"), "ok": True, "result": await self._dispatch(request)}
+        except Exception as e:
+            logger.error(f"处理请求出错: {e}")
+            response = {"id": request.get("id"), "ok": False, "error": str(e)}
+        async with write_lock: # 同一连接上的响应可能并发完成，写入时串行化
+            writer.write(encode_frame(response))
+            await writer.drain()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self._connections += 1
+        write_lock = asyncio.Lock()
+        tasks = set()
+        try:
+            while True:
+                try:
+                    request = await read_frame(reader)
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    break
+                # 每个请求单独起任务，同一连接上的多个请求可以一起进入微批
+                task = asyncio.create_task(self._handle_request(request, writer, write_lock))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        finally:
+            self._connections -= 1
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def serve_forever(self) -> None:
+        kind, target = parse_address(self.address)
+        if kind == "tcp":
+            server = await asyncio.start_server(self._handle_connection, *target)
+        else:
+            if os.path.exists(target): # 上次异常退出残留的 socket 文件
+                os.remove(target)
+            server = await asyncio.start_unix_server(self._handle_connection, path=target)
+        logger.info(f"==========模型服务已启动: {self.address}===========")
+        async with server:
+            await server.serve_forever()
+
+
+class ModelServerClient:
+    """
+    模型服务客户端
+
+    同步接口使用一条带锁的阻塞连接；异步接口在当前事件循环中复用一条连接，
+    按请求 ID 分发响应，并发请求不会互相等待。
+    """
+
+    def __init__(self, address: str = DEFAULT_SOCKET_PATH, timeout: float = 30.0):
+        """
+        Args:
+            address: 模型服务地址，Unix socket 路径或 'tcp://host:port'
+            timeout: 单个请求的超时时间（秒）
+        """
+        self.address = address
+        self.timeout = timeout
+        self._ids = itertools.count()
+
+        self._sock: Optional[socket.socket] = None
+        self._sock_lock = threading.Lock()
+
+        self._writer: Optional[asyncio.StreamWriter] = None
+        self._reader_task: Optional[asyncio.Task] = None
+        self._pending: Dict[int, asyncio.Future] = {}
+        self._connect_lock: Optional[asyncio.Lock] = None
+
+    # ---------- 同步接口 ----------
+    def _connect_sync(self) -> socket.socket:
+        kind, target = parse_address(self.address)
+        if kind == "tcp":
+            sock = socket.create_connection(target, timeout=self.timeout)
+        else:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            sock.connect(target)
+        return sock
+
+    def _recv_exactly(self, size: int) -> bytes:
+        data = bytearray()
+        while len(data) < size:
+            chunk = self._sock.recv(size - len(data))
+            if not chunk:
+                raise ConnectionError("模型服务连接已断开")
+            data.extend(chunk)
+        return bytes(data)
+
+    def _call(self, op: str, **params: Any) -> Any:
+        request = {"id": next(self._ids), "op": op, **params}
+        with self._sock_lock:
+            try:
+                if self._sock is None:
+                    self._sock = self._connect_sync()
+                self._sock.sendall(encode_frame(request))
+                (size,) = _HEADER.unpack(self._recv_exactly(_HEADER.size))
+                response = json.loads(self._recv_exactly(size))
+            except (OSError, ConnectionError):
+                if self._sock is not None: # 连接出错后丢弃，下次请求重新连接
+                    self._sock.close()
+                    self._sock = None
+                raise
+        return self._unwrap(response)
+
+    @staticmethod
+    def _unwrap(response: Dict[str, Any]) -> Any:
+        if not response.get("ok"):
+            raise RuntimeError(f"模型服务出错: {response.get('error')}")
+        return response["result"]
+
+    def embed_query(self, question: str) -> List[float]:
+        return self._call("embed_query", question=question)
+
+    def retrieve(self, question: str, query_embedding: Optional[List[float]] = None) -> List[NodeWithScore]:
+        result = self._call("retrieve", question=question, query_embedding=query_embedding)
+        return [node_from_json(data) for data in result]
+
+    def stats(self) -> Dict[str, Any]:
+        return self._call("stats")
+
+    # ---------- 异步接口 ----------
+    async def _ensure_connected(self) -> None:
+        if self._connect_lock is None:
+            self._connect_lock = asyncio.Lock()
+        async with self._connect_lock:
+            if self._writer is not None and not self._writer.is_closing():
+                return
+            kind, target = parse_address(self.address)
+            if kind == "tcp":
+                reader, self._writer = await asyncio.open_connection(*target)
+            else:
+                reader, self._writer = await asyncio.open_unix_connection(target)
+            self._reader_task = asyncio.create_task(self._read_responses(reader))
+
+    async def _read_responses(self, reader: asyncio.StreamReader) -> None:
+        try:
+            while True:
+                response = await read_frame(reader)
+                future = self._pending.pop(response.get("id"), None)
+                if future is not None and not future.done():
+                    future.set_result(response)
+        except (asyncio.IncompleteReadError, ConnectionError) as e:
+            error = ConnectionError(f"模型服务连接已断开: {e}")
+        except Exception as e:
+            error = e
+        for future in self._pending.values(): # 连接断开，未完成的请求全部失败
+            if not future.done():
+                future.set_exception(error)
+        self._pending.clear()
+        if self._writer is not None:
+            self._writer.close()
+
+    async def _acall(self, op: str, **params: Any) -> Any:
+        await self._ensure_connected()
+        request_id = next(self._ids)
+        future = asyncio.get_running_loop().create_future()
+        self._pending[request_id] = future
+        try:
+            self._writer.write(encode_frame({"id": request_id, "op": op, **params}))
+            await self._writer.drain()
+            response = await asyncio.wait_for(future, timeout=self.timeout)
+        finally:
+            self._pending.pop(request_id, None)
+        return self._unwrap(response)
+
+    async def aembed_query(self, question: str) -> List[float]:
+        return await self._acall("embed_query", question=question)
+
+    async def aretrieve(self, question: str, query_embedding: Optional[List[float]] = None) -> List[NodeWithScore]:
+        result = await self._acall("retrieve", question=question, query_embedding=query_embedding)
+        return [node_from_json(data) for data in result]
+
+    def close(self) -> None:
+        with self._sock_lock:
+            if self._sock is not None:
+                self._sock.close()
+                self._sock = None
+        if self._reader_task is not None:
+            self._reader_task.cancel()
+        if self._writer is not None:
+            self._writer.close()
+
+
+@click.command()
+@click.option('--address', default=DEFAULT_SOCKET_PATH, help="监听地址，Unix socket 路径或 'tcp://host:port'")
+def main(address):
+    """启动本机共享的嵌入 + 检索服务，检索配置与医生智能体使用相同的环境变量"""
+    from dotenv import load_dotenv
+    from RAG_query_engine import RAGQueryEngine
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO)
+    engine = RAGQueryEngine(
+        llm_model_path=os.getenv('LLM_MODEL_PATH'),
+        embed_model_path=os.getenv('EMBED_PATH'),
+        storage_dir=os.getenv('STORAGE_DIR'),
+        similarity_top_k=3,
+        with_rerank=bool(os.getenv('RERANKER_PATH')),
+        reranker_type='cross_encoder',
+        reranker_model_path=os.getenv('RERANKER_PATH'),
+        with_mmr=True,
+        mmr_threshold=0.5,
+        with_hybrid=os.getenv('WITH_HYBRID', '0') == '1',
+        index_type=os.getenv('INDEX_TYPE', 'flat'),
+        mmap_index=os.getenv('MMAP_INDEX', '0') == '1',
+        lazy_docstore=os.getenv('LAZY_DOCSTORE', '0') == '1',
+        auto_reload=True,
+        lazy_load=True,
+        persist_embed_cache=True,
+        embed_backend=os.getenv('EMBED_BACKEND', 'torch'),
+        onnx_model_dir=os.getenv('ONNX_EMBED_DIR'),
+        max_concurrency=int(os.getenv('MODEL_SERVER_CONCURRENCY', '8')), # 服务所有工作进程，并发上限更高
+    )
+    engine.preload(embed_model=True, index=True)
+    if engine.with_rerank:
+        _ = engine.node_postprocessors # 预加载重排序模型
+    asyncio.run(ModelServer(engine, address).serve_forever())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,302 @@
+# onnx_embedding.py
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, List, Optional
+
+import click
+import numpy as np
+import onnxruntime as ort
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from llama_index.embeddings.huggingface.utils import (
+    get_query_instruct_for_model_name,
+    get_text_instruct_for_model_name,
+)
+from transformers import AutoTokenizer
+
+logger = logging.getLogger(__name__)
+
+ONNX_CONFIG_FILE = "onnx_embedding.json" # 导出时记录的池化方式、源模型等信息
+FP32_MODEL_FILE = "model.onnx"
+INT8_MODEL_FILE = "model_int8.onnx"
+
+
+def export_onnx(
+    model_path: str,
+    output_dir: str,
+    quantize: bool = True,
+    pooling: str = "cls",
+    max_length: int = 512,
+    opset: int = 17,
+) -> str:
+    """
+    把 HuggingFace 嵌入模型导出为 ONNX，并可做动态 int8 量化
+
+    Args:
+        model_path: 本地嵌入模型路径（如 bge-base-zh-v1.5）
+        output_dir: 输出目录
+        quantize: 是否做动态 int8 量化
+        pooling: 池化方式 'cls'（bge 系列）| 'mean'
+        max_length: 最大 token 数
+        opset: ONNX opset 版本
+
+    Returns:
+        推理时使用的 ONNX 模型路径
+    """
+    import torch
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    from transformers import AutoModel
+
+    class _Encoder(torch.nn.Module): # 只输出 last_hidden_state，池化在推理端完成
+        def __init__(self, model):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask, token_type_ids):
+            return self.model(
+                input_ids=input_ids, attention_mask=attention_mask, token_type_ids=token_type_ids
+            ).last_hidden_state
+
+    os.makedirs(output_dir, exist_ok=True)
+    tokenizer = AutoTokenizer.from_pretrained(model_path)
+    model = AutoModel.from_pretrained(model_path).eval()
+    dummy = tokenizer(["导出示例文本"], return_tensors="pt", return_token_type_ids=True)
+
+    fp32_path = os.path.join(output_dir, FP32_MODEL_FILE)
+    dynamic_axes = {"batch": 0, "sequence": 1}
+    torch.onnx.export(
+        _Encoder(model),
+        (dummy["input_ids"], dummy["attention_mask"], dummy["token_type_ids"]),
+        fp32_path,
+        input_names=["input_ids", "attention_mask", "token_type_ids"],
+        output_names=["last_hidden_state"],
+        dynamic_axes={
+            "input_ids": dynamic_axes,
+            "attention_mask": dynamic_axes,
+            "token_type_ids": dynamic_axes,
+            "last_hidden_state": dynamic_axes,
+        },
+        opset_version=opset,
+        do_constant_folding=True,
+        dynamo=False,
+    )
+    model_file = FP32_MODEL_FILE
+    if quantize: # 只量化权重，激活在运行时动态量化，无需校准数据
+        quantize_dynamic(fp32_path, os.path.join(output_dir, INT8_MODEL_FILE), weight_type=QuantType.QInt8)
+        model_file = INT8_MODEL_FILE
+
+    tokenizer.save_pretrained(output_dir)
+    with open(os.path.join(output_dir, ONNX_CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump(
+            {"source_model": model_path, "model_file": model_file, "pooling": pooling, "max_length": max_length},
+            f,
+            ensure_ascii=False,
+            indent=2,
+        )
+    logger.info(f"已导出 ONNX 嵌入模型: {os.path.join(output_dir, model_file)}")
+    return os.path.join(output_dir, model_file)
+
+
+class OnnxEmbedding(BaseEmbedding):
+    """
+    基于 onnxruntime 的 CPU 嵌入模型
+
+    与 HuggingFaceEmbedding 接口一致，加载 export_onnx 导出的（量化）模型，
+    查询/文档指令与 HuggingFaceEmbedding 按同样规则根据源模型名确定。
+    """
+
+    model_dir: str = Field(description="export_onnx 的输出目录")
+    model_file: str = Field(default=INT8_MODEL_FILE, description="ONNX 模型文件名")
+    pooling: str = Field(default="cls", description="池化方式")
+    max_length: int = Field(default=512, description="最大 token 数")
+    normalize: bool = Field(default=True, description="是否对向量做 L2 归一化")
+    query_instruction: Optional[str] = Field(default=None, description="查询指令")
+    text_instruction: Optional[str] = Field(default=None, description="文档指令")
+
+    _session: Any = PrivateAttr()
+    _tokenizer: Any = PrivateAttr()
+    _input_names: List[str] = PrivateAttr()
+
+    def __init__(
+        self,
+        model_dir: str,
+        num_threads: Optional[int] = None,
+        embed_batch_size: int = 32,
+        **kwargs: Any,
+    ):
+        """
+        Args:
+            model_dir: export_onnx 的输出目录
+            num_threads: onnxruntime 算子内线程数，为 None 时使用默认值
+            embed_batch_size: 文档嵌入的批大小
+        """
+        with open(os.path.join(model_dir, ONNX_CONFIG_FILE), "r", encoding="utf-8") as f:
+            config = json.load(f)
+        source_model = config["source_model"]
+        kwargs.setdefault("model_file", config["model_file"])
+        kwargs.setdefault("pooling", config["pooling"])
+        kwargs.setdefault("max_length", config["max_length"])
+        kwargs.setdefault("query_instruction", get_query_instruct_for_model_name(source_model))
+        kwargs.setdefault("text_instruction", get_text_instruct_for_model_name(source_model))
+        super().__init__(
+            model_name=f"{source_model}::{kwargs['model_file']}", # 与原模型区分，避免混用嵌入缓存
+            model_dir=model_dir,
+            embed_batch_size=embed_batch_size,
+            **kwargs,
+        )
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self._session = ort.InferenceSession(
+            os.path.join(model_dir, self.model_file), options, providers=["CPUExecutionProvider"]
+        )
+        self._tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        self._input_names = [node.name for node in self._session.get_inputs()]
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "OnnxEmbedding"
+
+    def _encode(self, texts: List[str]) -> List[Embedding]:
+        """对一批文本做一次前向计算"""
+        encoded = self._tokenizer(
+            texts,
+            padding=True,
+            truncation=True,
+            max_length=self.max_length,
+            return_tensors="np",
+            return_token_type_ids=True,
+        )
+        feed = {name: encoded[name].astype(np.int64) for name in self._input_names}
+        hidden = self._session.run(None, feed)[0] # (batch, seq, dim)
+
+        if self.pooling == "cls":
+            vectors = hidden[:, 0]
+        else: # mean 池化，忽略 padding
+            mask = encoded["attention_mask"][..., np.newaxis].astype(hidden.dtype)
+            vectors = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.normalize:
+            vectors = vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+        return vectors.tolist()
+
+    def _with_instruction(self, texts: List[str], instruction: Optional[str]) -> List[str]:
+        return [f"{instruction}{text}" for text in texts] if instruction else list(texts)
+
+    def get_query_embedding_batch(self, queries: List[str]) -> List[Embedding]:
+        """批量计算查询向量（供跨请求微批处理器使用）"""
+        return self._encode(self._with_instruction(queries, self.query_instruction))
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self.get_query_embedding_batch([query])[0]
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return self._get_query_embedding(query)
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._get_text_embeddings([text])[0]
+
+    def _get_text_embeddings(self, texts: List[str]) -> List[Embedding]:
+        texts = self._with_instruction(texts, self.text_instruction)
+        embeddings = []
+        for i in range(0, len(texts), self.embed_batch_size):
+            embeddings.extend(self._encode(texts[i:i + self.embed_batch_size]))
+        return embeddings
+
+
+PARITY_SAMPLES = [
+    "我出现了眩晕，胸闷，咯吐痰多，犯困、嗜睡，舌质淡胖的症状,可能是什么情况?",
+    "我最近经常头痛怎么办？",
+    "高血压有哪些症状？",
+    "失眠多梦，心悸健忘，食少乏力",
+    "痰湿中阻证多见眩晕、胸闷、咯吐痰多，舌质淡胖，苔白腻，脉滑，治宜燥湿化痰。",
+    "肝阳上亢者常表现为头痛、急躁易怒、面红目赤，舌红苔黄，脉弦数。",
+    "腰膝酸冷，畏寒肢冷，夜尿频多，舌淡胖，脉沉迟，治宜温补肾阳。",
+    "干咳少痰，口燥咽干，潮热盗汗，舌红少津，脉细数。",
+]
+
+
+def _cosines(a: List[Embedding], b: List[Embedding]) -> np.ndarray:
+    a, b = np.asarray(a), np.asarray(b)
+    return (a * b).sum(axis=1) / (np.linalg.norm(a, axis=1) * np.linalg.norm(b, axis=1))
+
+
+def _throughput(embed_fn, texts: List[str], rounds: int) -> float:
+    """每秒嵌入的文本数"""
+    embed_fn(texts[:2]) # 预热
+    start = time.perf_counter()
+    for _ in range(rounds):
+        embed_fn(texts)
+    return rounds * len(texts) / (time.perf_counter() - start)
+
+
+def check_parity(
+    model_path: str,
+    onnx_dir: str,
+    texts: Optional[List[str]] = None,
+    rounds: int = 5,
+    batch_size: int = 32,
+) -> Dict[str, Any]:
+    """
+    对比 ONNX 后端与原始 PyTorch 模型的向量偏差和吞吐
+
+    Returns:
+        包含查询/文档向量余弦相似度（最小值、均值）与两种后端吞吐的字典
+    """
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
+    texts = texts or PARITY_SAMPLES
+    reference = HuggingFaceEmbedding(model_name=model_path, device="cpu")
+    candidate = OnnxEmbedding(onnx_dir)
+
+    query_cos = _cosines(
+        [reference.get_query_embedding(t) for t in texts], candidate.get_query_embedding_batch(texts)
+    )
+    text_cos = _cosines(reference.get_text_embedding_batch(texts), candidate.get_text_embedding_batch(texts))
+
+    bench_texts = (texts * (batch_size // len(texts) + 1))[:batch_size]
+    return {
+        "source_model": model_path,
+        "onnx_model": os.path.join(onnx_dir, candidate.model_file),
+        "num_samples": len(texts),
+        "query_cosine_min": float(query_cos.min()),
+        "query_cosine_mean": float(query_cos.mean()),
+        "text_cosine_min": float(text_cos.min()),
+        "text_cosine_mean": float(text_cos.mean()),
+        "torch_texts_per_sec": _throughput(reference.get_text_embedding_batch, bench_texts, rounds),
+        "onnx_texts_per_sec": _throughput(candidate.get_text_embedding_batch, bench_texts, rounds),
+    }
+
+
+@click.group()
+def cli():
+    """ONNX 量化嵌入后端工具"""
+    logging.basicConfig(level=logging.INFO)
+
+
+@cli.command()
+@click.option('--model-path', required=True, help='本地嵌入模型路径')
+@click.option('--output-dir', required=True, help='ONNX 输出目录')
+@click.option('--quantize/--no-quantize', default=True, help='是否做动态 int8 量化')
+@click.option('--pooling', type=click.Choice(['cls', 'mean']), default='cls', help='池化方式(bge 为 cls)')
+def export(model_path, output_dir, quantize, pooling):
+    """导出 ONNX 嵌入模型"""
+    click.echo(export_onnx(model_path, output_dir, quantize=quantize, pooling=pooling))
+
+
+@cli.command()
+@click.option('--model-path', required=True, help='本地嵌入模型路径')
+@click.option('--onnx-dir', required=True, help='ONNX 模型目录')
+@click.option('--rounds', type=int, default=5, help='吞吐测试轮数')
+@click.option('--batch-size', type=int, default=32, help='吞吐测试批大小')
+def check(model_path, onnx_dir, rounds, batch_size):
+    """检查 ONNX 模型与原模型的余弦偏差并测试吞吐"""
+    report = check_parity(model_path, onnx_dir, rounds=rounds, batch_size=batch_size)
+    click.echo(json.dumps(report, ensure_ascii=False, indent=2))
+
+
+if __name__ == '__main__':
+    cli()
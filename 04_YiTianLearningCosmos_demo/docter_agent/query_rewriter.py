@@ -0,0 +1,121 @@
+# query_rewriter.py
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Sequence
+
+from embedding_cache import normalize_text
+
+logger = logging.getLogger(__name__)
+
+# 口语化的症状说法（对应规范术语见注释），问题中一个都没有时视为已经规范，不再改写。
+# 不收"我""最近"和语气词：几乎每个患者提问都有，收进来门控就形同虚设
+COLLOQUIAL_TERMS = (
+    "难受", "不舒服", "没劲", "没力气", "没精神", # 乏力、神疲
+    "头疼", "脑袋疼", "脑袋晕", "头昏脑涨", # 头痛、眩晕
+    "睡不着", "睡不好", "老做梦", # 失眠、多梦
+    "吃不下", "没胃口", "胃口不好", # 纳差、食少
+    "拉肚子", "拉稀", "闹肚子", "肚子疼", "肚子胀", # 泄泻、腹痛、腹胀
+    "烧心", "反酸水", "想吐", # 反酸、恶心
+    "心慌", "喘不上气", "憋得慌", "堵得慌", # 心悸、气短、胸闷
+    "嗓子疼", "嗓子干", "上火", # 咽痛、咽干、热证
+    "怕冷", "手脚冰凉", "出虚汗", "老出汗", # 畏寒、肢冷、自汗盗汗
+    "犯困", "浑身酸", "腰酸背疼", # 嗜睡、身痛、腰膝酸软
+)
+
+
+class QueryRewriter:
+    """
+    带缓存和门控的查询改写
+
+    过短、过长（改写会被 max_tokens 截断）或不含口语化用词的问题直接跳过；
+    需要改写的问题按规范化后的文本缓存改写结果，重复问题不再调用 LLM。
+    """
+
+    def __init__(
+        self,
+        rewrite_fn: Callable[[str], str],
+        cache_size: int = 1024,
+        min_length: int = 6,
+        max_length: int = 120,
+        colloquial_terms: Sequence[str] = COLLOQUIAL_TERMS,
+    ):
+        """
+        Args:
+            rewrite_fn: 实际调用 LLM 改写问题的函数
+            cache_size: 改写结果 LRU 缓存的容量，0 表示不缓存
+            min_length: 规范化后短于该长度的问题不改写
+            max_length: 规范化后长于该长度的问题不改写
+            colloquial_terms: 口语化用词表
+        """
+        self.rewrite_fn = rewrite_fn
+        self.cache_size = cache_size
+        self.min_length = min_length
+        self.max_length = max_length
+        self.colloquial_terms = tuple(colloquial_terms)
+
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._counters = {
+            "hits": 0, # 命中缓存
+            "misses": 0, # 调用 LLM 改写
+            "skipped_short": 0,
+            "skipped_long": 0,
+            "skipped_formal": 0,
+        }
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self._counters[name] += 1
+
+    def skip_reason(self, question: str) -> Optional[str]:
+        """返回跳过改写的原因，需要改写时返回 None"""
+        text = normalize_text(question)
+        if len(text) < self.min_length:
+            return "short"
+        if len(text) > self.max_length:
+            return "long"
+        if not any(term in text for term in self.colloquial_terms):
+            return "formal"
+        return None
+
+    def rewrite(self, question: str) -> str:
+        """改写问题，跳过或改写结果为空时返回原问题"""
+        reason = self.skip_reason(question)
+        if reason is not None:
+            self._count(f"skipped_{reason}")
+            return question
+
+        key = normalize_text(question)
+        with self._lock:
+            rewritten = self._cache.get(key)
+            if rewritten is not None:
+                self._cache.move_to_end(key)
+                self._counters["hits"] += 1
+                return rewritten
+
+        self._count("misses")
+        rewritten = self.rewrite_fn(question).strip() or question
+        if self.cache_size > 0:
+            with self._lock:
+                self._cache[key] = rewritten
+                self._cache.move_to_end(key)
+                while len(self._cache) > self.cache_size:
+                    self._cache.popitem(last=False)
+        return rewritten
+
+    def stats(self) -> Dict[str, Any]:
+        """改写命中/跳过统计"""
+        with self._lock:
+            counters = dict(self._counters)
+            size = len(self._cache)
+        total = sum(counters.values())
+        skipped = counters["skipped_short"] + counters["skipped_long"] + counters["skipped_formal"]
+        rewritten = counters["hits"] + counters["misses"]
+        return {
+            **counters,
+            "size": size,
+            "max_size": self.cache_size,
+            "hit_rate": counters["hits"] / rewritten if rewritten else 0.0,
+            "skip_rate": skipped / total if total else 0.0,
+        }
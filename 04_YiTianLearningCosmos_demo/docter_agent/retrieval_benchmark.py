@@ -0,0 +1,272 @@
+# retrieval_benchmark.py
+import hashlib
+import itertools
+import json
+import logging
+import math
+import platform
+import random
+import sys
+import tempfile
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import click
+import faiss
+import numpy as np
+from llama_index.core import StorageContext, VectorStoreIndex
+from llama_index.core.base.embeddings.base import BaseEmbedding, Embedding
+from llama_index.core.bridge.pydantic import Field
+from llama_index.core.schema import TextNode
+from llama_index.vector_stores.faiss import FaissVectorStore
+
+from RAG_query_engine import RAGQueryEngine
+from embedding_cache import normalize_text
+from hybrid_retriever import build_bm25_index
+from index_tool import INDEX_TYPES, convert_index
+
+logger = logging.getLogger(__name__)
+
+# 合成语料：证型 -> (主要症状, 舌象, 脉象, 治法)
+SYNDROMES = {
+    "痰湿中阻": (["眩晕", "胸闷", "咯吐痰多", "犯困嗜睡", "形体肥胖", "肢体麻木"], "舌质淡胖，苔白腻", "脉滑", "燥湿化痰，健脾和胃"),
+    "肝阳上亢": (["头痛", "头晕目眩", "急躁易怒", "面红目赤", "失眠多梦", "口苦"], "舌红，苔黄", "脉弦数", "平肝潜阳"),
+    "心脾两虚": (["心悸", "健忘", "失眠", "食少", "神疲乏力", "面色萎黄"], "舌淡，苔薄白", "脉细弱", "补益心脾"),
+    "肾阳虚": (["腰膝酸冷", "畏寒肢冷", "夜尿频多", "精神萎靡", "小便清长", "下肢浮肿"], "舌淡胖，苔白", "脉沉迟", "温补肾阳"),
+    "肺阴虚": (["干咳少痰", "口燥咽干", "潮热盗汗", "五心烦热", "声音嘶哑", "痰中带血"], "舌红少津", "脉细数", "滋阴润肺"),
+    "脾胃湿热": (["脘腹痞满", "恶心呕吐", "口黏口苦", "大便溏泄", "身重困倦", "小便短黄"], "舌红，苔黄腻", "脉濡数", "清热化湿"),
+    "气滞血瘀": (["胸胁刺痛", "痛处固定", "月经不调", "面色晦暗", "肌肤甲错", "情志抑郁"], "舌紫暗有瘀斑", "脉涩", "行气活血"),
+    "风寒束表": (["恶寒重", "发热轻", "无汗", "头身疼痛", "鼻塞流清涕", "咳嗽痰稀"], "舌苔薄白", "脉浮紧", "辛温解表"),
+}
+SEXES = ["男", "女"]
+TRIGGERS = ["劳累后", "受凉后", "饮酒后", "情绪激动后", "熬夜后", "产后", "饮食不节后", "久坐少动后"]
+DURATIONS = ["3天", "1周", "2周", "1个月", "3个月", "半年", "1年", "2年"]
+TEMPLATES = [
+    "病例{case}：{sex}，{age}岁，{trigger}出现{symptoms}，已持续{duration}。{tongue}，{pulse}。辨证为{name}，治以{treatment}。",
+    "{age}岁{sex}性患者，{duration}前{trigger}起病，症见{symptoms}，{tongue}，{pulse}，证属{name}，治宜{treatment}。",
+    "患者{sex}，{age}岁。主诉：{symptoms}{duration}，{trigger}加重。舌脉：{tongue}，{pulse}。诊断：{name}。",
+]
+# 查询只给出病例的部分信息：两个症状，再加上年龄性别、病程、诱因中的两项
+QUERY_TEMPLATES = [
+    "我{symptoms}，{details}，是怎么回事？",
+    "{details}，出现了{symptoms}，可能是什么情况?",
+    "医生，{details}，一直{symptoms}，该怎么调理？",
+]
+RELEVANCE_TARGET = 2 # 查询对应的病例
+RELEVANCE_SAME_SYNDROME = 1 # 同一证型的其他病例
+
+
+class HashingEmbedding(BaseEmbedding):
+    """确定性的哈希嵌入（字符一元/二元组哈希到固定维度），用于无模型环境下的评测"""
+
+    dim: int = Field(default=256, description="向量维度")
+
+    @classmethod
+    def class_name(cls) -> str:
+        return "HashingEmbedding"
+
+    def _hash_embed(self, text: str) -> Embedding:
+        text = normalize_text(text)
+        vector = np.zeros(self.dim, dtype=np.float32)
+        grams = list(text) + [text[i:i + 2] for i in range(len(text) - 1)]
+        for gram in grams:
+            digest = hashlib.md5(gram.encode("utf-8")).digest() # 与 hash() 不同，跨进程稳定
+            vector[int.from_bytes(digest[:4], "little") % self.dim] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm > 0 else vector).tolist()
+
+    def _get_query_embedding(self, query: str) -> Embedding:
+        return self._hash_embed(query)
+
+    async def _aget_query_embedding(self, query: str) -> Embedding:
+        return self._hash_embed(query)
+
+    def _get_text_embedding(self, text: str) -> Embedding:
+        return self._hash_embed(text)
+
+
+def build_corpus(
+    docs_per_syndrome: int, num_queries: int, seed: int = 0
+) -> Tuple[List[TextNode], List[Tuple[str, Dict[str, int]]]]:
+    """
+    生成合成中文病例语料和带分级标注的查询
+
+    每个病例的(性别, 年龄, 病程, 诱因)互不相同，每个查询只对应一个病例，
+    同证型的其他病例算部分相关，只检索到同证型的病例拿不到满分。
+
+    Returns:
+        (节点列表, [(查询, {节点ID: 相关度}), ...])
+    """
+    rng = random.Random(seed)
+    profiles = list(itertools.product(SEXES, range(18, 81), DURATIONS, TRIGGERS))
+    rng.shuffle(profiles)
+    if docs_per_syndrome * len(SYNDROMES) > len(profiles):
+        raise ValueError(f"最多生成 {len(profiles)} 个病例")
+
+    nodes, cases = [], []
+    for name, (symptoms, tongue, pulse, treatment) in SYNDROMES.items():
+        for i in range(docs_per_syndrome):
+            sex, age, duration, trigger = profiles[len(cases)]
+            picked = rng.sample(symptoms, k=rng.randint(3, len(symptoms)))
+            node_id = f"{name}-{i}"
+            text = rng.choice(TEMPLATES).format(
+                case=len(cases), sex=sex, age=age, trigger=trigger, duration=duration,
+                symptoms="、".join(picked), name=name, tongue=tongue, pulse=pulse, treatment=treatment,
+            )
+            nodes.append(TextNode(id_=node_id, text=text))
+            cases.append((node_id, name, picked, sex, age, duration, trigger))
+
+    same_syndrome: Dict[str, List[str]] = {}
+    for node_id, name, *_ in cases:
+        same_syndrome.setdefault(name, []).append(node_id)
+
+    queries = []
+    for node_id, name, picked, sex, age, duration, trigger in rng.sample(cases, k=min(num_queries, len(cases))):
+        details = rng.sample([f"{age}岁{sex}", f"有{duration}了", f"{trigger}开始的"], k=2)
+        query = rng.choice(QUERY_TEMPLATES).format(
+            symptoms="、".join(rng.sample(picked, k=2)), details="，".join(details)
+        )
+        relevance = {other: RELEVANCE_SAME_SYNDROME for other in same_syndrome[name]}
+        relevance[node_id] = RELEVANCE_TARGET
+        queries.append((query, relevance))
+    return nodes, queries
+
+
+def build_storage(nodes: List[TextNode], embed_model: BaseEmbedding, storage_dir: str) -> None:
+    """对语料建立 flat 索引并转换出全部近似索引和 BM25 索引"""
+    dim = len(embed_model.get_text_embedding("维度"))
+    vector_store = FaissVectorStore(faiss_index=faiss.IndexFlatIP(dim))
+    storage_context = StorageContext.from_defaults(vector_store=vector_store)
+    index = VectorStoreIndex(nodes, storage_context=storage_context, embed_model=embed_model)
+    index.storage_context.persist(persist_dir=storage_dir)
+
+    pq_bits = min(8, int(math.log2(len(nodes)))) # PQ 每个码本至少需要 2^bits 个训练样本
+    pq_m = next(m for m in (16, 8, 4, 2, 1) if dim % m == 0)
+    for index_type in INDEX_TYPES[1:]:
+        convert_index(storage_dir, index_type, pq_m=pq_m, pq_bits=pq_bits)
+    build_bm25_index(storage_dir)
+
+
+def percentile(values: List[float], q: float) -> float:
+    return float(np.percentile(values, q)) if values else 0.0
+
+
+def ndcg(retrieved: List[str], relevance: Dict[str, int], k: int) -> float:
+    """按分级相关度计算 nDCG@k"""
+    dcg = sum(relevance.get(node_id, 0) / math.log2(i + 2) for i, node_id in enumerate(retrieved[:k]))
+    ideal = sorted(relevance.values(), reverse=True)[:k]
+    idcg = sum(gain / math.log2(i + 2) for i, gain in enumerate(ideal))
+    return dcg / idcg if idcg > 0 else 0.0
+
+
+def evaluate(engine: RAGQueryEngine, queries: List[Tuple[str, Dict[str, int]]], k: int) -> Dict[str, Any]:
+    """计算目标病例的 recall@k 和 MRR、分级相关度的 nDCG@k，以及检索延迟分位数"""
+    recalls, reciprocal_ranks, ndcgs, latencies = [], [], [], []
+    for query, relevance in queries:
+        start = time.perf_counter()
+        nodes = engine.retrieve(query)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        retrieved = [node.node.node_id for node in nodes[:k]]
+        target = next(node_id for node_id, grade in relevance.items() if grade == RELEVANCE_TARGET)
+        rank = retrieved.index(target) + 1 if target in retrieved else None
+        recalls.append(1.0 if rank else 0.0)
+        reciprocal_ranks.append(1.0 / rank if rank else 0.0)
+        ndcgs.append(ndcg(retrieved, relevance, k))
+
+    return {
+        "recall_at_k": float(np.mean(recalls)),
+        "mrr": float(np.mean(reciprocal_ranks)),
+        "ndcg_at_k": float(np.mean(ndcgs)),
+        "latency_ms_p50": percentile(latencies, 50),
+        "latency_ms_p95": percentile(latencies, 95),
+        "latency_ms_p99": percentile(latencies, 99),
+    }
+
+
+def iter_configs(
+    top_ks: List[int],
+    mmr_thresholds: List[Optional[float]],
+    index_types: List[str],
+    rerank_options: List[bool],
+    hybrid_options: List[bool],
+) -> Iterator[Dict[str, Any]]:
+    """枚举待评测的 RAGQueryEngine 配置"""
+    for top_k, mmr_threshold, index_type, with_rerank, with_hybrid in itertools.product(
+        top_ks, mmr_thresholds, index_types, rerank_options, hybrid_options
+    ):
+        yield {
+            "similarity_top_k": top_k,
+            "with_mmr": mmr_threshold is not None,
+            "mmr_threshold": mmr_threshold if mmr_threshold is not None else 0.5,
+            "index_type": index_type,
+            "with_rerank": with_rerank,
+            "reranker_top_n": top_k,
+            "with_hybrid": with_hybrid,
+        }
+
+
+@click.command()
+@click.option('--embed-path', default=None, help='本地嵌入模型路径，不提供时使用确定性哈希嵌入')
+@click.option('--reranker-path', default=None, help='交叉编码器模型路径，提供时评测重排序')
+@click.option('--docs-per-syndrome', type=int, default=80, help='每个证型生成的文档数')
+@click.option('--num-queries', type=int, default=200, help='查询数')
+@click.option('--top-k', 'top_ks', type=int, multiple=True, default=(3, 5, 10), help='similarity_top_k，可多次指定')
+@click.option('--mmr-threshold', 'mmr_thresholds', type=float, multiple=True, default=(0.5,), help='MMR 阈值，可多次指定')
+@click.option('--index-type', 'index_types', type=click.Choice(INDEX_TYPES), multiple=True, default=INDEX_TYPES, help='索引类型，可多次指定')
+@click.option('--seed', type=int, default=0, help='随机种子')
+@click.option('--output', default=None, help='结果输出文件(JSON Lines)，默认输出到标准输出')
+def main(embed_path, reranker_path, docs_per_syndrome, num_queries, top_ks, mmr_thresholds, index_types, seed, output):
+    """RAGQueryEngine 检索配置评测"""
+    logging.basicConfig(level=logging.WARNING)
+    if embed_path:
+        from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+        embed_model = HuggingFaceEmbedding(model_name=embed_path)
+    else:
+        embed_model = HashingEmbedding()
+
+    nodes, queries = build_corpus(docs_per_syndrome, num_queries, seed=seed)
+    rerank_options = [False, True] if reranker_path else [False]
+    out = open(output, "w", encoding="utf-8") if output else sys.stdout
+    run_info = {
+        "embed_model": embed_path or "hashing-stub",
+        "reranker": reranker_path,
+        "num_docs": len(nodes),
+        "num_queries": len(queries),
+        "seed": seed,
+        "python": platform.python_version(),
+        "faiss": faiss.__version__,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+    try:
+        with tempfile.TemporaryDirectory() as storage_dir:
+            build_storage(nodes, embed_model, storage_dir)
+            configs = iter_configs(
+                list(top_ks), [None, *mmr_thresholds], list(index_types), rerank_options, [False, True]
+            )
+            for config in configs:
+                engine = RAGQueryEngine(
+                    llm_model_path=None, # 只检索，不会加载 LLM
+                    embed_model_path=embed_path,
+                    storage_dir=storage_dir,
+                    embed_model=embed_model,
+                    embed_cache_size=0, # 不缓存，测量真实的嵌入耗时
+                    reranker_type="cross_encoder",
+                    reranker_model_path=reranker_path,
+                    **config,
+                )
+                engine.preload(embed_model=True, index=True)
+                if config["with_rerank"]:
+                    _ = engine.node_postprocessors # 预加载重排序模型，不计入首个查询的延迟
+                result = {**run_info, **config, **evaluate(engine, queries, config["similarity_top_k"])}
+                out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                out.flush()
+                engine.shutdown()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,267 @@
+# session_store.py
+import abc
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class _Entry:
+    """一条会话状态"""
+    data: bytes # 序列化后的 Context.to_dict()
+    expires_at: float # 过期时间(time.monotonic)
+
+
+class SessionBackend(abc.ABC):
+    """
+    会话状态的持久化后端接口，保存的是序列化后的 JSON 字节
+
+    方法都是同步阻塞的，SessionStore 通过 asyncio.to_thread 在线程池中调用，实现需要线程安全。
+    """
+
+    @abc.abstractmethod
+    def load(self, context_id: str, ttl: float) -> Optional[bytes]:
+        """读取会话，不存在或距上次写入超过 ttl 秒时返回 None"""
+
+    @abc.abstractmethod
+    def save(self, context_id: str, data: bytes) -> None:
+        """保存会话"""
+
+    @abc.abstractmethod
+    def delete(self, context_id: str) -> None:
+        """删除会话"""
+
+    @abc.abstractmethod
+    def purge_expired(self, ttl: float) -> int:
+        """删除过期会话，返回删除的数量"""
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """
+    SQLite（WAL 模式）会话后端
+
+    会话 JSON 用 zlib 压缩后保存，进程重启后已解析的文档等会话状态仍可恢复。
+    """
+
+    def __init__(self, path: str, compress_level: int = 6):
+        """
+        Args:
+            path: 数据库文件路径
+            compress_level: zlib 压缩级别
+        """
+        self.path = path
+        self.compress_level = compress_level
+        self._local = threading.local() # sqlite 连接不能跨线程共享，每个线程一个
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sessions ("
+                "context_id TEXT PRIMARY KEY, data BLOB NOT NULL, updated_at REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions(updated_at)")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path)
+            conn.execute("PRAGMA journal_mode=WAL") # 读写互不阻塞
+            conn.execute("PRAGMA synchronous=NORMAL") # WAL 下仍能保证崩溃后数据库一致
+            self._local.conn = conn
+        return conn
+
+    def load(self, context_id: str, ttl: float) -> Optional[bytes]:
+        row = self._conn().execute(
+            "SELECT data, updated_at FROM sessions WHERE context_id = ?", (context_id,)
+        ).fetchone()
+        if row is None or (ttl > 0 and row[1] + ttl <= time.time()):
+            return None
+        return zlib.decompress(row[0])
+
+    def save(self, context_id: str, data: bytes) -> None:
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO sessions (context_id, data, updated_at) VALUES (?, ?, ?)",
+                (context_id, zlib.compress(data, self.compress_level), time.time()),
+            )
+
+    def delete(self, context_id: str) -> None:
+        with self._conn() as conn:
+            conn.execute("DELETE FROM sessions WHERE context_id = ?", (context_id,))
+
+    def purge_expired(self, ttl: float) -> int:
+        if ttl <= 0:
+            return 0
+        with self._conn() as conn:
+            return conn.execute("DELETE FROM sessions WHERE updated_at <= ?", (time.time() - ttl,)).rowcount
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class SessionStore:
+    """
+    有界的工作流会话状态存储
+
+    以序列化后的 JSON 保存 Context.to_dict()，按最近使用顺序淘汰（LRU），
+    超过有效期的会话在访问或写入时清理（TTL），总字节数超出预算时继续淘汰最久未用的会话。
+    配置了持久化后端时，内存中只是热缓存：写入同时落盘，未命中时按需从后端加载。
+    后端读写、压缩和 JSON 编解码在线程池中执行，不阻塞事件循环；后端中的过期会话每隔 purge_interval 秒清理一次。
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 1024,
+        ttl: float = 6 * 3600.0,
+        max_bytes: int = 256 * 1024 * 1024,
+        backend: Optional[SessionBackend] = None,
+        purge_interval: float = 600.0,
+    ):
+        """
+        Args:
+            max_entries: 内存中最多保存的会话数
+            ttl: 会话有效期（秒），从最近一次写入开始计算，小于等于 0 表示永不过期
+            max_bytes: 内存中全部会话序列化后的总字节数上限
+            backend: 持久化后端，为 None 时只保存在内存中
+            purge_interval: 清理后端过期会话的间隔（秒），在写入时检查
+        """
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.backend = backend
+        self.purge_interval = purge_interval
+        self._last_purge = time.monotonic()
+        if backend is not None:
+            purged = backend.purge_expired(ttl) # 启动时还没有事件循环，直接清理
+            if purged:
+                logger.info(f"已清理 {purged} 个过期的持久化会话")
+
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._bytes = 0
+        self._counters = {
+            "hits": 0,
+            "misses": 0,
+            "backend_hits": 0, # 内存未命中、从持久化后端加载
+            "evicted_lru": 0, # 因会话数或字节预算被淘汰
+            "evicted_ttl": 0, # 过期被清理
+            "rejected": 0, # 单个会话超过字节预算，未保存
+            "purged": 0, # 后端中被定期清理的过期会话
+        }
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, context_id: str) -> bool:
+        entry = self._entries.get(context_id)
+        return entry is not None and not self._expired(entry)
+
+    def _expired(self, entry: _Entry) -> bool:
+        return self.ttl > 0 and entry.expires_at <= time.monotonic()
+
+    def _remove(self, context_id: str) -> None:
+        entry = self._entries.pop(context_id)
+        self._bytes -= len(entry.data)
+
+    def _evict_expired(self) -> None:
+        expired = [context_id for context_id, entry in self._entries.items() if self._expired(entry)]
+        for context_id in expired:
+            self._remove(context_id)
+        self._counters["evicted_ttl"] += len(expired)
+
+    async def get(self, context_id: str) -> Optional[Dict[str, Any]]:
+        """读取会话状态，不存在或已过期时返回 None"""
+        entry = self._entries.get(context_id)
+        if entry is not None and self._expired(entry):
+            self._remove(context_id)
+            self._counters["evicted_ttl"] += 1
+            entry = None
+        if entry is None:
+            if self.backend is None:
+                self._counters["misses"] += 1
+                return None
+            data = await asyncio.to_thread(self.backend.load, context_id, self.ttl)
+            if data is None:
+                self._counters["misses"] += 1
+                return None
+            self._counters["backend_hits"] += 1
+            self._cache(context_id, data) # 放回热缓存
+            return await asyncio.to_thread(json.loads, data)
+        self._entries.move_to_end(context_id)
+        self._counters["hits"] += 1
+        return await asyncio.to_thread(json.loads, entry.data)
+
+    async def set(self, context_id: str, state: Dict[str, Any]) -> None:
+        """保存会话状态，配置了持久化后端时同时落盘"""
+        data = await asyncio.to_thread(self._save, context_id, state)
+        self._cache(context_id, data)
+        await self._maybe_purge()
+
+    def _save(self, context_id: str, state: Dict[str, Any]) -> bytes:
+        """序列化并落盘，在线程池中执行"""
+        data = json.dumps(state, ensure_ascii=False).encode("utf-8")
+        if self.backend is not None:
+            self.backend.save(context_id, data)
+        return data
+
+    async def _maybe_purge(self) -> None:
+        """距上次清理超过 purge_interval 秒时清理后端中的过期会话"""
+        if self.backend is None or time.monotonic() - self._last_purge < self.purge_interval:
+            return
+        self._last_purge = time.monotonic() # 先更新时间，避免并发写入重复清理
+        purged = await asyncio.to_thread(self.backend.purge_expired, self.ttl)
+        self._counters["purged"] += purged
+        if purged:
+            logger.info(f"已清理 {purged} 个过期的持久化会话")
+
+    def _cache(self, context_id: str, data: bytes) -> None:
+        """写入内存，必要时淘汰过期和最久未用的会话"""
+        if context_id in self._entries:
+            self._remove(context_id)
+        if len(data) > self.max_bytes:
+            if self.backend is None:
+                logger.warning(f"会话 {context_id} 的状态有 {len(data)} 字节，超过预算 {self.max_bytes}，不再保存")
+            self._counters["rejected"] += 1
+            return
+
+        self._evict_expired()
+        while self._entries and (
+            len(self._entries) >= self.max_entries or self._bytes + len(data) > self.max_bytes
+        ):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._counters["evicted_lru"] += 1
+
+        self._entries[context_id] = _Entry(data=data, expires_at=time.monotonic() + self.ttl)
+        self._bytes += len(data)
+
+    async def delete(self, context_id: str) -> None:
+        """删除会话状态"""
+        if context_id in self._entries:
+            self._remove(context_id)
+        if self.backend is not None:
+            await asyncio.to_thread(self.backend.delete, context_id)
+
+    def stats(self) -> Dict[str, Any]:
+        """会话数量、字节数和淘汰统计"""
+        return {
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            **self._counters,
+        }
@@ -0,0 +1,32 @@
+# test_answer_cache.py
+from answer_cache import SemanticAnswerCache
+
+EMBEDDING = [1.0, 0.0, 0.0]
+
+
+def test_hit_within_same_index_version():
+    cache = SemanticAnswerCache()
+    cache.sync_index_version("v1")
+    cache.add("头痛怎么办", EMBEDDING, "回答", {}, index_version="v1")
+
+    cache.sync_index_version("v1")
+    assert cache.lookup(EMBEDDING).response == "回答"
+
+
+def test_index_reload_clears_answers():
+    cache = SemanticAnswerCache()
+    cache.sync_index_version("v1")
+    cache.add("头痛怎么办", EMBEDDING, "回答", {}, index_version="v1")
+
+    cache.sync_index_version("v2") # 增量合并后热切换
+    assert len(cache) == 0
+    assert cache.lookup(EMBEDDING) is None
+
+
+def test_answer_from_old_index_is_not_cached():
+    cache = SemanticAnswerCache()
+    cache.sync_index_version("v1")
+    cache.sync_index_version("v2") # 另一个请求在生成期间发现了新版本
+    cache.add("头痛怎么办", EMBEDDING, "旧索引的回答", {}, index_version="v1")
+
+    assert len(cache) == 0
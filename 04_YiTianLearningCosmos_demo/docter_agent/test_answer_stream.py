@@ -0,0 +1,41 @@
+# test_answer_stream.py
+import json
+
+from agent import CITATION_SEPARATOR, AnswerStreamSplitter
+
+
+def split(output: str, chunk_size: int = 3):
+    """按固定长度切片喂给拆分器，返回推送的正文和解析结果"""
+    splitter = AnswerStreamSplitter()
+    streamed = ''.join(splitter.feed(output[i:i + chunk_size]) for i in range(0, len(output), chunk_size))
+    streamed += splitter.flush()
+    return streamed, splitter.result()
+
+
+def test_answer_streams_before_separator():
+    citations = [{"citation_number": 1, "texts": ["肝阳上亢"]}]
+    streamed, result = split(f"属于肝阳上亢证[1]。\n{CITATION_SEPARATOR}\n{json.dumps(citations, ensure_ascii=False)}")
+
+    assert streamed.strip() == "属于肝阳上亢证[1]。"
+    assert result.response == "属于肝阳上亢证[1]。"
+    assert result.citations[0].texts == ["肝阳上亢"]
+
+
+def test_old_json_format_is_not_streamed():
+    output = json.dumps(
+        {"response": "属于肝阳上亢证[1]。", "citations": [{"citation_number": 1, "texts": ["肝阳上亢"]}]},
+        ensure_ascii=False,
+    )
+    streamed, result = split(f"  ```json\n{output}\n```")
+
+    assert streamed == '' # 原始 JSON 不会推送给客户端
+    assert result.response == "属于肝阳上亢证[1]。"
+    assert result.citations[0].citation_number == 1
+
+
+def test_brace_that_is_not_json_is_streamed_at_the_end():
+    streamed, result = split("{注意} 请及时就医。")
+
+    assert streamed == "{注意} 请及时就医。"
+    assert result.response == "{注意} 请及时就医。"
+    assert result.citations == []
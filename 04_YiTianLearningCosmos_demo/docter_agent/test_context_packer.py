@@ -0,0 +1,78 @@
+# test_context_packer.py
+from llama_index.core.schema import NodeWithScore, TextNode
+
+from context_packer import ContextPacker
+
+
+def whitespace_tokenizer(text: str) -> list:
+    return text.split()
+
+
+def make_packer(**kwargs) -> ContextPacker:
+    kwargs.setdefault("min_chunk_tokens", 2)
+    kwargs.setdefault("min_overlap_chars", 10)
+    return ContextPacker(tokenizer=whitespace_tokenizer, **kwargs)
+
+
+def node(node_id: str, text: str, score: float) -> NodeWithScore:
+    return NodeWithScore(node=TextNode(text=text, id_=node_id), score=score)
+
+
+def test_near_duplicate_is_dropped():
+    nodes = [
+        node("a", "桂枝汤 主治 太阳 中风 头痛 发热 汗出 恶风 脉浮缓", 0.9),
+        node("b", "桂枝汤 主治 太阳 中风 头痛 发热 汗出 恶风 脉浮", 0.8), # 只少了一个字
+        node("c", "麻黄汤 主治 太阳 伤寒 无汗 而喘", 0.7),
+    ]
+
+    packed = make_packer().pack(nodes)
+
+    assert packed.node_ids == ["a", "c"]
+    assert packed.num_duplicates == 1
+
+
+def test_chunk_overlap_is_stripped():
+    overlap = "脉浮缓 舌苔薄白 宜 解肌 发表"
+    nodes = [
+        node("a", f"桂枝汤 主治 太阳 中风 {overlap}", 0.9),
+        node("b", f"{overlap} 调和 营卫 用 桂枝 芍药", 0.8), # 切块时与上一块重叠
+    ]
+
+    packed = make_packer().pack(nodes)
+
+    assert packed.texts == [f"桂枝汤 主治 太阳 中风 {overlap}", "调和 营卫 用 桂枝 芍药"]
+
+
+def test_output_stays_within_token_budget():
+    nodes = [node(str(i), " ".join(f"证{i}词{j}" for j in range(10)), 1.0 - i / 10) for i in range(5)]
+    packer = make_packer(token_budget=25)
+
+    packed = packer.pack(nodes)
+
+    assert packer.count_tokens(packer.separator.join(packed.texts)) <= 25
+    assert packed.output_tokens <= 25
+    assert packed.num_truncated == 1 # 第三块截断到剩余的 5 个词
+    assert packed.num_dropped == 2
+
+
+def test_separator_tokens_count_against_budget():
+    packer = ContextPacker(token_budget=12, min_chunk_tokens=1, tokenizer=list) # 每个字符一个 token
+    nodes = [node("a", "头痛发热", 0.9), node("b", "汗出恶风", 0.8), node("c", "脉浮缓", 0.7)]
+
+    packed = packer.pack(nodes)
+
+    # 4 + 2(分隔符) + 4 = 10，第三块只剩 12 - 10 - 2 = 0 个 token
+    assert packed.texts == ["头痛发热", "汗出恶风"]
+    assert len(packer.separator.join(packed.texts)) == packed.output_tokens == 10
+
+
+def test_result_is_ordered_by_score():
+    nodes = [
+        node("low", "麻黄汤 主治 太阳 伤寒", 0.2),
+        node("high", "小柴胡汤 主治 少阳 病", 0.9),
+        node("mid", "白虎汤 主治 阳明 经证", 0.5),
+    ]
+
+    packed = make_packer().pack(nodes)
+
+    assert packed.node_ids == ["high", "mid", "low"]
@@ -0,0 +1,39 @@
+# test_embed_batcher.py
+import numpy as np
+import pytest
+from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+from transformers import BertConfig, BertModel, BertTokenizerFast
+
+from embed_batcher import query_embedding_batch
+
+QUERY_INSTRUCTION = "为这个句子生成表示以用于检索相关文章："
+QUERIES = ["头痛怎么办", "发热咳嗽", "失眠为什么会头痛"]
+
+
+@pytest.fixture(scope="module")
+def model_dir(tmp_path_factory) -> str:
+    """随机初始化的单层小 BERT，不需要下载模型"""
+    model_dir = tmp_path_factory.mktemp("tiny_bert")
+    vocab = ["[PAD]", "[UNK]", "[CLS]", "[SEP]", "[MASK]"] + sorted(set("".join(QUERIES) + QUERY_INSTRUCTION))
+    (model_dir / "vocab.txt").write_text("\n".join(vocab), encoding="utf-8")
+    BertTokenizerFast(str(model_dir / "vocab.txt")).save_pretrained(model_dir)
+    config = BertConfig(
+        vocab_size=len(vocab), hidden_size=16, num_hidden_layers=1, num_attention_heads=2, intermediate_size=32
+    )
+    BertModel(config).save_pretrained(model_dir)
+    return str(model_dir)
+
+
+@pytest.mark.parametrize("text_instruction", [None, "文档："])
+def test_batch_matches_single_query_embeddings(model_dir, text_instruction):
+    embed_model = HuggingFaceEmbedding(
+        model_name=model_dir,
+        query_instruction=QUERY_INSTRUCTION,
+        text_instruction=text_instruction, # 文档有前缀时不能借用文本批量接口
+        device="cpu",
+    )
+
+    batch = query_embedding_batch(embed_model, QUERIES)
+    single = [embed_model.get_query_embedding(query) for query in QUERIES]
+
+    np.testing.assert_allclose(batch, single, atol=1e-5) # 查询前缀与逐条调用一致
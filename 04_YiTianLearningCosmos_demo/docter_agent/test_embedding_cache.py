@@ -0,0 +1,40 @@
+# test_embedding_cache.py
+import time
+
+import pytest
+from llama_index.core.embeddings import MockEmbedding
+
+from embedding_cache import CachedEmbedding
+
+
+def wait_for(path, timeout: float = 5.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not path.exists():
+        if time.monotonic() > deadline:
+            raise TimeoutError(f"{path} 没有写入")
+        time.sleep(0.01)
+
+
+def test_cache_is_persisted_in_background_and_reloaded(tmp_path):
+    path = tmp_path / "embedding_cache.npz"
+    cache = CachedEmbedding(MockEmbedding(embed_dim=8), persist_path=str(path), persist_every=2)
+
+    first = cache.get_query_embedding("头痛怎么办")
+    cache.get_query_embedding("失眠多梦")
+    wait_for(path) # 第二条未命中后由后台线程写盘
+
+    reloaded = CachedEmbedding(MockEmbedding(embed_dim=8), persist_path=str(path))
+    assert reloaded.get_query_embedding("头痛怎么办") == pytest.approx(first)
+    assert reloaded.stats()["hits"] == 1
+
+
+def test_model_change_discards_persisted_cache(tmp_path):
+    path = tmp_path / "embedding_cache.npz"
+    cache = CachedEmbedding(MockEmbedding(embed_dim=8), persist_path=str(path))
+    cache.get_query_embedding("头痛怎么办")
+    cache.save()
+
+    other = MockEmbedding(embed_dim=8)
+    other.model_name = "other-model"
+    reloaded = CachedEmbedding(other, persist_path=str(path))
+    assert reloaded.stats()["size"] == 0
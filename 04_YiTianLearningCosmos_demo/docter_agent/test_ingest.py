@@ -0,0 +1,65 @@
+# test_ingest.py
+import os
+
+import faiss
+import numpy as np
+import pytest
+from llama_index.core.schema import TextNode
+from llama_index.core.storage.docstore import SimpleDocumentStore
+
+from hybrid_retriever import BM25Index
+from index_tool import index_file
+from ingest import DELTA_NODES_FILE, IncrementalIngestor
+from lazy_docstore import DOCSTORE_JSON_FILE, add_nodes, export_docstore, load_lazy_docstore
+
+DIM = 8
+
+
+def make_nodes(*texts: str):
+    nodes = [TextNode(text=text, id_=text) for text in texts]
+    vectors = np.random.default_rng(len(texts)).random((len(texts), DIM), dtype=np.float32)
+    return nodes, vectors
+
+
+@pytest.fixture
+def ingestor(tmp_path) -> IncrementalIngestor:
+    faiss.write_index(faiss.IndexFlatIP(DIM), index_file(str(tmp_path), "flat")) # 只需要主索引的维度和度量
+    return IncrementalIngestor(str(tmp_path), embed_model=None)
+
+
+def test_interrupted_append_is_dropped(ingestor):
+    ingestor._append_delta(*make_nodes("桂枝汤", "麻黄汤"))
+    with open(os.path.join(ingestor.delta_dir, DELTA_NODES_FILE), "a", encoding="utf-8") as f:
+        f.write('{"__data__": {"text": "写了一半') # 节点写到一半时进程退出，向量没有写入
+
+    nodes, vectors = ingestor._read_delta()
+    assert [node.node_id for node in nodes] == ["桂枝汤", "麻黄汤"]
+
+    ingestor._append_delta(*make_nodes("小柴胡汤"))
+    nodes, vectors = ingestor._read_delta()
+    assert [node.node_id for node in nodes] == ["桂枝汤", "麻黄汤", "小柴胡汤"]
+    assert len(vectors) == 3
+
+
+def test_bm25_add_matches_full_build():
+    node_ids = ["桂枝汤", "麻黄汤", "小柴胡汤"]
+    texts = ["桂枝汤治疗太阳中风，汗出恶风", "麻黄汤治疗太阳伤寒，无汗而喘", "小柴胡汤治疗少阳病，往来寒热"]
+
+    incremental = BM25Index.build(node_ids[:2], texts[:2])
+    assert incremental.add(node_ids[1:], texts[1:]) == 1 # 已索引的节点跳过
+    full = BM25Index.build(node_ids, texts)
+
+    for query in ["太阳中风汗出", "往来寒热", "无汗"]:
+        assert incremental.search(query) == pytest.approx(full.search(query))
+
+
+def test_add_nodes_to_exported_docstore(tmp_path):
+    docstore = SimpleDocumentStore()
+    docstore.add_documents(make_nodes("桂枝汤")[0])
+    docstore.persist(persist_path=str(tmp_path / DOCSTORE_JSON_FILE))
+    export_docstore(str(tmp_path))
+
+    add_nodes(str(tmp_path), make_nodes("麻黄汤")[0])
+
+    lazy = load_lazy_docstore(str(tmp_path))
+    assert [node.get_content() for node in lazy.get_nodes(["桂枝汤", "麻黄汤"])] == ["桂枝汤", "麻黄汤"]
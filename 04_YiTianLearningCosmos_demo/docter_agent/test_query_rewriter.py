@@ -0,0 +1,44 @@
+# test_query_rewriter.py
+from query_rewriter import QueryRewriter
+
+
+class CountingRewrite:
+    """记录调用次数的改写函数，代替 LLM"""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, question: str) -> str:
+        self.calls += 1
+        return f"规范问诊：{question}"
+
+
+def test_clinical_question_skips_llm():
+    rewrite_fn = CountingRewrite()
+    rewriter = QueryRewriter(rewrite_fn)
+    question = "我最近头晕目眩，急躁易怒，口苦，舌红苔黄，脉弦数，是什么证型呢？"
+
+    assert rewriter.skip_reason(question) == "formal"
+    assert rewriter.rewrite(question) == question
+    assert rewrite_fn.calls == 0
+    assert rewriter.stats()["skipped_formal"] == 1
+
+
+def test_colloquial_question_is_rewritten_once():
+    rewrite_fn = CountingRewrite()
+    rewriter = QueryRewriter(rewrite_fn)
+    question = "这几天老是睡不着，吃不下饭，浑身没劲"
+
+    assert rewriter.skip_reason(question) is None
+    first = rewriter.rewrite(question)
+    second = rewriter.rewrite(question)
+    assert first == second == f"规范问诊：{question}"
+    assert rewrite_fn.calls == 1
+    assert rewriter.stats()["hits"] == 1
+
+
+def test_short_and_long_questions_are_skipped():
+    rewriter = QueryRewriter(CountingRewrite(), min_length=6, max_length=20)
+
+    assert rewriter.skip_reason("头疼") == "short"
+    assert rewriter.skip_reason("肚子疼" * 10) == "long"
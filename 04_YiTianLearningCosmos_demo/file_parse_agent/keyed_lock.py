@@ -0,0 +1,89 @@
+# keyed_lock.py
+import asyncio
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+from typing import Any, AsyncIterator, Dict
+
+
+@dataclass
+class _KeyEntry:
+    """一个 key 对应的锁"""
+    lock: asyncio.Lock = field(default_factory=asyncio.Lock)
+    users: int = 0 # 持有或正在等待这把锁的协程数，为 0 时删除
+
+
+class KeyedLock:
+    """
+    按 key（会话ID）加的异步锁
+
+    同一个 key 的协程按到达顺序依次执行（asyncio.Lock 是先进先出的），不同 key 之间互不阻塞。
+    没有协程持有或等待时锁会被删除，锁的数量不会随会话数无限增长。
+    同时统计等锁的次数和耗时，用来判断同一会话的并发消息是否频繁排队。
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, _KeyEntry] = {}
+        self._waiting = 0 # 正在等锁的协程数
+        self._counters = {
+            "acquired": 0, # 成功加锁的次数
+            "contended": 0, # 加锁时需要排队的次数
+            "wait_total": 0.0, # 累计等锁时间（秒）
+            "wait_max": 0.0, # 最长等锁时间（秒）
+        }
+
+    @asynccontextmanager
+    async def acquire(self, key: str) -> AsyncIterator[float]:
+        """
+        加锁，返回本次等锁的时间（秒）
+
+        用法:
+            async with locks.acquire(context_id) as waited:
+                ...
+        """
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _KeyEntry()
+        entry.users += 1
+        try:
+            contended = entry.lock.locked()
+            start = time.perf_counter()
+            self._waiting += 1
+            try:
+                await entry.lock.acquire() # 等锁时被取消会直接抛出 CancelledError
+            finally:
+                self._waiting -= 1
+            waited = time.perf_counter() - start
+            self._record(waited, contended)
+            try:
+                yield waited
+            finally:
+                entry.lock.release()
+        finally:
+            entry.users -= 1
+            if entry.users == 0:
+                del self._entries[key]
+
+    def _record(self, waited: float, contended: bool) -> None:
+        self._counters["acquired"] += 1
+        self._counters["contended"] += int(contended)
+        self._counters["wait_total"] += waited
+        self._counters["wait_max"] = max(self._counters["wait_max"], waited)
+
+    def locked(self, key: str) -> bool:
+        """这个 key 当前是否有协程在执行"""
+        entry = self._entries.get(key)
+        return entry is not None and entry.lock.locked()
+
+    def stats(self) -> Dict[str, Any]:
+        """加锁次数、排队次数和等锁耗时(毫秒)"""
+        acquired = self._counters["acquired"]
+        return {
+            "keys": len(self._entries),
+            "waiting": self._waiting,
+            "acquired": acquired,
+            "contended": self._counters["contended"],
+            "wait_total_ms": round(self._counters["wait_total"] * 1000, 2),
+            "wait_avg_ms": round(self._counters["wait_total"] * 1000 / acquired, 2) if acquired else 0.0,
+            "wait_max_ms": round(self._counters["wait_max"] * 1000, 2),
+        }
@@ -0,0 +1,53 @@
+# test_shared_modules.py
+"""
+各智能体目录作为脚本独立运行，公共模块在每个目录里各放一份。
+这里检查同名副本逐字节一致，修改其中一份时需要同步到其他目录。
+"""
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent
+
+SHARED_MODULES = {
+    "session_store.py": [
+        "04_YiTianLearningCosmos_demo/docter_agent",
+        "04_YiTianLearningCosmos_demo/file_parse_agent",
+    ],
+    "keyed_lock.py": [
+        "04_YiTianLearningCosmos_demo/docter_agent",
+        "04_YiTianLearningCosmos_demo/file_parse_agent",
+    ],
+    "checkpointer.py": [
+        "02_CleverCatAgents",
+        "03_multiagents_demo/clever_cat_agent",
+        "03_multiagents_demo/file_agent",
+        "04_YiTianLearningCosmos_demo/code_agent",
+    ],
+    "admission.py": [
+        "02_CleverCatAgents",
+        "03_multiagents_demo/clever_cat_agent",
+        "03_multiagents_demo/file_agent",
+        "03_multiagents_demo/search_agent",
+        "04_YiTianLearningCosmos_demo/code_agent",
+        "04_YiTianLearningCosmos_demo/docter_agent",
+        "04_YiTianLearningCosmos_demo/file_parse_agent",
+    ],
+}
+
+
+@pytest.mark.parametrize("name", sorted(SHARED_MODULES))
+def test_copies_are_identical(name):
+    directories = SHARED_MODULES[name]
+    reference = (ROOT / directories[0] / name).read_bytes()
+    stale = [d for d in directories[1:] if (ROOT / d / name).read_bytes() != reference]
+
+    assert not stale, f"{name} 与 {directories[0]} 中的副本不一致: {stale}"
+
+
+@pytest.mark.parametrize("name", sorted(SHARED_MODULES))
+def test_no_unlisted_copies(name):
+    listed = {ROOT / d / name for d in SHARED_MODULES[name]}
+    found = {path for path in ROOT.glob(f"*/**/{name}") if ".venv" not in path.parts}
+
+    assert found <= listed, f"{name} 有未登记的副本: {sorted(found - listed)}"